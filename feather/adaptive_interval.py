@@ -0,0 +1,53 @@
+class AdaptiveInterval:
+    """
+    Picks the time between measurement cycles from how fast the CO2 is
+    changing.  Keeps exponentially-weighted estimates of the CO2 rate (ppm/min)
+    and of the spread of the cycle-to-cycle changes (ppm), so it needs the same
+    memory however long it runs.
+
+    The interval halves (down to ``min_sec``) whenever the rate is above
+    ``fast_rate`` or the spread above ``noisy_ppm``, and grows by ``growth``
+    (up to ``max_sec``) while both are below ``slow_rate`` and ``quiet_ppm``.
+    """
+    def __init__(self, min_sec=20, max_sec=300, start_sec=60, fast_rate=5.,
+                 slow_rate=1., noisy_ppm=30., quiet_ppm=10., growth=1.5,
+                 alpha=.3):
+        self.min_sec = min_sec
+        self.max_sec = max_sec
+        self.interval = min(max(start_sec, min_sec), max_sec)
+        self.fast_rate = fast_rate
+        self.slow_rate = slow_rate
+        self.noisy_ppm = noisy_ppm
+        self.quiet_ppm = quiet_ppm
+        self.growth = growth
+        self.alpha = alpha
+
+        self.last_t = None
+        self.last_co2 = None
+        self.rate = 0.
+        self.mean_diff = 0.
+        self.var_diff = 0.
+
+    def update(self, t, co2):
+        """
+        ``t`` is time.monotonic() at the measurement.  Returns the interval to
+        use until the next one.
+        """
+        if self.last_t is not None and t > self.last_t:
+            a = self.alpha
+            diff = co2 - self.last_co2
+            self.rate += a * (diff * 60 / (t - self.last_t) - self.rate)
+            # exponentially-weighted mean and variance of the changes
+            delta = diff - self.mean_diff
+            self.mean_diff += a * delta
+            self.var_diff = (1 - a) * (self.var_diff + a * delta * delta)
+
+            rate = abs(self.rate)
+            spread = self.var_diff ** .5
+            if rate > self.fast_rate or spread > self.noisy_ppm:
+                self.interval = max(self.interval / 2, self.min_sec)
+            elif rate < self.slow_rate and spread < self.quiet_ppm:
+                self.interval = min(self.interval * self.growth, self.max_sec)
+        self.last_t = t
+        self.last_co2 = co2
+        return self.interval
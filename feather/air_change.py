@@ -0,0 +1,174 @@
+"""
+Air changes per hour (ACH) from CO2 decays.
+
+After the people leave a room the CO2 decays towards the outdoor level as
+``C(t) = C_out + (C_0 - C_out) exp(-ACH t)``, so ``log(C - C_out)`` is a line
+with slope ``-ACH`` (t in hours).  The decay windows come from
+`co2_events.detect_series_events`, and the lines for all of them are fitted
+at once with per-window sums (``np.bincount``), so there is no Python loop over
+windows.
+"""
+
+import numpy as np
+
+import co2_events
+
+__all__ = ['OUTDOOR_CO2_PPM', 'decay_windows', 'fit_decays', 'air_change_rates']
+
+OUTDOOR_CO2_PPM = 420.
+
+
+def _to_seconds(timestamps):
+    if timestamps.dtype.kind == 'M':
+        return timestamps.astype('datetime64[ms]').astype(np.int64) / 1000.
+    return timestamps.astype(float)
+
+
+def decay_windows(timestamps, values, **event_params):
+    """
+    Returns ``(starts, ends)`` index arrays (inclusive) of the decay events in a
+    time-sorted series.  Each window starts at the highest value in the
+    event's first ``slope_lag`` samples, so the end of the rise is not fitted.
+    """
+    params = dict(co2_events.DEFAULT_PARAMS, **event_params)
+    events = [e for e in co2_events.detect_series_events(timestamps, values, **params)
+              if e.kind == 'decay']
+    if not events:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+    starts = np.searchsorted(timestamps, np.array([e.start for e in events]), side='left')
+    ends = np.searchsorted(timestamps, np.array([e.end for e in events]), side='right') - 1
+
+    # move each start to the peak within the backdated part of the window
+    lag = params['slope_lag']
+    offsets = np.arange(lag + 1)
+    head = np.minimum(starts[:, None] + offsets, ends[:, None])
+    starts = head[np.arange(len(starts)), np.argmax(values[head], axis=1)]
+    return starts, ends
+
+
+def fit_decays(timestamps, values, starts, ends, baseline=OUTDOOR_CO2_PPM,
+               min_excess=50.):
+    """
+    Fits ``log(values - baseline)`` against time (hours) in each window from
+    ``starts`` to ``ends`` (inclusive indices), skipping points less than
+    ``min_excess`` above the baseline.  Returns a dictionary of arrays with one
+    entry per window: 'ach' (1/hr), 'ach_stderr', 'r2', 'npoints' and 'c0'
+    (the fitted initial concentration).  Windows with fewer than 3 usable
+    points are NaN.
+    """
+    secs = _to_seconds(np.asarray(timestamps))
+    values = np.asarray(values, dtype=float)
+    nwin = len(starts)
+
+    # flat indices of all the points in all the windows, and their window
+    lengths = ends - starts + 1
+    win = np.repeat(np.arange(nwin), lengths)
+    within = np.arange(len(win)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    idx = starts[win] + within
+
+    excess = values[idx] - baseline
+    use = excess >= min_excess
+    win = win[use]
+    t = (secs[idx[use]] - secs[starts[win]]) / 3600.
+    y = np.log(excess[use])
+
+    def wsum(x):
+        return np.bincount(win, weights=x, minlength=nwin)
+
+    n = np.bincount(win, minlength=nwin).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tmean = wsum(t) / n
+        ymean = wsum(y) / n
+        dt = t - tmean[win]
+        dy = y - ymean[win]
+        sxx = wsum(dt*dt)
+        sxy = wsum(dt*dy)
+        syy = wsum(dy*dy)
+
+        slope = sxy / sxx
+        intercept = ymean - slope*tmean
+        resid = dy - slope[win]*dt
+        s2 = wsum(resid*resid) / (n - 2)
+
+        bad = (n < 3) | (sxx <= 0)
+        result = {'ach': -slope,
+                  'ach_stderr': np.sqrt(s2 / sxx),
+                  'r2': 1 - wsum(resid*resid)/syy,
+                  'npoints': n.astype(int),
+                  'c0': baseline + np.exp(intercept)}
+    for key in ('ach', 'ach_stderr', 'r2', 'c0'):
+        result[key][bad] = np.nan
+    return result
+
+
+def air_change_rates(cols, mtype='cozirA_filtered', baseline=OUTDOOR_CO2_PPM,
+                     min_excess=50., **event_params):
+    """
+    Finds and fits every CO2 decay of ``mtype`` in ``cols`` (as output by
+    `cozir_parser.read_log_columns`, or `columnar_store.read_columns` for many
+    devices).  ``baseline`` can be None to use each device's 1st percentile.
+    Returns the `fit_decays` dictionary plus 'start' and 'end' timestamps and,
+    if ``cols`` has devices, 'device'.
+    """
+    code = cols['type_names'].index(mtype) if mtype in cols['type_names'] else -1
+    msk = cols['type_code'] == code
+    timestamps = cols['timestamp'][msk]
+    values = cols['value'][msk]
+    if 'device' in cols:
+        devices = cols['device'][msk]
+        device_names = np.unique(devices)
+    else:
+        devices = None
+        device_names = [None]
+    if len(device_names) == 0:
+        # no samples of mtype for any device: fit the empty series all the same,
+        # so the result has all its (empty) arrays
+        device_names = [None]
+
+    parts = []
+    for device in device_names:
+        if device is None:
+            ts, vals = timestamps, values
+        else:
+            dmsk = devices == device
+            ts, vals = timestamps[dmsk], values[dmsk]
+        order = np.argsort(ts, kind='stable')
+        ts, vals = ts[order], vals[order]
+
+        starts, ends = decay_windows(ts, vals, **event_params)
+        base = np.percentile(vals, 1) if baseline is None and len(vals) else baseline
+        res = fit_decays(ts, vals, starts, ends, base, min_excess)
+        res['start'] = ts[starts]
+        res['end'] = ts[ends]
+        if devices is not None:
+            res['device'] = np.full(len(starts), device, dtype=devices.dtype)
+        parts.append(res)
+
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import cozir_parser
+
+    parser = argparse.ArgumentParser(description='Print the air changes per hour fitted to each CO2 decay in a feather log.')
+    parser.add_argument('input_file', help='log file to parse')
+    parser.add_argument('--type', default='cozirA_filtered', help='measurement type to use')
+    parser.add_argument('--baseline', type=float, default=OUTDOOR_CO2_PPM, help='outdoor CO2 in ppm (negative to estimate it from the data)')
+    parser.add_argument('--min-r2', type=float, default=0., help='only show fits with at least this r^2')
+    parser.add_argument('--start-time', default=None)
+    parser.add_argument('--end-time', default=None)
+
+    args = parser.parse_args()
+
+    cols = cozir_parser.read_log_segments(args.input_file, args.start_time, args.end_time)
+    res = air_change_rates(cols, args.type, None if args.baseline < 0 else args.baseline)
+    for i in np.flatnonzero(res['r2'] >= args.min_r2):
+        print('{} -> {}: ACH {:.2f} +/- {:.2f} /hr (r^2 {:.3f}, {} points, from {:.0f} ppm)'.format(
+              res['start'][i], res['end'][i], res['ach'][i], res['ach_stderr'][i],
+              res['r2'][i], res['npoints'][i], res['c0'][i]))
+    good = res['r2'] >= args.min_r2
+    if np.any(good):
+        print('median ACH: {:.2f} /hr over {} decays'.format(np.median(res['ach'][good]), good.sum()))
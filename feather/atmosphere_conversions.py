@@ -1,47 +1,89 @@
 """
 Functions for doing humidity/dewpoint/etc conversions.
+
+``engine`` selects numpy or the numba kernels (see compute_engine.py); the
+default is `compute_engine.get_engine`.
 """
 
 import numpy as np
 
+# https://www.vaisala.com/sites/default/files/documents/Humidity_Conversion_Formulas_B210973EN-F.pdf
+# these constants are good to ~.1% from -20 to +50 C
+DEWPOINT_A = 6.116441
+DEWPOINT_M = 7.591386
+DEWPOINT_TN = 240.7263  # appropriate for outputs in C
+
+ABS_HUMIDITY_C = 2.16679  # gK/J
+
+SVP_TC = 647.096  # K
+SVP_PC = 220640  # hPa
+SVP_COEFFS = [-7.85951783, 1.84408259, -11.7866497, 22.6807411, -15.9618719, 1.80122502]
+SVP_POWERS = [1, 1.5, 3, 3.5, 4, 7.5]
+
 
-def hum_rel_to_dewpoint(rh, ts):
+def hum_rel_to_dewpoint(rh, ts, engine=None):
     """
     temps in celsius, humidity in float (i.e., *not* percent).
     """
-    # https://www.vaisala.com/sites/default/files/documents/Humidity_Conversion_Formulas_B210973EN-F.pdf
-    # these constants are good to ~.1% from -20 to +50 C
-    A = 6.116441
-    m = 7.591386
-    Tn = 240.7263  # appropriate for outputs in C
+    kernels = _jit_kernels(engine)
+    if kernels is not None:
+        return _run_kernel(kernels.dewpoint, rh, ts)
 
-    Pw = saturation_vapor_pressure(ts + 273.15) * rh
+    A = DEWPOINT_A
+    m = DEWPOINT_M
+    Tn = DEWPOINT_TN
+
+    Pw = saturation_vapor_pressure(ts + 273.15, 'numpy') * rh
 
     return Tn/(m/np.log10(Pw/A) - 1)
 
 
-def hum_rel_to_abs(rh, ts):
+def hum_rel_to_abs(rh, ts, engine=None):
     """
     temp in celsius, humidity in float (i.e., *not* percent). Returns
     absolute humidity in g/m^3
     """
-    # https://www.vaisala.com/sites/default/files/documents/Humidity_Conversion_Formulas_B210973EN-F.pdf
-    C = 2.16679  # gK/J
+    kernels = _jit_kernels(engine)
+    if kernels is not None:
+        return _run_kernel(kernels.abs_humidity, rh, ts)
+
+    C = ABS_HUMIDITY_C
     ts_K = ts + 273.15  # temp formulae are in Kelvin
-    return C * saturation_vapor_pressure(ts_K) * rh / ts_K
+    return C * saturation_vapor_pressure(ts_K, 'numpy') * rh / ts_K
 
 
-def saturation_vapor_pressure(ts_K):
-    Tc = 647.096  # K
-    Pc = 220640  # hPa
+def saturation_vapor_pressure(ts_K, engine=None):
+    kernels = _jit_kernels(engine)
+    if kernels is not None:
+        return _run_kernel(kernels.saturation_vapor_pressure, ts_K)
 
-    Coeffs = [-7.85951783, 1.84408259, -11.7866497, 22.6807411, -15.9618719, 1.80122502]
-    powers = [1, 1.5, 3, 3.5, 4, 7.5]
+    Tc = SVP_TC
+    Pc = SVP_PC
 
     v = 1 - ts_K/Tc
-    lnrp = Tc / ts_K * np.sum([C*v**p for C,p in zip(Coeffs, powers)], axis=0)
+    lnrp = Tc / ts_K * np.sum([C*v**p for C,p in zip(SVP_COEFFS, SVP_POWERS)], axis=0)
     return Pc * np.exp(lnrp)
 
 
 def c_to_f(degc):
     return degc * 1.8 + 32
+
+
+def _jit_kernels(engine):
+    import compute_engine
+
+    if compute_engine.resolve_engine(engine) == 'numba':
+        return compute_engine.jit_kernels()
+    return None
+
+
+def _run_kernel(kernel, *args):
+    """
+    Runs an elementwise ``kernel(*args, out)`` on broadcast ``args``, with the
+    result the dtype numpy would give.
+    """
+    dtype = np.result_type(*args, 1.)
+    args = np.broadcast_arrays(*args)
+    out = np.empty(args[0].shape, dtype)
+    kernel(*[np.ascontiguousarray(a).reshape(-1) for a in args], out.reshape(-1))
+    return out if out.ndim else out[()]
@@ -0,0 +1,187 @@
+"""
+Daily plots of many logs at once, as ``python cozir_parser.py report LOG
+[LOG ...] -o DIR``, rather than running cozir_parser.py for each device and
+day.  Each log is parsed (and its BME280 calibrated) once and cut into days,
+and the plots are drawn by a pool of worker processes, each using the Agg
+backend and drawing all of its plots into the one figure.  Plots go to
+``DIR/<device>/<YYYY-MM-DD>.png``, where the device is the log's name, or the
+name of its directory if several logs have the same name (e.g. co2.log).
+With a cache directory (see render_cache.py), only days whose data or plot
+options have changed since the last report are drawn again.
+"""
+import os
+import sys
+import time
+import shutil
+
+import numpy as np
+
+import cozir_parser
+import spike_filter
+
+__all__ = ['day_slices', 'device_names', 'render_reports']
+
+# the figure each worker process draws into
+_worker_fig = None
+
+
+def day_slices(cols):
+    """
+    Yields ``(date string, cols for that day)`` for each day in ``cols`` (as
+    output by `cozir_parser.read_log_columns`, with RTC timestamps).
+    """
+    if cols['timestamp'].dtype.kind != 'M':
+        raise ValueError('daily reports need a log with RTC timestamps')
+    days = cols['timestamp'].astype('datetime64[D]')
+    if np.any(days[1:] < days[:-1]):
+        order = np.argsort(days, kind='stable')
+        cols = cozir_parser.select_rows(cols, order)
+        days = days[order]
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]]) if len(days) else []
+    ends = list(starts[1:]) + [len(days)]
+    for st, end in zip(starts, ends):
+        yield str(days[st]), cozir_parser.select_rows(cols, slice(st, end))
+
+
+def device_names(paths):
+    """
+    A name for each of the logs ``paths``: the file name without its
+    extensions, or the directory name where those are not unique.
+    """
+    stems = [os.path.basename(p).split('.')[0] for p in paths]
+    if len(set(stems)) == len(stems):
+        return stems
+    return [os.path.basename(os.path.dirname(os.path.abspath(p))) for p in paths]
+
+
+def _init_worker():
+    import matplotlib
+
+    matplotlib.use('Agg')
+
+
+def _render(outfilename, cols, plot_kwargs, cache=None):
+    """
+    Returns ``(outfilename, whether it came from the cache)``.
+    """
+    global _worker_fig
+
+    from matplotlib import pyplot as plt
+
+    if cache is not None:
+        key, cached = cache.lookup(cols, **plot_kwargs)
+        if cached is not None:
+            shutil.copyfile(cached, outfilename)
+            return outfilename, True
+    try:
+        _worker_fig = cozir_parser.plot_cozir_data(cols, outfilename, fig=_worker_fig,
+                                                   **plot_kwargs)
+    except Exception:
+        # start afresh rather than reuse a half-drawn figure
+        if _worker_fig is not None:
+            plt.close(_worker_fig)
+        _worker_fig = None
+        raise
+    if cache is not None:
+        cache.store(key, outfilename)
+    return outfilename, False
+
+
+def render_reports(paths, outdir, start_time=None, end_time=None,
+                   processes=None, cache_dir=None, cache_bytes=256 * 2**20,
+                   filters=None, file=sys.stdout, **plot_kwargs):
+    """
+    Writes the daily plots of the logs ``paths`` (see the module docstring),
+    with ``processes`` worker processes (default: one per CPU, 1 to draw
+    them in this process), reusing images from a `render_cache.RenderCache`
+    in ``cache_dir`` if given.  The logs are spike filtered with ``filters``
+    (see `spike_filter.filter_columns`) if given.  ``plot_kwargs`` are passed to
+    `cozir_parser.plot_cozir_data`.  Returns the list of files written.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    st = time.perf_counter()
+    parse_secs = 0.
+    results = []
+    cache = None
+    if cache_dir is not None:
+        import render_cache
+
+        cache = render_cache.RenderCache(cache_dir, cache_bytes)
+    pool = None
+    if processes != 1:
+        pool = ProcessPoolExecutor(processes, initializer=_init_worker)
+    else:
+        _init_worker()
+
+    try:
+        futures = []
+        for path, device in zip(paths, device_names(paths)):
+            pst = time.perf_counter()
+            cols = cozir_parser.read_log_segments(path, start_time, end_time,
+                                                  processes=processes, filters=filters)
+            cols = cozir_parser.calibrate_bme280_columns(cols)
+            parse_secs += time.perf_counter() - pst
+
+            os.makedirs(os.path.join(outdir, device), exist_ok=True)
+            # submitted as each log is parsed, so the workers draw while the
+            # next one is parsed
+            for day, day_cols in day_slices(cols):
+                outfilename = os.path.join(outdir, device, day + '.png')
+                if pool is None:
+                    results.append(_render(outfilename, day_cols, plot_kwargs, cache))
+                else:
+                    futures.append(pool.submit(_render, outfilename, day_cols, plot_kwargs, cache))
+        results.extend(f.result() for f in futures)
+        if cache is not None:  # for a smaller cache_bytes, even if nothing was drawn
+            cache.evict()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    secs = time.perf_counter() - st
+    if file is not None:
+        ncached = sum(hit for _, hit in results)
+        print(f'{len(results)} plots of {len(paths)} logs in {secs:.1f} s '
+              f'({len(results)/secs:.1f} plots/s, {parse_secs:.1f} s parsing'
+              + (f', {ncached} from the cache)' if cache is not None else ')'),
+              file=file)
+    return [fn for fn, _ in results]
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='cozir_parser.py report',
+                                     description='Plot each day of each log '
+                                     'to OUTDIR/<device>/<date>.png.')
+    parser.add_argument('input_files', nargs='+', help='logs to plot')
+    parser.add_argument('--outdir', '-o', default='.', help='directory to write the plots in')
+    parser.add_argument('--processes', '-j', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--cache', default=None, metavar='DIR',
+                        help='keep the plots in this cache directory, and only draw changed ones')
+    parser.add_argument('--cache-size', type=float, default=256,
+                        help='MiB to keep in the cache (default %(default)s)')
+    parser.add_argument('--start-time', default=None, help='A timestamp for the earliest data point to use.')
+    parser.add_argument('--end-time', default=None, help='A timestamp for the latest data point to use.')
+    parser.add_argument('--include', default=None, help='A comma-separated list of measurement types to include')
+    parser.add_argument('--exclude', default=None, help='A comma-separated list of measurement types to exclude')
+    parser.add_argument('-d', '--dewpoint', action='store_true', help='Show the dewpoint instead of relative humidity')
+    parser.add_argument('-a', '--absolute-humidity', action='store_true', help='Show the absolute instead of relative humidity')
+    parser.add_argument('-f', '--farenheit', action='store_true', help='Set temperature unit to farenheit')
+    parser.add_argument('--filter', default=None, type=spike_filter.parse_filters, help='Spike filters to apply, e.g. "cozirA_raw=hampel:600" or "default" (see spike_filter.py)')
+
+    args = parser.parse_args(argv)
+    if args.include is not None and args.exclude is not None:
+        parser.error('Cannot both include and exclude!')
+    if args.dewpoint and args.absolute_humidity:
+        parser.error('Cannot do both dewpoint and absolute humidity')
+
+    render_reports(args.input_files, args.outdir, args.start_time, args.end_time,
+                   processes=args.processes, cache_dir=args.cache,
+                   cache_bytes=int(args.cache_size * 2**20), filters=args.filter,
+                   temp_unit='f' if args.farenheit else 'c',
+                   humidity_unit='dewpoint' if args.dewpoint else 'abs' if args.absolute_humidity else 'rel',
+                   include_types=None if args.include is None else args.include.split(','),
+                   exclude_types=None if args.exclude is None else args.exclude.split(','))
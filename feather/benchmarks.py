@@ -0,0 +1,355 @@
+"""
+Benchmarks of the analysis code on large synthetic data, run on the host:
+
+    python benchmarks.py [name ...] [--size N]
+
+Each benchmark prints a table of timings (best of ``--repeat`` runs), peak
+memory from tracemalloc, and any accuracy checks, and the script exits
+non-zero if a check fails, so it can be run in CI.
+"""
+import io
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import value_dtype
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__.replace('bench_', '')] = func
+    return func
+
+
+def measure(func, *args, repeat=3, **kwargs):
+    """
+    Returns ``(result, best seconds, peak bytes allocated during one call)``.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        st = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - st)
+        del result
+
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, best, peak
+
+
+class Report:
+    def __init__(self, title):
+        self.title = title
+        self.rows = []
+        self.failed = []
+
+    def add(self, name, secs=None, peak=None, **extra):
+        self.rows.append((name, secs, peak, extra))
+
+    def check(self, name, error, tolerance):
+        ok = error <= tolerance
+        if not ok:
+            self.failed.append(name)
+        self.rows.append((name, None, None, {'max_error': f'{error:.3g}',
+                                             'tolerance': f'{tolerance:.3g}',
+                                             'ok': ok}))
+
+    def print(self, file=None):
+        print(f'== {self.title}', file=file)
+        for name, secs, peak, extra in self.rows:
+            cells = [f'{name:<36}']
+            cells.append(f'{secs*1000:>10.1f} ms' if secs is not None else ' '*13)
+            cells.append(f'{peak/2**20:>10.1f} MiB' if peak is not None else ' '*14)
+            cells.extend(f'{k}={v}' for k, v in extra.items())
+            print('  '.join(cells).rstrip(), file=file)
+
+
+def synthetic_log(nrows, seed=0):
+    """
+    A feather-style log of ``nrows`` rows, a cycle a minute of CozIR, raw
+    BME280 and SGP30 rows, with the BME280 calibration at the start.
+    """
+    rng = np.random.default_rng(seed)
+    lines = []
+    calibs = {'t': (27504, 26435, -1000),
+              'p': (36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000),
+              'h': (75, 362, 0, 313, 50, 30)}
+    for nm, vals in calibs.items():
+        lines.extend(f'2024-01-01T0:0:0.0 bme280_calib_{nm}_{i} {v}'
+                     for i, v in enumerate(vals))
+
+    ncycles = max(nrows // 9, 1)
+    days = np.datetime64('2024-01-01') + np.arange(ncycles // 1440 + 1)
+    co2 = 450 + np.abs(np.cumsum(rng.normal(0, 5, ncycles)))
+    rh = rng.uniform(20, 80, ncycles)
+    temp = rng.uniform(15, 30, ncycles)
+    traw = rng.integers(480000, 560000, ncycles)
+    praw = rng.integers(300000, 500000, ncycles)
+    hraw = rng.integers(20000, 40000, ncycles)
+    for i in range(ncycles):
+        day, mins = divmod(i, 1440)
+        ts = f'{days[day]}T{mins // 60}:{mins % 60}:0.0'
+        c = int(co2[i])
+        lines.append(f'{ts} cozirA_humidity {rh[i]:.1f}')
+        lines.append(f'{ts} cozirA_temperature {temp[i]:.1f}')
+        lines.append(f'{ts} cozirA_filtered {c}')
+        lines.append(f'{ts} cozirA_raw {c + 2}')
+        lines.append(f'{ts} bme280_temp_raw {traw[i]}')
+        lines.append(f'{ts} bme280_pressure_raw {praw[i]}')
+        lines.append(f'{ts} bme280_humidity_raw {hraw[i]}')
+        lines.append(f'{ts} sgp30_eco2 {c}')
+        lines.append(f'{ts} sgp30_tvoc 0')
+    return '\n'.join(lines) + '\n'
+
+
+@benchmark
+def bench_dtype(size=10**6, repeat=3):
+    """
+    float32 against float64 values: parsing, BME280 calibration, humidity
+    conversions and as-of joins, with float32 checked against float64 within
+    `value_dtype.TOLERANCES`.
+    """
+    import cozir_parser
+    import series_join
+    import atmosphere_conversions as ac
+
+    report = Report(f'value dtype, {size:,} values')
+    tol = value_dtype.TOLERANCES
+
+    nparse = min(size, 2*10**5)  # text parsing is slow, and not what differs
+    text = synthetic_log(nparse)
+    results = {}
+    for dt in ('float64', 'float32'):
+        with value_dtype.using_value_dtype(dt):
+            cols, secs, peak = measure(lambda: cozir_parser.read_log_columns(io.StringIO(text)),
+                                       repeat=1)
+            report.add(f'parse {nparse:,} rows ({dt})', secs, peak,
+                       value_bytes=cols['value'].nbytes)
+            cal, secs, peak = measure(cozir_parser.calibrate_bme280_columns, cols, repeat=repeat)
+            report.add(f'calibrate bme280 ({dt})', secs, peak)
+            results[dt] = cozir_parser.split_columns(cal)
+
+    for nm, quantity in [('cozirA_filtered', 'co2'), ('bme280_temp', 'temperature'),
+                         ('bme280_pressure', 'pressure'), ('bme280_humidity', 'humidity')]:
+        a = results['float64'][nm][1]
+        b = results['float32'][nm][1]
+        report.check(f'{nm} float32 error', float(np.abs(b - a).max()), tol[quantity])
+
+    rng = np.random.default_rng(1)
+    rh = rng.uniform(5, 95, size)
+    temp = rng.uniform(-10, 40, size)
+    out = {}
+    for dt in (np.float64, np.float32):
+        nm = np.dtype(dt).name
+        rh_d, temp_d = (rh/100).astype(dt), temp.astype(dt)
+        out[nm, 'dewpoint'], secs, peak = measure(ac.hum_rel_to_dewpoint, rh_d, temp_d, repeat=repeat)
+        report.add(f'dewpoint ({nm})', secs, peak)
+        out[nm, 'absolute_humidity'], secs, peak = measure(ac.hum_rel_to_abs, rh_d, temp_d, repeat=repeat)
+        report.add(f'absolute humidity ({nm})', secs, peak)
+    for quantity in ('dewpoint', 'absolute_humidity'):
+        a, b = out['float64', quantity], out['float32', quantity]
+        assert b.dtype == np.float32
+        report.check(f'{quantity} float32 error', float(np.abs(b - a).max()), tol[quantity])
+
+    target = np.sort(rng.uniform(0, size*60., size))
+    source = np.arange(size) * 60.
+    for dt in (np.float64, np.float32):
+        vals = temp.astype(dt)
+        joined, secs, peak = measure(series_join.asof_join, target, source, vals,
+                                     tolerance=90., repeat=repeat)
+        report.add(f'asof_join ({np.dtype(dt).name})', secs, peak,
+                   result_bytes=joined.nbytes)
+    return report
+
+
+def _max_difference(a, b, relative=False):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    if a.shape != b.shape or not np.array_equal(np.isnan(a), np.isnan(b)):
+        return float('inf')
+    ok = ~np.isnan(a)
+    diff = np.abs(a[ok] - b[ok])
+    if relative:  # to 1 for values near 0
+        diff /= np.maximum(np.abs(a[ok]), 1)
+    return float(diff.max()) if diff.size else 0.
+
+
+@benchmark
+def bench_engines(size=10**7, repeat=3):
+    """
+    The numpy against the numba engine (see compute_engine.py) on the BME280
+    calibration and humidity conversions of ``size`` values, and on tokenizing
+    a log.  The tokenizing and calibration must match exactly, the humidity
+    conversions to 1e-12 relative.
+    """
+    import compute_engine
+    import cozir_parser
+    import atmosphere_conversions as ac
+
+    report = Report(f'compute engines, {size:,} values')
+    engines = ['numpy']
+    if compute_engine.numba_available():
+        engines.append('numba')
+    else:
+        report.add('numba not installed, only timing numpy')
+
+    nparse = min(size, 2*10**6)  # generating the log in Python is slow
+    text = synthetic_log(nparse)
+    rng = np.random.default_rng(2)
+    calib = cozir_parser.BME280_calibrator((27504, 26435, -1000),
+                                           (36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000),
+                                           (75, 362, 0, 313, 50, 30), dtype=np.float64)
+    traw = rng.integers(480000, 560000, size)
+    praw = rng.integers(300000, 500000, size)
+    hraw = rng.integers(20000, 40000, size)
+    rh = rng.uniform(.05, .95, size)
+    temp = rng.uniform(-10, 40, size)
+
+    def calibrate_all():
+        return (calib.calibrate_temp(traw), calib.calibrate_pressure(praw),
+                calib.calibrate_humidity(hraw))
+
+    results = {}
+    for engine in engines:
+        calib.engine = engine
+        if engine == 'numba':
+            # the first calls compile the kernels (or load them from the cache)
+            st = time.perf_counter()
+            cozir_parser.read_log_columns(io.StringIO(text[:10000]), engine=engine)
+            calibrate_all()
+            ac.hum_rel_to_dewpoint(rh[:10], temp[:10], engine=engine)
+            ac.hum_rel_to_abs(rh[:10], temp[:10], engine=engine)
+            ac.saturation_vapor_pressure(temp[:10] + 273.15, engine=engine)
+            report.add('numba first calls', time.perf_counter() - st)
+
+        res = results[engine] = {}
+        res['parse'], secs, peak = measure(lambda: cozir_parser.read_log_columns(io.StringIO(text), engine=engine),
+                                           repeat=1)
+        report.add(f'tokenize {nparse:,} rows ({engine})', secs, peak)
+        res['calibrate'], secs, peak = measure(calibrate_all, repeat=repeat)
+        report.add(f'calibrate bme280 x3 ({engine})', secs, peak)
+        res['svp'], secs, peak = measure(ac.saturation_vapor_pressure, temp + 273.15,
+                                         engine=engine, repeat=repeat)
+        report.add(f'saturation vapor pressure ({engine})', secs, peak)
+        res['dewpoint'], secs, peak = measure(ac.hum_rel_to_dewpoint, rh, temp,
+                                              engine=engine, repeat=repeat)
+        report.add(f'dewpoint ({engine})', secs, peak)
+        res['abs'], secs, peak = measure(ac.hum_rel_to_abs, rh, temp,
+                                         engine=engine, repeat=repeat)
+        report.add(f'absolute humidity ({engine})', secs, peak)
+
+    if len(engines) > 1:
+        a, b = results['numpy'], results['numba']
+        same = (a['parse']['type_names'] == b['parse']['type_names'] and
+                all(np.array_equal(a['parse'][k], b['parse'][k])
+                    for k in ('timestamp', 'type_code', 'value')))
+        report.check('tokenize numba difference', 0. if same else float('inf'), 0.)
+        for nm, x, y in zip(('temp', 'pressure', 'humidity'), a['calibrate'], b['calibrate']):
+            report.check(f'bme280 {nm} numba difference', _max_difference(x, y), 0.)
+        for nm in ('svp', 'dewpoint', 'abs'):
+            report.check(f'{nm} numba relative difference',
+                         _max_difference(a[nm], b[nm], relative=True), 1e-12)
+    return report
+
+
+
+@benchmark
+def bench_filters(size=4*10**6, repeat=1):
+    """
+    The spike filters (spike_filter.py) on ``size`` samples of a cozirA_raw-
+    and an SGP30-like series, a minute apart with jitter and gaps and 0.1% of
+    spikes, with each engine, and `spike_filter.SpikeFilter` on the first
+    100,000.  All must give the same values, and the Hampel filter must catch
+    all the spikes.
+    """
+    import compute_engine
+    import spike_filter
+
+    report = Report(f'spike filters, {size:,} samples')
+    engines = ['numpy']
+    if compute_engine.numba_available():
+        engines.append('numba')
+    else:
+        report.add('numba not installed, only timing numpy')
+
+    rng = np.random.default_rng(3)
+    t = np.cumsum(rng.normal(60, 2, size))
+    t[rng.integers(0, size, size // 10000)] += 3600  # gaps
+    t = np.cumsum(np.maximum(np.diff(t, prepend=0), 1))
+    level = 700 + 250*np.sin(t * 2*np.pi/86400) + rng.normal(0, 20, size // 1000).repeat(1000)
+    spikes = rng.random(size) < .001
+    series = {'cozirA_raw': np.round(level + rng.normal(0, 3, size)),
+              'sgp30_eco2': np.round(level * rng.lognormal(0, .03, size))}
+    for vals in series.values():
+        vals[spikes] += rng.choice([-1, 1], spikes.sum()) * rng.uniform(300, 3000, spikes.sum())
+    window = 600.
+
+    results = {}
+    for engine in engines:
+        if engine == 'numba':
+            st = time.perf_counter()
+            spike_filter.hampel(t[:100], series['cozirA_raw'][:100], window, engine=engine)
+            report.add('numba first calls', time.perf_counter() - st)
+        for nm, vals in series.items():
+            res = results[engine, nm] = {}
+            res['median'], secs, peak = measure(spike_filter.rolling_median, t, vals, window,
+                                                 engine=engine, repeat=repeat)
+            report.add(f'rolling median {nm} ({engine})', secs, peak,
+                       per_sec=f'{size/secs:.3g}')
+            res['hampel'], secs, peak = measure(spike_filter.hampel, t, vals, window,
+                                                 engine=engine, repeat=repeat)
+            report.add(f'hampel {nm} ({engine})', secs, peak, per_sec=f'{size/secs:.3g}')
+
+    nstream = min(size, 10**5)
+    for nm, vals in series.items():
+        a = results['numpy', nm]
+        report.check(f'hampel {nm} missed spikes', float(np.sum(spikes & ~a['hampel'][1])), 0.)
+        if len(engines) > 1:
+            b = results['numba', nm]
+            report.check(f'median {nm} numba difference', _max_difference(a['median'], b['median']), 0.)
+            report.check(f'hampel {nm} numba difference',
+                         _max_difference(a['hampel'][0], b['hampel'][0]), 0.)
+
+        def stream():
+            filt = spike_filter.SpikeFilter(window=window)
+            out = []
+            for ti, v in zip(t[:nstream], vals[:nstream]):
+                out.extend(filt.update(ti, v))
+            out.extend(filt.flush())
+            return np.array([v for _, v in out])
+
+        streamed, secs, peak = measure(stream, repeat=1)
+        report.add(f'SpikeFilter {nm} {nstream:,} samples', secs, peak,
+                   per_sec=f'{nstream/secs:.3g}')
+        expected = spike_filter.hampel(t[:nstream], vals[:nstream], window)[0]
+        report.check(f'SpikeFilter {nm} difference', _max_difference(streamed, expected), 0.)
+    return report
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run (default all): {", ".join(BENCHMARKS)}')
+    parser.add_argument('--size', '-n', type=float, default=None,
+                        help='number of values (default: 1e6, 1e7 for engines, 4e6 for filters)')
+    parser.add_argument('--repeat', '-r', type=int, default=3)
+    args = parser.parse_args()
+
+    failed = []
+    for name in args.names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            parser.error(f'no benchmark {name!r}')
+        kwargs = {} if args.size is None else {'size': int(args.size)}
+        report = BENCHMARKS[name](repeat=args.repeat, **kwargs)
+        report.print()
+        failed.extend(report.failed)
+    if failed:
+        print('FAILED:', ', '.join(failed))
+    sys.exit(bool(failed))
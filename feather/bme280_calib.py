@@ -1,18 +1,30 @@
 import struct
 
+CALIB_NBYTES = 32
+
+
+def read_calib_bytes(i2cdev):
+    # requires that the lock already be present!
+    # 24 bytes of temperature/pressure calibration from 0x88, then the humidity
+    # calibration from 0xa1 and 0xe1
+    calib_bytes = bytearray(CALIB_NBYTES)
+    i2cdev.write_then_readinto(bytearray([0x88]), calib_bytes, in_end=24)
+    i2cdev.write_then_readinto(bytearray([0xa1]), calib_bytes, in_start=24, in_end=25)
+    i2cdev.write_then_readinto(bytearray([0xe1]), calib_bytes, in_start=25, in_end=32)
+    return calib_bytes
+
+
 def get_calibs(i2cdev):
     # requires that the lock already be present!
-    tp_bytes = bytearray(24)
-    i2cdev.write_then_readinto(bytearray([0x88]), tp_bytes)
-    tp_coeffs = struct.unpack('<HhhHhhhhhhhh', tp_bytes)
+    return calibs_from_bytes(read_calib_bytes(i2cdev))
+
+
+def calibs_from_bytes(calib_bytes):
+    tp_coeffs = struct.unpack('<HhhHhhhhhhhh', calib_bytes[:24])
     t_calib = [float(c) for c in tp_coeffs[:3]]
     p_calib = [float(c) for c in tp_coeffs[3:]]
 
-    # reuse the allocated array
-    i2cdev.write_then_readinto(bytearray([0xa1]), tp_bytes, in_start=0, in_end=1)
-    i2cdev.write_then_readinto(bytearray([0xe1]), tp_bytes, in_start=1, in_end=8)
-
-    h_coeffs = struct.unpack('<BhBbBbb', tp_bytes[:8])
+    h_coeffs = struct.unpack('<BhBbBbb', calib_bytes[24:32])
     h_calib = [None]*6
     h_calib[0] = float(h_coeffs[0])
     h_calib[1] = float(h_coeffs[0])
@@ -21,4 +33,4 @@ def get_calibs(i2cdev):
     h_calib[4] = float((h_coeffs[4] << 4) | (h_coeffs[3] >> 4))
     h_calib[5] = float(h_coeffs[5])
 
-    return tuple(t_calib), tuple(p_calib), tuple(h_calib)
\ No newline at end of file
+    return tuple(t_calib), tuple(p_calib), tuple(h_calib)
@@ -0,0 +1,56 @@
+"""
+Caches what the feather discovers at boot (attached I2C hardware, the CozIR
+digital filter setting and the BME280 calibration) in the microcontroller's
+NVM, so a fast boot can skip rediscovering it.  Nothing is written unless
+something changed, to spare the flash.
+"""
+import struct
+
+MAGIC = b'CZ1'
+FOUND_NAMES = ('sgp30', 'bme280', 'rtc_ds3231', 'nvm_at24c32')
+# magic, found flags, cozir filter, log size when the calib was last logged,
+# then the raw BME280 calibration bytes
+HEADER_FMT = '<3sBBI'
+HEADER_NBYTES = struct.calcsize(HEADER_FMT)
+CALIB_NBYTES = 32
+NBYTES = HEADER_NBYTES + CALIB_NBYTES
+
+
+def _nvm():
+    import microcontroller
+    nvm = getattr(microcontroller, 'nvm', None)
+    if nvm is None or len(nvm) < NBYTES:
+        return None
+    return nvm
+
+
+def load():
+    """
+    Returns ``(found, cozir_filter, calib_logged_size, calib_bytes)``, or None if
+    there is no NVM or nothing valid has been saved.
+    """
+    nvm = _nvm()
+    if nvm is None:
+        return None
+    magic, flags, cozir_filter, logged_size = struct.unpack(HEADER_FMT, nvm[:HEADER_NBYTES])
+    if magic != MAGIC:
+        return None
+    found = tuple(nm for i, nm in enumerate(FOUND_NAMES) if flags & (1 << i))
+    return found, cozir_filter, logged_size, bytearray(nvm[HEADER_NBYTES:NBYTES])
+
+
+def save(found, cozir_filter, calib_logged_size=0, calib_bytes=None):
+    nvm = _nvm()
+    if nvm is None:
+        return False
+    flags = 0
+    for i, nm in enumerate(FOUND_NAMES):
+        if nm in found:
+            flags |= 1 << i
+    buf = bytearray(NBYTES)
+    struct.pack_into(HEADER_FMT, buf, 0, MAGIC, flags, cozir_filter, calib_logged_size)
+    if calib_bytes is not None:
+        buf[HEADER_NBYTES:] = calib_bytes
+    if nvm[:NBYTES] != buf:
+        nvm[:NBYTES] = buf
+    return True
@@ -0,0 +1,305 @@
+"""
+Detection of CO2 rise (occupancy) and decay (ventilation) events.
+
+`EventDetector` takes samples one at a time in constant memory, so it can run
+live on a monitor or on a followed log.  `detect_series_events` and
+`detect_events` do the same over whole arrays with numpy, and give exactly the
+same events as feeding the samples through an `EventDetector` in order and
+calling `EventDetector.flush` at the end.
+
+Both smooth the series with a boxcar mean of the last ``window`` samples
+(computed from running sums), take the slope of that mean over the last
+``slope_lag`` samples, and apply hysteresis: an event starts when the slope
+passes ``rise_on`` (or falls below ``-decay_on``) ppm/hour and ends once it drops
+back under ``rise_off`` (above ``-decay_off``).  A gap of more than
+``max_gap_sec`` ends any event and restarts the statistics.  Events that change
+the level by less than ``min_amplitude`` are dropped.
+"""
+
+from collections import deque, namedtuple
+
+import numpy as np
+
+import measurement_types
+from exposure_analytics import CO2_TYPES
+
+__all__ = ['Event', 'EventDetector', 'detect_series_events', 'detect_events']
+
+class Event(namedtuple('Event', ['kind', 'start', 'end', 'start_level',
+                                  'end_level', 'peak_slope'])):
+    """
+    ``kind`` is 'rise' or 'decay'.  ``start`` and ``end`` are timestamps (in the
+    form they were given), the levels are smoothed ppm, and ``peak_slope`` is the
+    steepest slope (ppm/hour, negative for decays) seen during the event.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        duration = self.end - self.start
+        if isinstance(duration, np.timedelta64):
+            duration = duration / np.timedelta64(1, 's')
+        return '{:5} {} -> {} ({:.0f} min): {:.0f} -> {:.0f} ppm, peak {:+.0f} ppm/hr'.format(
+            self.kind, self.start, self.end, duration/60, self.start_level,
+            self.end_level, self.peak_slope)
+
+DEFAULT_PARAMS = dict(window=5, slope_lag=5, rise_on=200., rise_off=50.,
+                      decay_on=200., decay_off=50., min_amplitude=100.,
+                      max_gap_sec=600.)
+
+
+def _to_seconds(t):
+    """
+    A timestamp (datetime, datetime64 or ISO string) -> float seconds since the
+    epoch, computed the same way as for arrays in `detect_series_events`.
+    Numbers are taken to already be seconds.
+    """
+    if isinstance(t, (int, float, np.floating, np.integer)):
+        return np.float64(t), np.float64(t)
+    t = np.datetime64(t, 'ms')
+    return t.astype(np.int64) / 1000., t
+
+
+class _Hysteresis:
+    """
+    One rise or decay channel.  ``sign`` is -1 for decays so the thresholds can
+    be written as positive numbers either way.
+    """
+    def __init__(self, kind, sign, on, off):
+        self.kind = kind
+        self.sign = sign
+        self.on = on
+        self.off = off
+        self.start = None  # (timestamp, level) while an event is open
+        self.peak = None
+
+    def update(self, slope, t, level, window_start):
+        """
+        Returns the `Event` ending at this sample, or None.
+        """
+        s = self.sign * slope
+        ended = None
+        if self.start is not None:
+            if s < self.off:
+                ended = self.close(t, level)
+            elif s > self.sign * self.peak:
+                self.peak = slope
+        if self.start is None and ended is None and s > self.on:
+            # date the start back to where the slope window began
+            self.start = window_start
+            self.peak = slope
+        return ended
+
+    def close(self, t, level):
+        (start_t, start_level), peak = self.start, self.peak
+        self.start = self.peak = None
+        return Event(self.kind, start_t, t, start_level, level, peak)
+
+    @property
+    def active(self):
+        return self.start is not None
+
+
+class EventDetector:
+    """
+    Streaming detector for a single series (one measurement type from one
+    device).  Call `update` with each sample, in the order they were logged; it
+    returns a (usually empty) list of the events that ended at that sample.
+    Call `flush` at the end of the data to close any open event.
+    """
+    def __init__(self, window=DEFAULT_PARAMS['window'],
+                 slope_lag=DEFAULT_PARAMS['slope_lag'],
+                 rise_on=DEFAULT_PARAMS['rise_on'],
+                 rise_off=DEFAULT_PARAMS['rise_off'],
+                 decay_on=DEFAULT_PARAMS['decay_on'],
+                 decay_off=DEFAULT_PARAMS['decay_off'],
+                 min_amplitude=DEFAULT_PARAMS['min_amplitude'],
+                 max_gap_sec=DEFAULT_PARAMS['max_gap_sec']):
+        self.window = window
+        self.slope_lag = slope_lag
+        self.min_amplitude = min_amplitude
+        self.max_gap_sec = max_gap_sec
+        self.channels = (_Hysteresis('rise', 1, rise_on, rise_off),
+                         _Hysteresis('decay', -1, decay_on, decay_off))
+        self._reset()
+
+    def _reset(self):
+        self._tsec = None
+        self._csum = 0.
+        # running sums at the last window+1 samples, and (seconds, timestamp,
+        # level) for the last slope_lag+1 smoothed samples
+        self._csums = deque([0.], maxlen=self.window + 1)
+        self._levels = deque(maxlen=self.slope_lag + 1)
+
+    def update(self, timestamp, value):
+        tsec, t = _to_seconds(timestamp)
+        events = []
+        if self._tsec is not None and tsec - self._tsec > self.max_gap_sec:
+            events = self.flush()
+        self._tsec = tsec
+
+        self._csum += float(value)
+        self._csums.append(self._csum)
+        if len(self._csums) <= self.window:
+            return events
+        level = (self._csums[-1] - self._csums[0]) / self.window
+        self._levels.append((tsec, t, level))
+        if len(self._levels) <= self.slope_lag:
+            return events
+        t0sec, t0, level0 = self._levels[0]
+        if tsec - t0sec <= 0:
+            return events
+        slope = (level - level0) * 3600. / (tsec - t0sec)
+
+        for channel in self.channels:
+            event = channel.update(slope, t, level, (t0, level0))
+            if event is not None:
+                events.extend(self._keep(event))
+        return events
+
+    def flush(self):
+        """
+        Closes any open events at the last sample and restarts the statistics
+        (as for a gap).  Returns the closed events.
+        """
+        events = []
+        if self._levels:
+            _, t, level = self._levels[-1]
+            for channel in self.channels:
+                if channel.active:
+                    events.extend(self._keep(channel.close(t, level)))
+        self._reset()
+        return events
+
+    def _keep(self, event):
+        if abs(event.end_level - event.start_level) >= self.min_amplitude:
+            return [event]
+        return []
+
+
+def _last_true_index(msk):
+    """
+    For each position, the index of the last True at or before it (-1 if none).
+    """
+    idx = np.where(msk, np.arange(len(msk)), -1)
+    return np.maximum.accumulate(idx) if len(idx) else idx
+
+
+def _segment_events(secs, timestamps, values, params):
+    window = params['window']
+    lag = params['slope_lag']
+    n = len(values)
+    if n < window + lag:
+        return []
+
+    csum = np.cumsum(values)
+    csum0 = np.concatenate([[0.], csum[:-window]])
+    level = np.full(n, np.nan)
+    level[window-1:] = (csum[window-1:] - csum0) / window
+
+    slope = np.full(n, np.nan)
+    first = window - 1 + lag
+    dt = secs[first:] - secs[first-lag:n-lag]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope[first:] = np.where(dt > 0, (level[first:] - level[first-lag:n-lag]) * 3600. / dt, np.nan)
+
+    # (end index, closed by the segment end, channel, event), to sort them into
+    # the order EventDetector emits them
+    events = []
+    channels = [('rise', 1, params['rise_on'], params['rise_off']),
+                ('decay', -1, params['decay_on'], params['decay_off'])]
+    for channel, (kind, sign, on, off) in enumerate(channels):
+        signed = sign * slope
+        # NaN slopes neither start nor end anything, like in EventDetector
+        active = _last_true_index(signed > on) > _last_true_index(signed < off)
+        was_active = np.r_[False, active[:-1]]
+        starts = np.flatnonzero(active & ~was_active)
+        # the slope at an event's last sample only counts towards the peak if
+        # the event is closed by the end of the segment
+        peak_ends = ends = np.flatnonzero(was_active & ~active)
+        if len(ends) < len(starts):
+            ends = np.r_[ends, n - 1]
+            peak_ends = np.r_[peak_ends, n]
+        for st, end, peak_end in zip(starts, ends, peak_ends):
+            peak = slope[st:peak_end][np.nanargmax(signed[st:peak_end])]
+            events.append((end, peak_end == n, channel, Event(kind, timestamps[st-lag], timestamps[end],
+                                               level[st-lag], level[end], peak)))
+    events.sort(key=lambda e: e[:3])
+    return [e[-1] for e in events]
+
+
+def detect_series_events(timestamps, values, **params):
+    """
+    Returns the events in a single series, in the order `EventDetector` would
+    emit them.  The samples should be in logged order (not sorted).  Takes the same parameters as `EventDetector`.
+    """
+    params = dict(DEFAULT_PARAMS, **params)
+    timestamps = np.asarray(timestamps)
+    values = np.asarray(values, dtype=float)
+    if timestamps.dtype.kind == 'M':
+        timestamps = timestamps.astype('datetime64[ms]')
+        secs = timestamps.astype(np.int64) / 1000.
+    else:
+        timestamps = secs = timestamps.astype(float)
+
+    bounds = np.r_[0, np.flatnonzero(np.diff(secs) > params['max_gap_sec']) + 1, len(secs)]
+    events = []
+    for st, end in zip(bounds[:-1], bounds[1:]):
+        events.extend(_segment_events(secs[st:end], timestamps[st:end],
+                                      values[st:end], params))
+    return [e for e in events
+            if abs(e.end_level - e.start_level) >= params['min_amplitude']]
+
+
+def detect_events(cols, types=CO2_TYPES, **params):
+    """
+    Runs `detect_series_events` on each of ``types`` present in ``cols`` (as
+    output by `cozir_parser.read_log_columns`).  Returns a dictionary mapping
+    measurement type to list of events.
+    """
+    series = measurement_types.partition_by_type(cols['type_code'], cols['type_names'],
+                                                 cols['timestamp'], cols['value'])
+    return {mtype: detect_series_events(*series[mtype], **params)
+            for mtype in types if mtype in series}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import cozir_parser
+    import spike_filter
+
+    parser = argparse.ArgumentParser(description='Print CO2 rise (occupancy) and decay (ventilation) events in a feather log.')
+    parser.add_argument('input_file', help='log file to parse')
+    parser.add_argument('--types', default=','.join(CO2_TYPES), help='comma-separated measurement types to look at')
+    parser.add_argument('--follow', '-f', action='store_true', help='keep watching the log and print events as they happen')
+    parser.add_argument('--filter', default=None, type=spike_filter.parse_filters, help='spike filters to apply first, e.g. "cozirA_raw=hampel:600" or "default" (see spike_filter.py)')
+    parser.add_argument('--start-time', default=None)
+    parser.add_argument('--end-time', default=None)
+    for name, default in DEFAULT_PARAMS.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=type(default), default=default)
+
+    args = parser.parse_args()
+    types = args.types.split(',')
+    params = {name: getattr(args, name) for name in DEFAULT_PARAMS}
+
+    if args.follow:
+        detectors = {mtype: EventDetector(**params) for mtype in types}
+        # the filters hold each sample back until half a window after it
+        filters = {mtype: spike_filter.SpikeFilter(**kw)
+                   for mtype, kw in (args.filter or {}).items() if mtype in detectors}
+        try:
+            for t, mtype, value in cozir_parser.follow_log(args.input_file):
+                if mtype not in detectors:
+                    continue
+                samples = filters[mtype].update(t, value) if mtype in filters else [(t, value)]
+                for t, value in samples:
+                    for event in detectors[mtype].update(t, value):
+                        print(mtype, event, flush=True)
+        except KeyboardInterrupt:
+            pass
+    else:
+        cols = cozir_parser.read_log_segments(args.input_file, args.start_time, args.end_time,
+                                              filters=args.filter)
+        for mtype, events in detect_events(cols, types, **params).items():
+            for event in events:
+                print(mtype, event)
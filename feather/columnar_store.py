@@ -0,0 +1,230 @@
+"""
+Export/import of parsed logs to compressed Parquet files, so analyses do not
+have to re-parse the text logs every time.
+
+The store is a directory with one sub-directory per day (``day=YYYY-MM-DD``)
+holding one file per device.  Within each file the rows are sorted by
+measurement type and then time, so the per-row-group statistics Parquet keeps
+let `read_columns` skip whole days, files, and row groups that cannot match a
+time range or set of measurement types.
+
+Requires pyarrow.
+"""
+
+import os
+
+import numpy as np
+
+import measurement_types
+import value_dtype
+
+__all__ = ['write_columns', 'read_columns']
+
+DEFAULT_ROW_GROUP_SIZE = 16384
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+
+
+def _read_schema():
+    """
+    The string columns are written as plain strings (Parquet dictionary-encodes
+    them on disk anyway, and keeps min/max statistics for them that way), but
+    are read back as dictionaries.
+    """
+    import pyarrow as pa
+
+    return pa.schema([('timestamp', pa.timestamp('ms')),
+                      ('measurement_type', pa.dictionary(pa.int16(), pa.string())),
+                      ('value', pa.float64()),
+                      ('device', pa.dictionary(pa.int16(), pa.string())),
+                      ('day', pa.string())])
+
+
+def write_columns(cols, root, device='feather', compression='zstd',
+                  row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Writes ``cols`` (as output by `cozir_parser.read_log_columns` or
+    `cozir_parser_pi.to_columns`) into the store at ``root``.  Rows are merged
+    into any existing file for the same device and day, so the segments of one
+    log can be written one after another; an existing row with the same
+    timestamp and measurement type as a new one is replaced by it, so exporting
+    the same data twice does not duplicate it.  Returns the list of files
+    written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    timestamps = cols['timestamp']
+    if timestamps.dtype.kind != 'M':
+        raise ValueError('columnar export needs RTC (datetime) timestamps')
+    timestamps = timestamps.astype('datetime64[ms]')
+    type_names = list(cols['type_names'])
+    codes = np.asarray(cols['type_code']).astype(np.int16)
+
+    days = timestamps.astype('datetime64[D]')
+    written = []
+    for day in np.unique(days):
+        dmsk = days == day
+        dts = timestamps[dmsk]
+        dcodes = codes[dmsk]
+        dvals = cols['value'][dmsk]
+
+        daydir = os.path.join(root, f'day={day}')
+        fn = os.path.join(daydir, f'{device}.parquet')
+        if os.path.exists(fn):
+            dts, dcodes, dvals, type_names = _merge_existing(
+                fn, dts, dcodes, dvals, type_names)
+
+        # sort by type then time, so that row groups cover few types and a
+        # narrow time range each
+        order = np.lexsort((dts, dcodes))
+        tab = pa.table({
+            'timestamp': pa.array(dts[order], type=pa.timestamp('ms')),
+            'measurement_type': pa.DictionaryArray.from_arrays(
+                pa.array(dcodes[order]), pa.array(type_names, type=pa.string())
+                ).dictionary_decode(),
+            'value': pa.array(dvals[order], type=pa.float64()),
+            'device': pa.array(np.full(len(order), device), type=pa.string()),
+        })
+
+        os.makedirs(daydir, exist_ok=True)
+        # written aside first so a failed write does not lose the merged data
+        tmpfn = fn + '.tmp'
+        pq.write_table(tab, tmpfn, compression=compression,
+                       row_group_size=row_group_size)
+        os.replace(tmpfn, fn)
+        written.append(fn)
+
+    return written
+
+
+def _merge_existing(fn, dts, dcodes, dvals, type_names):
+    """
+    Adds the rows of the existing store file ``fn`` to one day's new rows,
+    dropping those that have the same timestamp and type as a new row.
+    """
+    import pyarrow.parquet as pq
+
+    old = pq.read_table(fn, columns=['timestamp', 'measurement_type', 'value'])
+    old_ts = old.column('timestamp').to_numpy().astype('datetime64[ms]')
+    old_names = np.asarray(old.column('measurement_type').to_pylist(), dtype=object)
+    old_vals = old.column('value').to_numpy()
+
+    type_names = list(type_names)
+    lookup = {nm: i for i, nm in enumerate(type_names)}
+    for nm in dict.fromkeys(old_names):
+        if nm not in lookup:
+            lookup[nm] = len(type_names)
+            type_names.append(nm)
+    old_codes = np.array([lookup[nm] for nm in old_names], dtype=np.int16)
+
+    def _keys(ts, codes):
+        return ts.astype(np.int64) * 65536 + codes.astype(np.int64)
+    keep = ~np.isin(_keys(old_ts, old_codes), _keys(dts, dcodes))
+
+    return (np.concatenate([old_ts[keep], dts]),
+            np.concatenate([old_codes[keep], dcodes]),
+            np.concatenate([old_vals[keep], np.asarray(dvals, dtype=np.float64)]),
+            type_names)
+
+
+def read_columns(root, start_time=None, end_time=None, types=None,
+                 devices=None):
+    """
+    Reads data back from the store at ``root``, in the same form as
+    `cozir_parser.read_log_columns` plus a 'device' array.  The time range,
+    ``types`` and ``devices`` filters are pushed down so only the matching days
+    and row groups are read.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(root, format='parquet', schema=_read_schema(),
+                         partitioning=_partitioning())
+
+    filt = None
+    def _and(expr):
+        return expr if filt is None else filt & expr
+
+    if start_time is not None:
+        start_time = np.datetime64(start_time, 'ms')
+        filt = _and(ds.field('day') >= str(start_time.astype('datetime64[D]')))
+        filt = _and(ds.field('timestamp') >= pa.scalar(start_time.astype(object), pa.timestamp('ms')))
+    if end_time is not None:
+        end_time = np.datetime64(end_time, 'ms')
+        filt = _and(ds.field('day') <= str(end_time.astype('datetime64[D]')))
+        filt = _and(ds.field('timestamp') <= pa.scalar(end_time.astype(object), pa.timestamp('ms')))
+    if types is not None:
+        filt = _and(ds.field('measurement_type').isin(list(types)))
+    if devices is not None:
+        filt = _and(ds.field('device').isin(list(devices)))
+
+    tab = dataset.to_table(columns=['timestamp', 'measurement_type', 'value', 'device'],
+                           filter=filt)
+    tab = tab.unify_dictionaries().combine_chunks()
+
+    type_names, codes = _dictionary_to_numpy(tab.column('measurement_type'))
+    device_names, device_codes = _dictionary_to_numpy(tab.column('device'))
+
+    return {'timestamp': tab.column('timestamp').to_numpy().astype('datetime64[ms]'),
+            'type_code': codes.astype(measurement_types.code_dtype(len(type_names))),
+            'value': tab.column('value').to_numpy().astype(value_dtype.get_value_dtype(), copy=False),
+            'device': np.asarray(device_names, dtype=str)[device_codes],
+            'type_names': type_names}
+
+
+def _dictionary_to_numpy(column):
+    if column.num_chunks == 0:
+        return [], np.zeros(0, dtype=np.int16)
+    arr = column.chunk(0)
+    return arr.dictionary.to_pylist(), arr.indices.to_numpy(zero_copy_only=False)
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export = subparsers.add_parser('export', help='parse a log and add it to a store')
+    export.add_argument('input_file', help='log file to parse (with its rotated segments)')
+    export.add_argument('root', help='directory of the store')
+    export.add_argument('--device', '-d', default=None, help='device name (default: the log file name, up to the first ".")')
+    export.add_argument('--pi-format', action='store_true', help='the log is from cozir_mon_pi.py rather than the feather')
+
+    query = subparsers.add_parser('query', help='print stats for a query on a store')
+    query.add_argument('root', help='directory of the store')
+    query.add_argument('--start-time', default=None)
+    query.add_argument('--end-time', default=None)
+    query.add_argument('--types', default=None, help='comma-separated measurement types')
+    query.add_argument('--devices', default=None, help='comma-separated device names')
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        if args.pi_format:
+            sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pi'))
+            import cozir_parser_pi
+            cols = cozir_parser_pi.to_columns(cozir_parser_pi.parse_cozir_file(args.input_file))
+        else:
+            import cozir_parser
+            cols = cozir_parser.read_log_segments(args.input_file)
+        device = args.device
+        if device is None:
+            # co2.log and its segments co2.<tag>.log[.gz] are all device co2
+            device = os.path.basename(os.path.normpath(args.input_file)).split('.')[0]
+        for fn in write_columns(cols, args.root, device):
+            print('Wrote', fn)
+    elif args.command == 'query':
+        import cozir_parser
+
+        cols = read_columns(args.root, args.start_time, args.end_time,
+                            None if args.types is None else args.types.split(','),
+                            None if args.devices is None else args.devices.split(','))
+        cozir_parser.print_stats(cozir_parser.compute_stats(cols))
@@ -0,0 +1,89 @@
+"""
+Which implementation the hot numeric code runs on: ``'numpy'`` (the default),
+or ``'numba'``, which runs the log tokenizing, BME280 calibration, humidity
+conversions and spike filter windows as compiled single-pass loops
+(jit_kernels.py) instead of chains of numpy temporaries.  numba is optional:
+asking for it when it is not installed warns once and uses numpy.
+
+The numba kernels give the same values as numpy, exactly for the tokenizing,
+BME280 calibration and spike filters, and to an ulp or so for the humidity
+conversions (see jit_kernels.py).  The first call of each kernel compiles it,
+which is cached on disk after that.
+
+Select it with `set_engine`, the `using_engine` context manager, the
+``COZIR_ENGINE`` environment variable, or the ``engine`` argument of the
+functions that have one.  ``benchmarks.py engines`` compares the two.
+"""
+import os
+import warnings
+import contextlib
+
+__all__ = ['ENGINES', 'get_engine', 'set_engine', 'using_engine',
+           'resolve_engine', 'numba_available', 'jit_kernels']
+
+ENGINES = ('numpy', 'numba')
+
+_engine = None
+_warned = False
+
+
+def _check(engine):
+    if engine not in ENGINES:
+        raise ValueError(f'engine must be one of {", ".join(ENGINES)}, not {engine!r}')
+    return engine
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = _check(os.environ.get('COZIR_ENGINE', 'numpy'))
+    return _engine
+
+
+def set_engine(engine):
+    """
+    Sets the default engine from now on, and returns the previous one.
+    """
+    global _engine
+    old = get_engine()
+    _engine = _check(engine)
+    return old
+
+
+@contextlib.contextmanager
+def using_engine(engine):
+    old = set_engine(engine)
+    try:
+        yield
+    finally:
+        set_engine(old)
+
+
+def numba_available():
+    import importlib.util
+
+    return importlib.util.find_spec('numba') is not None
+
+
+def resolve_engine(engine=None):
+    """
+    The engine that will actually be used for ``engine`` (default
+    `get_engine`): 'numba' falls back to 'numpy' if numba is not installed.
+    """
+    global _warned
+    engine = get_engine() if engine is None else _check(engine)
+    if engine == 'numba' and not numba_available():
+        if not _warned:
+            warnings.warn('numba is not installed, using the numpy engine', RuntimeWarning)
+            _warned = True
+        return 'numpy'
+    return engine
+
+
+def jit_kernels():
+    """
+    The jit_kernels module (importing it, and so numba, on first use).
+    """
+    import jit_kernels
+
+    return jit_kernels
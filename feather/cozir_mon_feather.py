@@ -1,9 +1,13 @@
-import sys
 import time
+IMPORT_TIME = time.monotonic()  # for the boot timing breakdown
+import os
+import sys
 import busio
 import board
 import digitalio
 import rtc_time
+import rtc_clock
+import sensor_bus
 import battery_check_feather
 
 # constants according to http://www.co2meters.com/Documentation/Manuals/Manual-GSS-Sensors.pdf
@@ -39,7 +43,7 @@ def setup_neopixels():
     return neopixel.NeoPixel(NEOPIXEL_PIN, 1)
 
 
-def setup_sd(mountpoint='/sd'):
+def setup_sd(mountpoint='/sd', blink=True):
     import adafruit_sdcard
     import storage
     try:
@@ -49,7 +53,8 @@ def setup_sd(mountpoint='/sd'):
         vfs = storage.VfsFat(sdcard)
         storage.mount(vfs, mountpoint)
         print('Found SD card.')
-        blink_led(gled, .075, 5)
+        if blink:
+            blink_led(gled, .075, 5)
         return sdcard, vfs
     except Exception as e:
         print('Failed to set up and mount SD card! Exception info:', str(e), '\nPrinting to console instead.')
@@ -76,16 +81,18 @@ def setup_bme280(i2c):
         time.sleep(.002) #2ms startup time
         # configure registers for weather-sensing-ish mode
         dev.write(bytearray([0xF2, 0b1]))
-        dev.write(bytearray([0xF4, 0b100100]))
+        dev.write(bytearray([0xF4, sensor_bus.BME280_CTRL_MEAS]))
         dev.write(bytearray([0xF5, 0]))
 
     return dev
 
 
-def setup_cozir(digital_filter_value=32):
+def setup_cozir(digital_filter_value=32, set_filter=True):
     uart = busio.UART(board.TX, board.RX, baudrate=9600, receiver_buffer_size=64)
     uart.write(b'K 0\r\n')
-    uart.write(bytearray('A {}\r\n'.format(int(digital_filter_value))))
+    if set_filter:
+        # the CozIR keeps this in its EEPROM, so it only needs setting once
+        uart.write(bytearray('A {}\r\n'.format(int(digital_filter_value))))
     time.sleep(.1)
     uart.reset_input_buffer()
 
@@ -101,8 +108,17 @@ def setup_cozir(digital_filter_value=32):
     return uart, FILTER_TO_WARM_UP_SECS[digital_filter_value]
 
 
-def setup_i2c_attached():
+def setup_i2c_attached(found=None):
+    """
+    Scans for the attached hardware unless ``found`` is given.
+    """
     i2c = busio.I2C(board.SCL, board.SDA, frequency=100000)
+    if found is None:
+        found = scan_i2c(i2c)
+    return i2c, found
+
+
+def scan_i2c(i2c):
     while not i2c.try_lock():
         pass
     try:
@@ -120,57 +136,221 @@ def setup_i2c_attached():
     if 0x57 in scanres:
         found.append('nvm_at24c32')
 
-    return i2c, tuple(found)
+    return tuple(found)
+
+
+def log_bme280_calibs(bme280, dt, log_row, calib_bytes=None):
+    import bme280_calib
+
+    if calib_bytes is None:
+        with bme280:
+            calib_bytes = bme280_calib.read_calib_bytes(bme280)
+    tcalibs, pcalibs, hcalibs = bme280_calib.calibs_from_bytes(calib_bytes)
+    print('Saving bme280 calib info')
+    # one flush at the end rather than one per row
+    for i, tc in enumerate(tcalibs):
+        log_row([dt, bytearray('bme280_calib_t_' + str(i)), bytearray(repr(int(tc)))], False)
+    for i, pc in enumerate(pcalibs):
+        log_row([dt, bytearray('bme280_calib_p_' + str(i)), bytearray(repr(int(pc)))], False)
+    for i, hc in enumerate(hcalibs):
+        log_row([dt, bytearray('bme280_calib_h_' + str(i)), bytearray(repr(int(hc)))], i == len(hcalibs) - 1)
+    del tcalibs, pcalibs, hcalibs
+
+    del bme280_calib
+    del sys.modules['bme280_calib']
+
+
+def rotate_log(fn='/sd/co2.log'):
+    """
+    Moves ``fn`` to the first free ``co2.NNNN.log`` name next to it and returns
+    a new, empty ``fn`` open for appending.
+    """
+    stem = fn[:-4]
+    i = 1
+    while True:
+        segfn = stem + '.{:04d}.log'.format(i)
+        try:
+            os.stat(segfn)
+        except OSError:
+            break
+        i += 1
+    os.rename(fn, segfn)
+    print('Rotated log to', segfn)
+    return open(fn, 'ab')
+
+
+def sleep_serving(secs, on_command, supervisor=None, poll_sec=.1, pending=None):
+    """
+    ``time.sleep(secs)``, except that lines typed on the USB serial console
+    meanwhile are passed to ``on_command`` as they complete (polling every
+    ``poll_sec``).  ``pending`` is a one-element list holding any partial line
+    between calls.  Without ``supervisor`` this is just a sleep.
+    """
+    if supervisor is None:
+        time.sleep(secs)
+        return
+    end = time.monotonic() + secs
+    while True:
+        while supervisor.runtime.serial_bytes_available:
+            c = sys.stdin.read(1)
+            if c == '\n' or c == '\r':
+                if pending[0]:
+                    on_command(pending[0])
+                pending[0] = ''
+            elif len(pending[0]) < 32:
+                pending[0] += c
+        left = end - time.monotonic()
+        if left <= 0:
+            break
+        time.sleep(min(poll_sec, left))
 
 
 def main_loop(loop_time_sec=60, npx_brightness=.5, cozir_filter=8,
-              log_battery=True):
+              log_battery=True, max_log_bytes=None, fast_boot=False,
+              adaptive=None, rtc_resync_sec=3600, summary=None):
+    """
+    If ``summary`` is a ``(nslots, period_sec)`` pair, the CO2, CozIR
+    temperature and humidity and battery voltage of each period are summarized
+    in a `summary_ring.SummaryRing`, saved to ``/sd/summary.bin`` if there is
+    an RTC, and printed when ``status`` is sent over the USB serial console
+    (see status_poll.py).  Between measurements the console is checked for
+    that every 0.1 s instead of sleeping straight through.
+
+    Timestamps come from `rtc_clock.RTCClock`, which reads the RTC (if there is
+    one) once at boot and every ``rtc_resync_sec`` after.  Each resync logs how
+    far the timestamps had drifted (``clock_offset``, seconds) and the
+    estimated rate difference of the board's clock (``clock_drift_ppm``).
+
+    If ``adaptive`` is a ``(min_sec, max_sec)`` pair, the time between cycles
+    is picked from how fast the CO2 is changing (see
+    `adaptive_interval.AdaptiveInterval`), starting from ``loop_time_sec``.
+    Each new interval is logged as a ``loop_interval`` row.
+
+    If ``max_log_bytes`` is given, the log is moved to a new segment (see
+    `rotate_log`) at the end of the first cycle that takes it past that size.
+
+    With ``fast_boot``, the attached hardware, CozIR filter setting and BME280
+    calibration are taken from NVM (see `boot_cache`) when they were saved by an
+    earlier boot, the calibration is only re-logged if it changed or the log was
+    replaced, and the LED blinks are skipped.  Either way the CozIR warms up
+    while everything else is set up, and the time each boot stage took is
+    logged with the first sample as ``boot_*`` rows.
+    """
+    # (stage, time it ended), starting from when this module was imported
+    boot_marks = [(None, IMPORT_TIME)]
+    def mark(stage):
+        boot_marks.append((stage, time.monotonic()))
+
+    mark('import')
+
+    cache = None
+    if fast_boot:
+        import boot_cache
+        cache = boot_cache.load()
+        del boot_cache
+    mark('cache')
+
     npx = setup_neopixels()
-    i2c, found = setup_i2c_attached()
-    sdcard, vfs = setup_sd('/sd')
-    sgp30 = setup_sgp30(i2c) if 'sgp30' in found else None
-    bme280 = setup_bme280(i2c) if 'bme280' in found else None
-    cozir_uart, cozir_warmup_time = setup_cozir(cozir_filter)
-
-    if 'rtc_ds3231' in found:
-        get_timestamp = lambda:rtc_time.get_time_bytearray(i2c)
-    else:
-        get_timestamp = lambda:bytearray(repr(time.monotonic()))
-    del found
+    mark('neopixels')
+
+    # start the CozIR warming up first, since that is the longest wait
+    cozir_uart, cozir_warmup_time = setup_cozir(cozir_filter,
+        set_filter=cache is None or cache[1] != cozir_filter)
+    cozir_uart.write(b'K 2\r\n')
+    cozir_awake = time.monotonic()
+    mark('cozir')
+
+    i2c, found = setup_i2c_attached(None if cache is None else cache[0])
+    mark('i2c')
+    sdcard, vfs = setup_sd('/sd', blink=not fast_boot)
+    mark('sd')
+    try:
+        sgp30 = setup_sgp30(i2c) if 'sgp30' in found else None
+        bme280 = setup_bme280(i2c) if 'bme280' in found else None
+    except OSError:
+        if cache is None:
+            raise
+        print('Cached hardware configuration is out of date, rescanning')
+        cache = None
+        found = scan_i2c(i2c)
+        sgp30 = setup_sgp30(i2c) if 'sgp30' in found else None
+        bme280 = setup_bme280(i2c) if 'bme280' in found else None
+    mark('sensors')
+
+    clock = rtc_clock.RTCClock(i2c if 'rtc_ds3231' in found else None,
+                               rtc_resync_sec)
+    # with fast_boot the first sync doesn't wait for the RTC's second to tick
+    # over; the first resync is then done in the first cycle's CozIR warm-up
+    clock.sync(align=not fast_boot)
+    get_timestamp = clock.timestamp
+    mark('clock')
+    bus = sensor_bus.SensorBus(i2c, bme280 is not None, sgp30 is not None)
 
     if sdcard is None:
         fw = None
-        log_row = lambda x:None
+        log_row = lambda x, flush=True:None
     else:
-        fw = open('/sd/co2.log', 'ab')
-        def log_row(bytearrs):
+        # in a list so rotation can swap the file under log_row
+        fw = [open('/sd/co2.log', 'ab')]
+        def log_row(bytearrs, flush=True):
+            f = fw[0]
             first = True
             for b in bytearrs:
                 if first:
                     first = False
                 else:
-                    fw.write(b' ')
-                fw.write(b)
-            fw.write(b'\n')
-            fw.flush()
-
+                    f.write(b' ')
+                f.write(b)
+            f.write(b'\n')
+            if flush:
+                f.flush()
+
+    calib_bytes = None
+    logged_size = 0
     if bme280 is not None:
         import bme280_calib
-
-        dt = get_timestamp()
         with bme280:
-            tcalibs, pcalibs, hcalibs = bme280_calib.get_calibs(bme280)
-        print('Saving bme280 calib info')
-        for i, tc in enumerate(tcalibs):
-            log_row([dt, bytearray('bme280_calib_t_' + str(i)), bytearray(repr(int(tc)))])
-        for i, pc in enumerate(pcalibs):
-            log_row([dt, bytearray('bme280_calib_p_' + str(i)), bytearray(repr(int(pc)))])
-        for i, hc in enumerate(hcalibs):
-            log_row([dt, bytearray('bme280_calib_h_' + str(i)), bytearray(repr(int(hc)))])
-        del tcalibs, pcalibs, hcalibs
-
+            calib_bytes = bme280_calib.read_calib_bytes(bme280)
         del bme280_calib
         del sys.modules['bme280_calib']
+        log_size = 0 if fw is None else os.stat('/sd/co2.log')[6]
+        if cache is None or cache[3] != calib_bytes or log_size < cache[2]:
+            log_bme280_calibs(bme280, get_timestamp(), log_row, calib_bytes)
+            logged_size = 0 if fw is None else fw[0].tell()
+        else:
+            logged_size = cache[2]
+    mark('bme280_calib')
+
+    if fast_boot:
+        import boot_cache
+        boot_cache.save(found, cozir_filter, logged_size, calib_bytes)
+        del boot_cache
+        mark('cache_save')
+    del found, cache, calib_bytes
+
+    scheduler = None
+    loop_interval = loop_time_sec
+    logged_interval = None
+    if adaptive is not None:
+        from adaptive_interval import AdaptiveInterval
+        scheduler = AdaptiveInterval(adaptive[0], adaptive[1], loop_time_sec)
+
+    ring = supervisor = None
+    if summary is not None:
+        from summary_ring import SummaryRing
+        ring = SummaryRing(summary[0], summary[1],
+                           None if fw is None or clock.i2c is None else '/sd/summary.bin')
+        try:
+            import supervisor
+        except ImportError:
+            print('No supervisor module, so no serial status command')
+    pending = ['']
+    last = [None]  # the last CO2, for the status line
+
+    def on_command(line):
+        if line.strip() == 'status':
+            ring.print_status('uptime={} co2={} log_bytes={}'.format(
+                time.monotonic() - IMPORT_TIME, last[0], 0 if fw is None else fw[0].tell()))
 
     try:
         while True:
@@ -180,13 +360,20 @@ def main_loop(loop_time_sec=60, npx_brightness=.5, cozir_filter=8,
             co2_ppm = None
 
             print('Starting CO2 read cycle')
-            cozir_uart.write(b'K 2\r\n')
-            time.sleep(cozir_warmup_time)
+            if cozir_awake is None:
+                cozir_uart.write(b'K 2\r\n')
+                cozir_awake = time.monotonic()
+            # resyncing can take up to a second, so do it while the CozIR warms up
+            clock_offset = clock.sync() if clock.due() else False
+            sleep_serving(max(cozir_warmup_time - (time.monotonic() - cozir_awake), 0),
+                          on_command, supervisor, pending=pending)
             cozir_uart.reset_input_buffer()
             cozir_uart.write(b'Q\r\n')
             dt = get_timestamp()
             bs = cozir_uart.read(34)
             cozir_uart.write(b'K 0\r\n')  # switch to sleep/no-sampling mode
+            cozir_awake = None
+            cozir_rh = cozir_temp = None
             if bs is None:
                 print('No response from Cozir! not sampling CO2 data this run')
             else:
@@ -195,61 +382,79 @@ def main_loop(loop_time_sec=60, npx_brightness=.5, cozir_filter=8,
                 log_row([dt, bytearray('cozirA_filtered'), bs[19:24]])
                 log_row([dt, bytearray('cozirA_raw'), bs[27:32]])
                 co2_ppm = int(bs[19:24])  # filtered
+                if ring is not None:
+                    cozir_rh = int(bs[4:8]) / 10
+                    cozir_temp = int(bs[13:16]) / 10
                 print('CO2:', co2_ppm, 'ppm')
 
-            if bme280 is not None:
-                with bme280:
-                    setup_bytes = bytearray(1)
-                    bme280.write_then_readinto(bytearray([0xf4]), setup_bytes)
-                    bme280.write(bytearray([0xf4, (setup_bytes[0] & 0b11111100) | 0b1]))
-
-                    # make sure measurement/setup completes
-                    setup_bytes[0] = 1
-                    while (setup_bytes[0] & 0b1001) != 0:
-                        bme280.write_then_readinto(bytearray([0xf3]), setup_bytes)
-
-                    tph_bytes = bytearray(8)
-                    bme280.write_then_readinto(bytearray([0xf7]), tph_bytes)
-                praw = (tph_bytes[2] >> 4) | (tph_bytes[1] << 4) | (tph_bytes[0]<< 12)
-                traw = (tph_bytes[5] >> 4) | (tph_bytes[4] << 4) | (tph_bytes[3]<< 12)
-                hraw = (tph_bytes[7]) | (tph_bytes[6] << 8)
-                log_row([dt, bytearray('bme280_temp_raw'), bytearray(repr(traw))])
-                log_row([dt, bytearray('bme280_pressure_raw'), bytearray(repr(praw))])
-                log_row([dt, bytearray('bme280_humidity_raw'), bytearray(repr(hraw))])
-
-                del praw, traw, hraw, tph_bytes, setup_bytes
-
-
-            if sgp30 is not None:
-                b = bytearray(5)
-                with sgp30:
-                    sgp30.write(bytes([0x20, 0x08]), stop=False)
-                    time.sleep(.05)
-                    sgp30.readinto(b)
-                    #sgp30.write_then_readinto(bytearray([0x20, 0x08]), b)
-
-                dt = get_timestamp()
-                eco2 = (b[0] << 8) + b[1]
-                # no CRC check
-                tvoc = (b[3] << 8) + b[4]
-                print('SGP30 eCO2:', eco2, 'TVOC:', tvoc)
-                log_row([dt, bytearray('sgp30_eco2'), bytearray(repr(eco2))])
-                log_row([dt, bytearray('sgp30_tvoc'), bytearray(repr(tvoc))])
-
+            if scheduler is not None and co2_ppm is not None:
+                loop_interval = scheduler.update(time.monotonic(), co2_ppm)
+                if loop_interval != logged_interval:
+                    log_row([dt, bytearray('loop_interval'), bytearray(repr(loop_interval))])
+                    logged_interval = loop_interval
+
+            if clock_offset is not False:
+                if clock_offset is not None:
+                    log_row([dt, bytearray('clock_offset'), bytearray(repr(clock_offset))], False)
+                    print('Clock was', clock_offset, 's off at resync')
+                log_row([dt, bytearray('clock_drift_ppm'), bytearray(repr(clock.drift*1e6))])
+
+            if boot_marks is not None:
+                mark('first_sample')
+                for i in range(1, len(boot_marks)):
+                    stage, t = boot_marks[i]
+                    log_row([dt, bytearray('boot_' + stage), bytearray(repr(t - boot_marks[i-1][1]))], False)
+                log_row([dt, bytearray('boot_total'), bytearray(repr(boot_marks[-1][1] - IMPORT_TIME))])
+                print('Boot to first sample:', boot_marks[-1][1] - IMPORT_TIME, 's')
+                boot_marks = None
+
+            if bus.bme280 or bus.sgp30:
+                with bus:
+                    wait = bus.start()
+                    dt = get_timestamp()
+                    time.sleep(wait)
+                    tph = bus.read_bme280() if bus.bme280 else None
+                    sgp = bus.read_sgp30() if bus.sgp30 else None
+
+                if tph is not None:
+                    log_row([dt, bytearray('bme280_temp_raw'), bytearray(repr(tph[0]))])
+                    log_row([dt, bytearray('bme280_pressure_raw'), bytearray(repr(tph[1]))])
+                    log_row([dt, bytearray('bme280_humidity_raw'), bytearray(repr(tph[2]))])
+                elif bus.bme280:
+                    print('BME280 measurement did not finish, skipping it this run')
+                if sgp is not None:
+                    print('SGP30 eCO2:', sgp[0], 'TVOC:', sgp[1])
+                    log_row([dt, bytearray('sgp30_eco2'), bytearray(repr(sgp[0]))])
+                    log_row([dt, bytearray('sgp30_tvoc'), bytearray(repr(sgp[1]))])
+                del tph, sgp
+
+            bvolt = None
             if log_battery:
                 bvolt = battery_check_feather.get_battery_voltage()
                 dt = get_timestamp()
                 log_row([dt, bytearray('battery_voltage'), bytearray(repr(bvolt))])
                 print('battery_voltage:', bvolt, 'V')
 
+            if ring is not None:
+                ring.add(clock.seconds(), (co2_ppm, cozir_temp, cozir_rh, bvolt))
+                last[0] = co2_ppm
+
             if co2_ppm is not None:
                 import ppm_to_rgb
                 npx.fill(ppm_to_rgb.ppm_to_rgb(co2_ppm, npx_brightness))
 
+            if (fw is not None and max_log_bytes is not None and
+                fw[0].tell() >= max_log_bytes):
+                fw[0].close()
+                fw[0] = rotate_log('/sd/co2.log')
+                # so each segment can be calibrated on its own
+                if bme280 is not None:
+                    log_bme280_calibs(bme280, get_timestamp(), log_row)
+
             dt = time.monotonic() - st
-            if dt < loop_time_sec:
-                time.sleep(loop_time_sec - dt)
+            if dt < loop_interval:
+                sleep_serving(loop_interval - dt, on_command, supervisor, pending=pending)
 
     finally:
         if fw is not None:
-            fw.close()
+            fw[0].close()
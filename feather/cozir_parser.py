@@ -1,23 +1,44 @@
+import io
 import re
+import itertools
 import sys
+import weakref
 from collections import defaultdict
 
 import numpy as np
-from matplotlib import pyplot as plt
-
-from astropy import table, time
 
 import atmosphere_conversions
+import compute_engine
+import log_segments
+import measurement_types
+import series_join
+import spike_filter
+import value_dtype
 
+# matplotlib and astropy are slow to import (seconds on a raspberry pi), so they
+# are imported inside the functions that need them rather than up here.
 
-def parse_cozir_file(file, start_time=None, end_time=None):
-    if hasattr(file, 'read'):
-        t = table.Table.read(file.read(), format='ascii')
-    else:  # assume name
-        t = table.Table.read(file, format='ascii')
 
-    t.rename_columns(['col1', 'col2', 'col3'],
-                     ['timestamp', 'measurement_type', 'value'])
+def parse_cozir_file(file, start_time=None, end_time=None, filters=None):
+    """
+    Returns an astropy table with 'timestamp', 'measurement_type' and 'value'
+    columns.  The measurement types are also available as small integer codes in
+    the 'type_code' column, indexing into ``t.meta['type_names']``.  If
+    ``file`` is a name, any rotated/compressed segments of it are read too.
+    ``filters`` are as for `read_log_columns`.
+    """
+    from astropy import table, time
+
+    if hasattr(file, 'read'):
+        cols = read_log_columns(file, filters=filters)
+    else:
+        cols = read_log_segments(file, start_time, end_time, filters=filters)
+    names = cols['type_names']
+    t = table.Table({'timestamp': cols['timestamp'],
+                     'measurement_type': np.asarray(names)[cols['type_code']],
+                     'value': cols['value'],
+                     'type_code': cols['type_code']},
+                    meta={'type_names': names})
 
     t['timestamp'] = time.Time(t['timestamp'])
 
@@ -33,67 +54,531 @@ def parse_cozir_file(file, start_time=None, end_time=None):
     return t
 
 
+def _parse_timestamp(tstr, date_cache):
+    """
+    Returns ms since the epoch for the (possibly non-zero-padded) ISO timestamps
+    the feather writes, or None if this is a "seconds since boot" timestamp.
+    """
+    if 'T' not in tstr:
+        return None
+    date, clock = tstr.split('T')
+    day_ms = date_cache.get(date)
+    if day_ms is None:
+        day_ms = date_cache[date] = int(np.datetime64(date, 'ms').astype(np.int64))
+    hr, mn, sec = clock.split(':')
+    return day_ms + (int(hr)*60 + int(mn))*60000 + int(round(float(sec)*1000))
+
+
+def read_log_columns(file, start_time=None, end_time=None, dtype=None,
+                     engine=None, filters=None):
+    """
+    A lightweight alternative to `parse_cozir_file` that needs only numpy.
+    Returns a dictionary of 'timestamp', 'type_code' and 'value' arrays, plus the
+    'type_names' list that the codes index into.  Timestamps are datetime64[ms]
+    if the log has RTC times, otherwise float seconds since boot.  Values are
+    ``dtype``, by default `value_dtype.get_value_dtype`.  Compressed
+    (.gz/.zst) files are decompressed as they are read.  With the numba
+    ``engine`` (see compute_engine.py) logs with RTC times are tokenized by a
+    compiled kernel.  ``filters`` are spike filters to apply to some of the
+    measurement types, as for `spike_filter.filter_columns`.
+    """
+    if dtype is None:
+        dtype = value_dtype.get_value_dtype()
+    cols = None
+    if compute_engine.resolve_engine(engine) == 'numba':
+        if hasattr(file, 'read'):
+            data = file.read()
+        else:  # assume name
+            with log_segments.open_log(file) as f:
+                data = f.buffer.read()  # the kernel wants bytes, so skip decoding
+        cols = _tokenize_jit(data, dtype)
+        if cols is None:
+            file = io.StringIO(data) if isinstance(data, str) else io.TextIOWrapper(io.BytesIO(data))
+    if cols is None:
+        if not hasattr(file, 'read'):  # assume name
+            with log_segments.open_log(file) as f:
+                cols = _tokenize(f, dtype)
+        else:
+            cols = _tokenize(file, dtype)
+
+    cols = _select_time_range(cols, start_time, end_time)
+    if filters:
+        cols = spike_filter.filter_columns(cols, filters, engine)
+
+    return cols
+
+
+def _select_time_range(cols, start_time, end_time):
+    timestamps = cols['timestamp']
+    if timestamps.dtype.kind == 'M':
+        to_time = _to_datetime64
+    else:
+        to_time = float
+    msk = np.ones(len(timestamps), dtype=bool)
+    if start_time is not None:
+        msk &= timestamps >= to_time(start_time)
+    if end_time is not None:
+        msk &= timestamps <= to_time(end_time)
+    if not msk.all():
+        cols = select_rows(cols, msk)
+    return cols
+
+
+def _tokenize(file, dtype):
+    tstrs = []
+    codes = []
+    values = []
+    type_codes = {}
+    for line in file:
+        fields = line.split()
+        if len(fields) != 3:
+            # blank or partially-written (e.g. at power loss) lines
+            continue
+        tstrs.append(fields[0])
+        code = type_codes.get(fields[1])
+        if code is None:
+            code = type_codes[fields[1]] = len(type_codes)
+        codes.append(code)
+        values.append(float(fields[2]))
+
+    # rows in a cycle share timestamps, so only parse each distinct one once
+    parsed = {}
+    date_cache = {}
+    for tstr in tstrs:
+        if tstr not in parsed:
+            parsed[tstr] = _parse_timestamp(tstr, date_cache)
+    is_date = [v is not None for v in parsed.values()]
+    if all(is_date):
+        timestamps = np.array([parsed[s] for s in tstrs], dtype=np.int64).view('datetime64[ms]')
+    elif not any(is_date):
+        timestamps = np.array(tstrs, dtype=float)
+    else:
+        raise ValueError('log mixes RTC timestamps and seconds-since-boot')
+
+    return {'timestamp': timestamps,
+            'type_code': np.array(codes, dtype=measurement_types.code_dtype(len(type_codes))),
+            'value': np.array(values, dtype=dtype),
+            'type_names': list(type_codes)}
+
+
+def _tokenize_jit(data, dtype):
+    """
+    `_tokenize` with the numba kernel, or None for logs it does not handle.
+    """
+    try:
+        buf = data.encode('ascii') if isinstance(data, str) else data
+    except UnicodeEncodeError:
+        return None
+    buf = np.frombuffer(buf, dtype=np.uint8)
+    nrows, ms, codes, values, name_start, name_len, ntypes = \
+        compute_engine.jit_kernels().tokenize_log(buf)
+    if nrows < 0:
+        return None
+    names = [buf[s:s + n].tobytes().decode('ascii')
+             for s, n in zip(name_start[:ntypes], name_len[:ntypes])]
+    return {'timestamp': ms[:nrows].view('datetime64[ms]'),
+            'type_code': codes[:nrows].astype(measurement_types.code_dtype(ntypes)),
+            'value': values[:nrows].astype(dtype),
+            'type_names': names}
+
+
+def _first_timestamp(fn):
+    """
+    The first timestamp in a log file (ms since the epoch or seconds since boot)
+    """
+    with log_segments.open_log(fn) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 3:
+                t = _parse_timestamp(fields[0], {})
+                return float(fields[0]) if t is None else t
+    return None
+
+
+def _to_datetime64(t):
+    """
+    A time bound as datetime64[ms]: ``t`` can be anything np.datetime64 takes
+    (an ISO string, datetime or datetime64), or an astropy Time.
+    """
+    if hasattr(t, 'isot'):  # astropy Time, without importing astropy
+        t = t.utc.isot
+    return np.datetime64(t, 'ms')
+
+
+def _to_segment_time(t):
+    if t is None:
+        return None
+    if isinstance(t, (str, int, float, np.number)):
+        try:
+            return float(t)
+        except ValueError:
+            pass
+    return int(_to_datetime64(t).astype(np.int64))
+
+
+def _is_monitor_log(path):
+    """
+    Whether ``path`` is a log file in the format ``cozir_mon_pi.py`` writes: the
+    CozIR's own output lines between ``dt:`` (or the older ``deltat:``) lines.
+    """
+    import os
+
+    if not os.path.isfile(path):
+        return False
+    with log_segments.open_log(path) as f:
+        for line in f:
+            if line.strip():
+                return line.startswith(('dt:', 'deltat:'))
+    return False
+
+
+def _read_monitor_log(path, dtype):
+    import os
+
+    pi_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pi')
+    if pi_dir not in sys.path:
+        sys.path.append(pi_dir)
+    import cozir_parser_pi
+
+    cols = cozir_parser_pi.to_columns(cozir_parser_pi.parse_cozir_file(path))
+    cols['value'] = cols['value'].astype(dtype)
+    return cols
+
+
+def read_log_segments(path, start_time=None, end_time=None, processes=None,
+                      dtype=None, engine=None, filters=None):
+    """
+    Reads all the (rotated, possibly compressed) segments of the log ``path``
+    (see `log_segments.find_segments`) into one set of columns like
+    `read_log_columns`.  Segments entirely outside the time range are skipped
+    without being parsed, and the rest are parsed in parallel in ``processes``
+    worker processes (default: one per CPU, 1 to not use a pool).  The
+    ``filters`` are applied once they are joined, so their windows span the
+    segment boundaries.
+
+    Logs in the format ``cozir_mon_pi.py`` writes (like
+    example_feather_data.log) are read with ``pi/cozir_parser_pi.py`` instead.
+    """
+    if dtype is None:
+        dtype = value_dtype.get_value_dtype()
+    engine = compute_engine.resolve_engine(engine)
+    if _is_monitor_log(path):
+        cols = _read_monitor_log(path, dtype)
+        cols = _select_time_range(cols, start_time, end_time)
+        if filters:
+            cols = spike_filter.filter_columns(cols, filters, engine)
+        return cols
+
+    segments = log_segments.select_segments(log_segments.find_segments(path),
+                                            _first_timestamp,
+                                            _to_segment_time(start_time),
+                                            _to_segment_time(end_time))
+    if not segments:
+        raise IOError(f'no log segments found for {path}')
+
+    # dtype and engine are resolved above, since the workers need not share
+    # this process's settings
+    if processes == 1 or len(segments) == 1:
+        parts = [read_log_columns(fn, start_time, end_time, dtype, engine) for fn in segments]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(processes) as pool:
+            parts = list(pool.map(read_log_columns, segments,
+                                  [start_time]*len(segments),
+                                  [end_time]*len(segments),
+                                  [dtype]*len(segments),
+                                  [engine]*len(segments)))
+    cols = concat_columns(parts)
+    if filters:
+        cols = spike_filter.filter_columns(cols, filters, engine)
+    return cols
+
+
+def follow_log(fn, poll_interval=1., from_start=True):
+    """
+    Yields ``(timestamp, measurement_type, value)`` for each line of the log
+    ``fn`` (like ``tail -f``), waiting for more lines as the monitor writes them
+    and re-opening the file when it is rotated.  Timestamps are datetime64[ms]
+    for RTC times, float seconds since boot otherwise.  Never returns.
+    """
+    import os
+    import time
+
+    date_cache = {}
+    f = open(fn, 'r')
+    if not from_start:
+        f.seek(0, os.SEEK_END)
+    partial = ''
+    try:
+        while True:
+            line = f.readline()
+            if not line:
+                try:
+                    rotated = os.stat(fn).st_ino != os.fstat(f.fileno()).st_ino
+                except FileNotFoundError:  # between the rename and the new file
+                    rotated = False
+                if rotated:
+                    f.close()
+                    f = open(fn, 'r')
+                    partial = ''
+                else:
+                    time.sleep(poll_interval)
+                continue
+            if not line.endswith('\n'):
+                partial += line
+                continue
+            line, partial = partial + line, ''
+
+            fields = line.split()
+            if len(fields) != 3:
+                continue
+            ms = _parse_timestamp(fields[0], date_cache)
+            t = float(fields[0]) if ms is None else np.datetime64(ms, 'ms')
+            yield t, fields[1], float(fields[2])
+    finally:
+        f.close()
+
+
+def concat_columns(parts):
+    """
+    Concatenates several sets of columns, merging their type dictionaries.
+    """
+    type_names = []
+    for part in parts:
+        type_names.extend(nm for nm in part['type_names'] if nm not in type_names)
+
+    codes = []
+    for part in parts:
+        # maps this part's codes to the merged ones
+        lut = np.array([type_names.index(nm) for nm in part['type_names']], dtype=np.intp)
+        codes.append(lut[part['type_code']] if len(lut) else part['type_code'])
+
+    return {'timestamp': np.concatenate([part['timestamp'] for part in parts]),
+            'type_code': np.concatenate(codes).astype(measurement_types.code_dtype(len(type_names))),
+            'value': np.concatenate([part['value'] for part in parts]),
+            'type_names': type_names}
+
+
+def select_rows(cols, rows):
+    """
+    Indexes all of the row arrays in ``cols`` (as output by `read_log_columns`).
+    """
+    return {k: (v if k == 'type_names' else v[rows]) for k, v in cols.items()}
+
+
+def split_columns(cols):
+    """
+    Partitions ``cols`` into a dictionary mapping type name to
+    ``(timestamps, values)`` in a single pass over the type codes.
+    """
+    return measurement_types.partition_by_type(cols['type_code'], cols['type_names'],
+                                               cols['timestamp'], cols['value'])
+
+
+def logged_intervals(cols, timestamps):
+    """
+    The time between cycles (seconds) the feather was using at each of
+    ``timestamps``, from the ``loop_interval`` rows it logs when adaptive
+    sampling changes the interval.  NaN before the first such row, or for logs
+    taken with a fixed interval.
+    """
+    code = cols['type_names'].index('loop_interval') if 'loop_interval' in cols['type_names'] else -1
+    msk = cols['type_code'] == code
+    return series_join.asof_join(timestamps, cols['timestamp'][msk], cols['value'][msk],
+                                 direction='backward')
+
+
+def calibrate_bme280_columns(cols, engine=None):
+    """
+    Replaces the raw bme280 measurements in ``cols`` (as output by
+    `read_log_columns`) with calibrated ones and drops the calibration rows.
+    Returns ``cols`` unchanged if no calibration is present.
+    """
+    names = cols['type_names']
+    codes = cols['type_code']
+    try:
+        bmecalib = BME280_calibrator.coeffs_from_series(
+            {nm: vals for nm, (_, vals) in split_columns(cols).items()},
+            engine=engine)
+    except ValueError:
+        return cols
+
+    values = cols['value'].copy()
+    newnames = list(names)
+    for nm in ['temp', 'pressure', 'humidity']:
+        rawname = f'bme280_{nm}_raw'
+        if rawname in names:
+            msk = codes == names.index(rawname)
+            values[msk] = getattr(bmecalib, 'calibrate_' + nm)(values[msk])
+            # the codes stay the same, only the name changes
+            newnames[names.index(rawname)] = 'bme280_' + nm
+
+    keepmsk = ~measurement_types.type_lookup(names, lambda nm: nm.startswith('bme280_calib'))[codes]
+    return {'timestamp': cols['timestamp'][keepmsk],
+            'type_code': codes[keepmsk],
+            'value': values[keepmsk],
+            'type_names': newnames}
+
+
+def compute_window_mask(timestamps, window_hours):
+    """
+    Selects the samples within ``window_hours`` of the latest one.
+    """
+    if timestamps.dtype.kind == 'M':
+        window = np.timedelta64(int(window_hours*3600000), 'ms')
+    else:
+        window = window_hours*3600
+    return timestamps >= timestamps.max() - window
+
+
+def compute_stats(cols, window_hours=None):
+    """
+    Returns a dictionary mapping measurement type to a dictionary with the
+    latest timestamp and value and the number/min/mean/max of values. If
+    ``window_hours`` is given, only that many hours before the latest sample
+    are included.
+    """
+    timestamps = cols['timestamp']
+    if window_hours is not None and len(timestamps) > 0:
+        cols = select_rows(cols, compute_window_mask(timestamps, window_hours))
+
+    stats = {}
+    for mtype, (ts, vals) in sorted(split_columns(cols).items()):
+        latest = np.argmax(ts)
+        stats[mtype] = {'latest_time': ts[latest], 'latest': vals[latest],
+                        'n': len(vals), 'min': vals.min(),
+                        'mean': vals.mean(dtype=np.float64), 'max': vals.max()}
+    return stats
+
+
+def print_stats(stats, file=None):
+    print(f'{"measurement_type":<22}{"latest_time":>25}{"latest":>11}{"n":>8}'
+          f'{"min":>11}{"mean":>11}{"max":>11}', file=file)
+    for mtype, st in stats.items():
+        print(f'{mtype:<22}{str(st["latest_time"]):>25}{st["latest"]:>11.5g}'
+              f'{st["n"]:>8}{st["min"]:>11.5g}{st["mean"]:>11.5g}'
+              f'{st["max"]:>11.5g}', file=file)
+
+
+def print_exposure(summary, file=None):
+    for mtype, res in summary.items():
+        above = ', '.join(f'>{thr}: {hrs:.2f} h' for thr, hrs in res['hours_above'].items())
+        twas = ', '.join(f'{whr} h: {twa:.0f}' if np.isfinite(twa) else f'{whr} h: n/a'
+                         for whr, twa in res['max_twa'].items())
+        print(f'{mtype:<22}time above {above}; max time-weighted avg {twas}', file=file)
+        if 'daily_peaks' in res:
+            for day, peak, peak_time in zip(*res['daily_peaks']):
+                print(f'{"":<22}{day} peak {peak:.0f} at {peak_time}', file=file)
+
+
+# map of "known" measurement names to their type for grouping
+PLOT_TYPES = {'cozirA_filtered': 'co2',
+              'cozirA_raw': 'co2',
+              'sgp30_eco2': 'co2',
+              'bme280_temp': 'temperature',
+              'cozirA_temperature': 'temperature',
+              'bme280_pressure': 'pressure',
+              'bme280_humidity': 'humidity',
+              'cozirA_humidity': 'humidity'}
+
+# the temperature measured by the same sensor as each humidity
+HUMIDITY_TEMPERATURES = {'bme280_humidity': 'bme280_temp',
+                         'cozirA_humidity': 'cozirA_temperature'}
+
+
 def plot_cozir_data(tab, outfilename=None, width=10, heightperplot=5,
                     include_types=None, exclude_types=None,
-                    humidity_unit='rel', temp_unit='c'):
+                    humidity_unit='rel', temp_unit='c', join_tolerance_sec=300,
+                    fig=None):
+    """
+    ``tab`` is a table from `parse_cozir_file`, or columns from
+    `read_log_columns` (with RTC timestamps), which avoids needing astropy.
+
+    For dewpoint or absolute humidity, each humidity sample is paired with the
+    nearest-in-time temperature from the same sensor (or any temperature if that
+    sensor has none), within ``join_tolerance_sec``.
+
+    Returns the figure.  Passing a previously returned one as ``fig`` draws
+    into it again (reusing its axes if the number of plots is the same), which
+    is much faster than making a new figure for each of many plots.
+    """
+    from matplotlib import pyplot as plt
+
     if include_types is not None and exclude_types is not None:
         raise ValueError('at least one of include_types and exclude_types must '
                          'be None')
 
+    # split the table into individual measurements in one pass over the type
+    # codes, and then put the individual time series into sets based on the
+    # physical type of the measurement
+    if isinstance(tab, dict):
+        from matplotlib import dates
+
+        codes, type_names = tab['type_code'], tab['type_names']
+        plot_dates = dates.date2num(tab['timestamp'])
+    else:
+        if 'type_code' in tab.colnames:
+            codes, type_names = tab['type_code'], tab.meta['type_names']
+        else:
+            codes, type_names = measurement_types.encode_types(tab['measurement_type'])
+        plot_dates = tab['timestamp'].plot_date
+    all_series = measurement_types.partition_by_type(codes, type_names, plot_dates,
+                                                     np.asarray(tab['value'], dtype=float))
+
     try:
-        bmecalib = BME280_calibrator.coeffs_from_table(tab)
+        bmecalib = BME280_calibrator.coeffs_from_series(
+            {nm: vals for nm, (_, vals) in all_series.items()})
     except ValueError:
         bmecalib = None
     if bmecalib is not None:
         # assume both raw measurements *and* calibs are present if cals are ok.
-        calib_tabs = {}
+        # temp goes first to set t_fine
         for nm in ['temp', 'pressure', 'humidity']:
-            calib_tabs[nm] = nmtab = tab[tab['measurement_type'] == f'bme280_{nm}_raw']
-            nmcalib = getattr(bmecalib, 'calibrate_' + nm)(nmtab['value'])
-            nmtab['value'][:] = nmcalib
-            nmtab['measurement_type'][:] = 'bme280_' + nm
-
-        # now identify the raw/calib rows and remove them
-        skipmsk = np.ones(len(tab), dtype=bool)
-        for mtype in np.unique(tab['measurement_type']):
-            if mtype.startswith('bme280_calib'):
-                skipmsk &= tab['measurement_type']!=mtype
-            elif mtype.startswith('bme280_') and mtype.endswith('_raw'):
-                skipmsk &= tab['measurement_type']!=mtype
-
-        # now drop the raws and add back in the calibrated measurements
-        tab = table.vstack([tab[skipmsk], calib_tabs['temp'],
-                                          calib_tabs['pressure'],
-                                          calib_tabs['humidity']])
-
-    # group the table into individual measurements, and then put the individual
-    # time series into sets based on the physical type of the measurement
-    grped_tab = tab.group_by('measurement_type')
-
-    # map of "known" measurement names to their type for grouping
-    plot_types = {'cozirA_filtered': 'co2',
-                  'cozirA_raw': 'co2',
-                  'sgp30_eco2': 'co2',
-                  'bme280_temp': 'temperature',
-                  'cozirA_temperature': 'temperature',
-                  'bme280_pressure': 'pressure',
-                  'bme280_humidity': 'humidity',
-                  'cozirA_humidity': 'humidity'}
+            if f'bme280_{nm}_raw' not in all_series:
+                continue
+            x, rawvals = all_series.pop(f'bme280_{nm}_raw')
+            all_series['bme280_' + nm] = (x, getattr(bmecalib, 'calibrate_' + nm)(rawvals))
+        for nm in list(all_series):
+            if nm.startswith('bme280_calib'):
+                del all_series[nm]
+    # boot timing, clock diagnostics and adaptive loop intervals from the
+    # firmware (see the stats command for them)
+    for nm in list(all_series):
+        if nm.startswith(('boot_', 'clock_')) or nm == 'loop_interval':
+            del all_series[nm]
+
+    plot_types = PLOT_TYPES
+    humidity_temperatures = HUMIDITY_TEMPERATURES
 
     plot_groups = defaultdict(list)  # keys are plot types, values are lists of (x, y, name) tuples
-    for grp in grped_tab.groups:
-        type_name = grp['measurement_type'][0]
+    for type_name, (x, y) in sorted(all_series.items()):
         if include_types is not None and type_name not in include_types:
             continue
         if exclude_types is not None and type_name in exclude_types:
             continue
 
         plot_type = plot_types.get(type_name, type_name)
-        plot_groups[plot_type].append((grp['timestamp'].plot_date, grp['value'], type_name))
+        plot_groups[plot_type].append((x, y, type_name))
 
-    ccycle = iter(plt.rcParams['axes.prop_cycle'].by_key()['color'])
+    ccycle = itertools.cycle(plt.rcParams['axes.prop_cycle'].by_key()['color'])
     height = len(plot_groups) * heightperplot
-    fig, axs = plt.subplots(len(plot_groups), 1, figsize=(width, height))
+    if fig is None:
+        fig, axs = plt.subplots(len(plot_groups), 1, figsize=(width, height), squeeze=False)
+        axs = list(axs.ravel())
+    else:
+        fig.set_size_inches(width, height)
+        axs = _figure_axes.get(fig)
+        if axs is not None and len(axs) == len(plot_groups):
+            for ax in fig.axes:
+                if ax not in axs:  # the pressure plot's second y axis
+                    ax.remove()
+            for ax in axs:
+                ax.clear()
+        else:
+            fig.clear()
+            axs = list(fig.subplots(len(plot_groups), 1, squeeze=False).ravel())
+    _figure_axes[fig] = axs
 
     # define some transformations for particular plot types:
     y_transforms = defaultdict(lambda: lambda x: x)
@@ -106,22 +591,22 @@ def plot_cozir_data(tab, outfilename=None, width=10, heightperplot=5,
     else:
         raise ValueError(f'invalid temperature unit {temp_unit}')
 
-    if humidity_unit == 'dewpoint':
-        t = plot_groups['temperature'][0][1]
-        def dptrans(rh):
-            return atmosphere_conversions.hum_rel_to_dewpoint(rh/100, t)
-        y_transforms['humidity'] = lambda x: y_transforms['temperature'](dptrans(x))
-    elif humidity_unit == 'abs':
-        t = plot_groups['temperature'][0][1]
-        def abshumtrans(rh):
-            return atmosphere_conversions.hum_rel_to_abs(rh/100, t)
-        y_transforms['humidity'] = abshumtrans
+    if humidity_unit in ('dewpoint', 'abs'):
+        if 'humidity' in plot_groups:
+            plot_groups['humidity'] = _derive_humidities(plot_groups['humidity'],
+                                                         all_series, humidity_unit,
+                                                         humidity_temperatures,
+                                                         plot_types,
+                                                         join_tolerance_sec/86400.)
+        if humidity_unit == 'dewpoint':
+            # dewpoints come out in C
+            y_transforms['humidity'] = lambda x: y_transforms['temperature'](x)
     elif humidity_unit == 'rel':
         pass
     else:
         raise ValueError(f'invalid humidity unit {humidity_unit}')
 
-    for grpname, grpvals, ax in zip(plot_groups.keys(), plot_groups.values(), axs.ravel()):
+    for grpname, grpvals, ax in zip(plot_groups.keys(), plot_groups.values(), axs):
         for val in grpvals:
             ax.plot_date(val[0], y_transforms[grpname](val[1]), color=next(ccycle), label=val[2], fmt='-')
         ax.set_xlabel('date')
@@ -158,26 +643,81 @@ def plot_cozir_data(tab, outfilename=None, width=10, heightperplot=5,
 
     if outfilename is not None:
         if outfilename == '-':
-            plt.savefig(sys.stdout.buffer)
+            fig.savefig(sys.stdout.buffer)
         else:
-            plt.savefig(outfilename)
+            fig.savefig(outfilename)
+    return fig
+
+
+# the plot axes of figures returned by plot_cozir_data, to reuse them
+_figure_axes = weakref.WeakKeyDictionary()
+
+
+def _derive_humidities(humidity_series, all_series, humidity_unit,
+                       humidity_temperatures, plot_types, tolerance):
+    """
+    Converts the (x, relative humidity, name) ``humidity_series`` to dewpoint (C)
+    or absolute humidity using as-of-joined temperatures.
+    """
+    temperatures = {nm: s for nm, s in all_series.items()
+                    if plot_types.get(nm) == 'temperature'}
+    if not temperatures:
+        raise ValueError('need a temperature measurement to compute '
+                         f'{humidity_unit} humidity')
+
+    derived = []
+    for x, rh, type_name in humidity_series:
+        tx, ty = temperatures.get(humidity_temperatures.get(type_name),
+                                  next(iter(temperatures.values())))
+        t = series_join.asof_join(x, tx, ty, tolerance=tolerance)
+        if humidity_unit == 'dewpoint':
+            y = atmosphere_conversions.hum_rel_to_dewpoint(rh/100, t)
+        else:
+            y = atmosphere_conversions.hum_rel_to_abs(rh/100, t)
+        derived.append((x, y, type_name))
+    return derived
 
 
 class BME280_calibrator:
     """
     Note that temp *must* be calculated before pressure/humidity to set the t_fine
     correctly
+
+    The formulas are computed in float64 whatever the input, and the results
+    are ``dtype`` (default: `value_dtype.get_value_dtype` at the time).
+    ``engine`` picks numpy or the numba kernels (default:
+    `compute_engine.get_engine` at the time).
     """
-    def __init__(self, t_calib, p_calib, h_calib):
+    def __init__(self, t_calib, p_calib, h_calib, dtype=None, engine=None):
         self.t_calib = t_calib
         self.p_calib = p_calib
         self.h_calib = h_calib
+        self.dtype = dtype
+        self.engine = engine
         self.t_fine = None
 
+    def _result(self, x):
+        dtype = value_dtype.get_value_dtype() if self.dtype is None else self.dtype
+        return np.asarray(x).astype(dtype, copy=False)
+
     @classmethod
     def coeffs_from_table(cls, tab, which=-1):
-        calib_meas_names = [(t, t[-3], int(t[-1])) for t in
-                            np.unique(tab['measurement_type']) if
+        if 'type_code' in tab.colnames:
+            codes, type_names = tab['type_code'], tab.meta['type_names']
+        else:
+            codes, type_names = measurement_types.encode_types(tab['measurement_type'])
+        series = measurement_types.partition_by_type(codes, type_names,
+                                                     np.asarray(tab['value']))
+        return cls.coeffs_from_series({nm: vals for nm, (vals,) in series.items()},
+                                      which)
+
+    @classmethod
+    def coeffs_from_series(cls, series, which=-1, **kwargs):
+        """
+        ``series`` maps measurement type names to arrays of values.  ``kwargs``
+        are passed on to the constructor.
+        """
+        calib_meas_names = [(t, t[-3], int(t[-1])) for t in series if
                             t.startswith('bme280_calib')]
 
         calib_coeffs = []
@@ -185,7 +725,7 @@ class BME280_calibrator:
             calib_num_to_name = {i: nm for nm,t,i in calib_meas_names if
                                            t == calib_type}
             calib_meas_name = [calib_num_to_name[k] for k in sorted(calib_num_to_name.keys())]
-            calib_coeffs.append([tab[tab['measurement_type']==n][which]['value'] for n in calib_meas_name])
+            calib_coeffs.append([series[n][which] for n in calib_meas_name])
 
         if len(calib_coeffs[0]) < 3:
             raise ValueError('could not find all temp calib coeffs')
@@ -194,9 +734,30 @@ class BME280_calibrator:
         if len(calib_coeffs[2]) < 6:
             raise ValueError('could not find all humidity calib coeffs')
 
-        return cls(*calib_coeffs)
+        return cls(*calib_coeffs, **kwargs)
 
 
+    def _run_kernel(self, name, raw, calib):
+        """
+        Runs the numba kernel ``name`` on ``raw`` and returns the result, also
+        setting `t_fine` for the temperature.
+        """
+        shape = np.shape(raw)
+        raw = np.ascontiguousarray(raw).reshape(-1)
+        out = np.empty(raw.shape, np.float64)
+        calib = np.asarray(calib, np.float64)
+        kernel = getattr(compute_engine.jit_kernels(), name)
+        if name == 'bme280_temp':
+            t_fine = np.empty(raw.shape, np.float64)
+            kernel(raw, calib, t_fine, out)
+            self.t_fine = t_fine.reshape(shape)
+        else:
+            # as numpy would broadcast it against ``raw``
+            t_fine = np.ascontiguousarray(np.broadcast_to(self.t_fine, shape),
+                                          dtype=np.float64).reshape(-1)
+            kernel(raw, t_fine, calib, out)
+        return self._result(out.reshape(shape))
+
     def _set_t_fine(self, traw):
         var1 = (traw/16384.0 - (self.t_calib[0])/1024.0) * (self.t_calib[1])
         var2 = ((traw/131072.0 - (self.t_calib[0])/8192.0) * (traw/131072.0 - (self.t_calib[0])/8192.0)) * (self.t_calib[2])
@@ -206,13 +767,18 @@ class BME280_calibrator:
         """
         Returns temperature in deg C
         """
-        self._set_t_fine(traw)
-        return np.clip(self.t_fine / 5120.0, -273.15, None)
+        if compute_engine.resolve_engine(self.engine) == 'numba':
+            return self._run_kernel('bme280_temp', traw, self.t_calib)
+        self._set_t_fine(np.asarray(traw, dtype=np.float64))
+        return self._result(np.clip(self.t_fine / 5120.0, -273.15, None))
 
     def calibrate_pressure(self, praw):
         """
         Returns pressure in Pa
         """
+        if compute_engine.resolve_engine(self.engine) == 'numba':
+            return self._run_kernel('bme280_pressure', praw, self.p_calib)
+
         var1 = self.t_fine/2.0 - 64000.0
         var2 = var1 * var1 * self.p_calib[5] / 32768.0
         var2 = var2 + var1 * self.p_calib[4] * 2.0
@@ -220,22 +786,26 @@ class BME280_calibrator:
         var1 = (self.p_calib[2] * var1 * var1 / 524288.0 + self.p_calib[1] * var1) / 524288.0
         var1 = (1.0 + var1 / 32768.0)*self.p_calib[0]
 
-        p = 1048576.0 - praw
+        p = 1048576.0 - np.asarray(praw, dtype=np.float64)
         p = (p - (var2 / 4096.0)) * 6250.0 / var1
         var1 = (self.p_calib[8]) * p * p / 2147483648.0
         var2 = p * (self.p_calib[7]) / 32768.0
         p = p + (var1 + var2 + (self.p_calib[6])) / 16.0
-        return np.clip(p, 0, None)
+        return self._result(np.clip(p, 0, None))
 
     def calibrate_humidity(self, hraw):
         """
         Returns humidity in RH (%)
         """
+        if compute_engine.resolve_engine(self.engine) == 'numba':
+            return self._run_kernel('bme280_humidity', hraw, self.h_calib)
+
         var_H = self.t_fine - 76800.0
+        hraw = np.asarray(hraw, dtype=np.float64)
         var_H = (hraw - (self.h_calib[3] * 64.0 + self.h_calib[4] / 16384.0 * var_H)) * (self.h_calib[1] / 65536.0 * (1.0 + self.h_calib[5] / 67108864.0 * var_H * (1.0 + self.h_calib[2] / 67108864.0 * var_H)))
         var_H = var_H * (1.0 - self.h_calib[0] * var_H / 524288.0)
 
-        return np.clip(var_H, 0, 100)
+        return self._result(np.clip(var_H, 0, 100))
 
     def calibrate_table(self, tab, measurement_types={'temp(C)': 'bme280_temp_raw',
                                                       'pressure(Pa)': 'bme280_pressure_raw',
@@ -264,13 +834,69 @@ class BME280_calibrator:
         return calibed
 
 
+def _stats_main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='cozir_parser.py stats',
+                                     description='Print the latest value and '
+                                     'min/mean/max of each measurement type. '
+                                     'Does not need matplotlib or astropy.')
+    parser.add_argument('input_file', help='file to parse or "-" for stdin')
+    parser.add_argument('--start-time', default=None, help='A timestamp for the earliest data point to use.')
+    parser.add_argument('--end-time', default=None, help='A timestamp for the latest data point to use.')
+    parser.add_argument('-w', '--window', type=float, default=None, help='Only use this many hours before the latest data point.')
+    parser.add_argument('--raw-bme280', action='store_true', help='Do not calibrate the bme280 measurements')
+    parser.add_argument('--float32', action='store_true', help='Store values as float32 (see value_dtype.py)')
+    parser.add_argument('--engine', choices=compute_engine.ENGINES, default=None, help='Compute with numpy or numba (see compute_engine.py)')
+    parser.add_argument('-e', '--exposure', action='store_true', help='Also print CO2 time above thresholds and time-weighted averages')
+    parser.add_argument('--filter', default=None, type=spike_filter.parse_filters, help='Spike filters to apply, e.g. "cozirA_raw=hampel:600" or "default" (see spike_filter.py)')
+
+    args = parser.parse_args(argv)
+    if args.float32:
+        value_dtype.set_value_dtype('float32')
+    if args.engine is not None:
+        compute_engine.set_engine(args.engine)
+
+    parsekwargs = dict(start_time=args.start_time, end_time=args.end_time,
+                       filters=args.filter)
+    if args.input_file == '-':
+        cols = read_log_columns(sys.stdin, **parsekwargs)
+    else:
+        cols = read_log_segments(args.input_file, **parsekwargs)
+    if not args.raw_bme280:
+        cols = calibrate_bme280_columns(cols)
+
+    print_stats(compute_stats(cols, window_hours=args.window))
+
+    if args.exposure:
+        import exposure_analytics
+
+        if args.window is not None and len(cols['timestamp']) > 0:
+            cols = select_rows(cols, compute_window_mask(cols['timestamp'], args.window))
+        print()
+        print_exposure(exposure_analytics.exposure_summary(cols))
+
+
 if __name__ == '__main__':
     import sys
     import argparse
 
-    parser = argparse.ArgumentParser()
+    if len(sys.argv) > 1 and sys.argv[1] == 'stats':
+        _stats_main(sys.argv[2:])
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'report':
+        import batch_report
+
+        batch_report.main(sys.argv[2:])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(epilog='Use "%(prog)s stats -h" for the '
+                                            'plot-free statistics command, and '
+                                            '"%(prog)s report -h" for daily plots '
+                                            'of many logs.')
     parser.add_argument('input_file', help='file to parse and plot or "-" for stdin')
-    parser.add_argument('output_name', nargs='?', help='filename to save the plot to', default=None)
+    parser.add_argument('output_name', nargs='?', default=None,
+                        help='filename to save the plot to; a .html one is a zoomable plot (see html_plot.py)')
     parser.add_argument('--start-time', default=None, help='A timestamp for the earliest data point to use.')
     parser.add_argument('--end-time', default=None, help='A timestamp for the latest data point to use.')
     parser.add_argument('--include', default=None, help='A comma-separated list of measurement types to include')
@@ -278,11 +904,26 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--dewpoint', action='store_true', help='Show the dewpoint instead of relative humidity')
     parser.add_argument('-a', '--absolute-humidity', action='store_true', help='Show the absolute instead of relative humidity')
     parser.add_argument('-f', '--farenheit', action='store_true', help='Set temperature unit to farenheit')
+    parser.add_argument('--float32', action='store_true', help='Store values as float32 (see value_dtype.py)')
+    parser.add_argument('--engine', choices=compute_engine.ENGINES, default=None, help='Compute with numpy or numba (see compute_engine.py)')
+    parser.add_argument('--filter', default=None, type=spike_filter.parse_filters, help='Spike filters to apply, e.g. "cozirA_raw=hampel:600" or "default" (see spike_filter.py)')
 
     args = parser.parse_args()
-
-    parsekwargs = dict(start_time=args.start_time, end_time=args.end_time)
-    if args.input_file == '-':
+    if args.float32:
+        value_dtype.set_value_dtype('float32')
+    if args.engine is not None:
+        compute_engine.set_engine(args.engine)
+
+    html = args.output_name is not None and args.output_name.endswith('.html')
+    parsekwargs = dict(start_time=args.start_time, end_time=args.end_time,
+                       filters=args.filter)
+    if html:
+        # the html plot only needs the columns
+        if args.input_file == '-':
+            data_table = read_log_columns(sys.stdin, **parsekwargs)
+        else:
+            data_table = read_log_segments(args.input_file, **parsekwargs)
+    elif args.input_file == '-':
         data_table = parse_cozir_file(sys.stdin, **parsekwargs)
     else:
         data_table = parse_cozir_file(args.input_file, **parsekwargs)
@@ -300,9 +941,17 @@ if __name__ == '__main__':
     elif args.absolute_humidity:
         humidity_unit = 'abs'
 
-
-    plot_cozir_data(data_table, outfilename=args.output_name,
-                    temp_unit='f' if args.farenheit else 'c',
-                    humidity_unit=humidity_unit,
-                    include_types=None if args.include is None else args.include.split(','),
-                    exclude_types=None if args.exclude is None else args.exclude.split(','))
+    plot_kwargs = dict(temp_unit='f' if args.farenheit else 'c',
+                       humidity_unit=humidity_unit,
+                       include_types=None if args.include is None else args.include.split(','),
+                       exclude_types=None if args.exclude is None else args.exclude.split(','))
+    if html:
+        import html_plot
+
+        stats = html_plot.write_html_plot(data_table, args.output_name, **plot_kwargs)
+        print(f'Wrote {stats["series"]} series in {stats["tiles"]} tiles over '
+              f'{stats["levels"]} zoom levels ({stats["bytes"]/2**20:.1f} MiB).  To zoom '
+              'past the first levels, serve its directory, e.g. with '
+              '"python -m http.server", and open it from there.')
+    else:
+        plot_cozir_data(data_table, outfilename=args.output_name, **plot_kwargs)
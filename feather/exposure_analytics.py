@@ -0,0 +1,186 @@
+"""
+Functions for computing CO2 exposure metrics (time above thresholds,
+time-weighted averages, daily peaks) from irregularly-sampled series.
+
+Each sample is treated as holding its value until the next sample, up to
+``max_gap_sec`` (so that the monitor being off does not count as exposure).
+Everything is done with cumulative sums and binary searches over the sorted
+timestamps, so the cost is linear(ish) in the number of samples.
+"""
+
+import numpy as np
+
+import measurement_types
+
+__all__ = ['CO2_TYPES', 'CO2_THRESHOLDS', 'time_above_thresholds',
+           'rolling_time_weighted_mean', 'daily_peaks', 'exposure_summary']
+
+CO2_TYPES = ('cozirA_filtered', 'cozirA_raw', 'sgp30_eco2')
+# same thresholds as the lines in cozir_parser.plot_cozir_data
+CO2_THRESHOLDS = (1000, 1500, 2000)
+
+
+def _to_seconds(timestamps):
+    """
+    datetime64 -> float seconds since the epoch.  Floats are assumed to already
+    be seconds (i.e. seconds-since-boot logs without an RTC).
+    """
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind == 'M':
+        return timestamps.astype('datetime64[ms]').astype(np.int64) / 1000.
+    return timestamps.astype(float)
+
+
+def _sorted_series(timestamps, values):
+    secs = _to_seconds(timestamps)
+    values = np.asarray(values, dtype=float)
+    if len(secs) > 1 and np.any(secs[1:] < secs[:-1]):
+        order = np.argsort(secs, kind='stable')
+        return secs[order], values[order], order
+    return secs, values, None
+
+
+def _hold_durations(secs, max_gap_sec):
+    """
+    How long each sample's value is taken to hold.  The last sample holds for 0.
+    """
+    dt = np.empty_like(secs)
+    dt[:-1] = np.diff(secs)
+    dt[-1:] = 0
+    if max_gap_sec is not None:
+        np.minimum(dt, max_gap_sec, out=dt)
+    return dt
+
+
+def time_above_thresholds(timestamps, values, thresholds=CO2_THRESHOLDS,
+                          max_gap_sec=600):
+    """
+    Returns an array with the number of seconds the series spent above each of
+    ``thresholds``.
+    """
+    secs, values, _ = _sorted_series(timestamps, values)
+    thresholds = np.asarray(thresholds, dtype=float)
+    if len(secs) == 0:
+        return np.zeros(thresholds.shape)
+
+    dt = _hold_durations(secs, max_gap_sec)
+    return (dt[:, None] * (values[:, None] > thresholds[None, :])).sum(axis=0)
+
+
+def rolling_time_weighted_mean(timestamps, values, window_sec, max_gap_sec=600,
+                               min_coverage=1.):
+    """
+    Returns the time-weighted mean of the ``window_sec`` seconds ending when each
+    sample's value stops holding, in the same order as ``values``.  Time not
+    covered by any sample (gaps longer than ``max_gap_sec``) is left out of the
+    average instead of counting as zero.  NaN where less than ``min_coverage``
+    of the window is covered, e.g. the first ``window_sec`` of the data (None
+    for NaN only where the window has no coverage at all).
+    """
+    secs, vals, order = _sorted_series(timestamps, values)
+    n = len(secs)
+    if n == 0:
+        return np.zeros(0)
+
+    dt = _hold_durations(secs, max_gap_sec)
+
+    # cumulative value*time and covered time at the start of each sample
+    cum_vt = np.zeros(n + 1)
+    np.cumsum(vals * dt, out=cum_vt[1:])
+    cum_t = np.zeros(n + 1)
+    np.cumsum(dt, out=cum_t[1:])
+
+    # the windows end when each sample stops holding, i.e. at cum index i+1
+    win_start = secs + dt - window_sec
+
+    # j is the sample holding at each window start. Its contribution is only the
+    # part of its hold after the window start.
+    j = np.searchsorted(secs, win_start, side='right') - 1
+    before = j < 0
+    j = np.clip(j, 0, n - 1)
+    partial = np.clip(win_start - secs[j], 0, dt[j])
+    start_vt = np.where(before, 0, cum_vt[j] + vals[j]*partial)
+    start_t = np.where(before, 0, cum_t[j] + partial)
+
+    covered = cum_t[1:] - start_t
+    with np.errstate(invalid='ignore', divide='ignore'):
+        twa = (cum_vt[1:] - start_vt) / covered
+    if min_coverage is not None:
+        # with a little slack for the rounding of the cumulative sums
+        twa[covered < min_coverage*window_sec*(1 - 1e-9)] = np.nan
+
+    if order is not None:
+        unsorted = np.empty_like(twa)
+        unsorted[order] = twa
+        twa = unsorted
+    return twa
+
+
+def daily_peaks(timestamps, values):
+    """
+    Returns ``(days, peaks, peak_times)`` with the maximum value of each day
+    present in the data (days as datetime64[D], in whatever timezone the RTC
+    was set to).  NaNs are ignored, and a day with only NaNs has a NaN peak at
+    NaT.
+    """
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind != 'M':
+        raise ValueError('daily peaks need RTC (datetime) timestamps')
+    values = np.asarray(values, dtype=float)
+    if len(timestamps) == 0:
+        return (np.zeros(0, dtype='datetime64[D]'), np.zeros(0),
+                np.zeros(0, dtype=timestamps.dtype))
+
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = timestamps[order]
+    values = values[order]
+
+    days = timestamps.astype('datetime64[D]')
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    valid = ~np.isnan(values)
+    peaks = np.maximum.reduceat(np.where(valid, values, -np.inf), starts)
+
+    # first sample in each day that hits the peak.  Days of only NaNs have none
+    day_idx = np.cumsum(np.r_[False, days[1:] != days[:-1]])
+    at_peak = np.flatnonzero(valid & (values == peaks[day_idx]))
+    first = at_peak[np.diff(day_idx[at_peak], prepend=-1) != 0]
+
+    peak_times = np.full(len(starts), np.datetime64('NaT'), dtype=timestamps.dtype)
+    peak_times[day_idx[first]] = timestamps[first]
+    has_peak = np.zeros(len(starts), dtype=bool)
+    has_peak[day_idx[first]] = True
+    peaks[~has_peak] = np.nan
+
+    return days[starts], peaks, peak_times
+
+
+def exposure_summary(cols, types=CO2_TYPES, thresholds=CO2_THRESHOLDS,
+                     windows_hours=(1, 8), max_gap_sec=600, min_coverage=1.):
+    """
+    Computes all of the above for each of ``types`` present in ``cols`` (as
+    output by `cozir_parser.read_log_columns`).  Returns a dictionary mapping
+    measurement type to a dictionary with 'hours_above' (threshold->hours),
+    'max_twa' (window hours->max rolling mean over the windows with at least
+    ``min_coverage``, NaN if there are none), 'twa' (window hours->array) and
+    'daily_peaks' (if the timestamps are datetimes).
+    """
+    series = measurement_types.partition_by_type(cols['type_code'], cols['type_names'],
+                                                 cols['timestamp'], cols['value'])
+    summary = {}
+    for mtype in types:
+        if mtype not in series:
+            continue
+        ts, vals = series[mtype]
+
+        above = time_above_thresholds(ts, vals, thresholds, max_gap_sec)
+        res = {'hours_above': dict(zip(thresholds, above/3600)),
+               'twa': {}, 'max_twa': {}}
+        for whr in windows_hours:
+            twa = rolling_time_weighted_mean(ts, vals, whr*3600, max_gap_sec,
+                                             min_coverage)
+            res['twa'][whr] = twa
+            res['max_twa'][whr] = np.nanmax(twa) if np.any(np.isfinite(twa)) else np.nan
+        if ts.dtype.kind == 'M':
+            res['daily_peaks'] = daily_peaks(ts, vals)
+        summary[mtype] = res
+    return summary
@@ -0,0 +1,926 @@
+"""
+This script runs the feather firmware (cozir_mon_feather.main_loop) on the
+*host*, under CPython, with stand-ins for the CircuitPython modules it uses
+(board, busio, digitalio, neopixel, adafruit_sdcard, storage, analogio,
+microcontroller and adafruit_bus_device) and simulated hardware behind them: a
+CozIR on the UART, BME280/SGP30/DS3231 register maps on the I2C bus, and an
+in-memory SD card.  Time is virtual: it only moves on ``time.sleep`` and by the
+modelled transfer times of the UART, I2C bus and SD card, so a simulated day
+(1440 one-minute cycles) takes a few seconds and runs are reproducible.
+
+Each cycle (from one CozIR sample request to the next) reports how long the
+board was awake (not in a sleep of ``idle_sec`` or more), the modelled bus
+time, the bytes, writes and flushes that went to the SD card, and from
+tracemalloc, the peak allocated during the cycle.  The net growth of what the
+firmware's own lines hold is reported once per run, as bytes per cycle from
+the end of the first (boot) cycle to the end of the run.  CPython's
+allocations are not CircuitPython's, so those are for comparing changes to the
+firmware, not for predicting the M0's free memory.
+
+Nothing here is needed on the feather.
+"""
+import sys
+import json
+import math
+import types
+import random
+import builtins
+import datetime
+import tracemalloc
+import contextlib
+
+FIRMWARE_MODULES = ('cozir_mon_feather', 'rtc_time', 'rtc_clock', 'sensor_bus',
+                    'battery_check_feather', 'boot_cache', 'bme280_calib',
+                    'ppm_to_rgb', 'adaptive_interval', 'summary_ring')
+FAKE_MODULES = ('board', 'busio', 'digitalio', 'neopixel', 'adafruit_sdcard',
+                'storage', 'analogio', 'microcontroller', 'adafruit_bus_device',
+                'adafruit_bus_device.i2c_device', 'supervisor')
+
+# the BME280 datasheet's example calibration (section 8.2), plus humidity
+BME280_CALIB = {'t': (27504, 26435, -1000),
+                'p': (36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000),
+                'h': (75, 362, 0, 313, 50, 30)}
+BME280_RAW = (519888, 415148, 30000)  # temperature, pressure, humidity
+
+
+class StopSimulation(Exception):
+    pass
+
+
+class _Console:
+    """
+    Stands in for stdout while the firmware runs.  Keeps the status replies
+    (``STATUS`` to ``END``) and drops the rest, or echoes everything.
+    """
+    def __init__(self, echo=False):
+        self.echo = echo
+        self.line = ''
+        self.status = []
+        self._in_status = False
+
+    def write(self, s):
+        if self.echo:
+            sys.__stdout__.write(s)
+        self.line += s
+        while '\n' in self.line:
+            line, self.line = self.line.split('\n', 1)
+            if line.startswith('STATUS'):
+                self._in_status = True
+                self.status.append([])
+            if self._in_status:
+                self.status[-1].append(line)
+                self._in_status = line != 'END'
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+class _Stdin:
+    def __init__(self, sim):
+        self.sim = sim
+
+    def read(self, n=1):
+        out, self.sim.serial_in = self.sim.serial_in[:n], self.sim.serial_in[n:]
+        return out
+
+
+class CircuitPythonBytearray(bytearray):
+    """
+    CircuitPython's bytearray accepts a str without an encoding.
+    """
+    def __init__(self, source=0, *args):
+        if isinstance(source, str) and not args:
+            source = source.encode('ascii')
+        super().__init__(source, *args)
+
+
+class VirtualClock:
+    def __init__(self, idle_sec=.05):
+        self.now = 0.
+        self.idle_sec = idle_sec
+        self.slept = 0.  # in sleeps of idle_sec or more
+        self.waited = 0.  # in shorter sleeps
+        self.bus = 0.  # modelled transfer time
+
+    def monotonic(self):
+        return self.now
+
+    def monotonic_ns(self):
+        return int(self.now * 1e9)
+
+    def sleep(self, secs):
+        if secs < 0:
+            raise ValueError('sleep length must be non-negative')
+        if secs >= self.idle_sec:
+            self.slept += secs
+        else:
+            self.waited += secs
+        self.now += secs
+
+    def transfer(self, secs):
+        self.bus += secs
+        self.now += secs
+
+    def module(self):
+        mod = types.ModuleType('time')
+        mod.monotonic = self.monotonic
+        mod.monotonic_ns = self.monotonic_ns
+        mod.sleep = self.sleep
+        return mod
+
+
+class Environment:
+    """
+    What the simulated sensors see.  The CO2 follows ``co2_func(t)`` (ppm, of
+    virtual seconds) plus gaussian noise of ``co2_noise`` ppm.
+    """
+    def __init__(self, co2_func=None, co2_noise=5., seed=0,
+                 start=datetime.datetime(2024, 1, 1), rtc_drift_ppm=20.):
+        if co2_func is None:
+            # a bump every two hours, e.g. a room being used
+            co2_func = lambda t: 450 + 900*max(0., math.sin(2*math.pi*t/7200))
+        self.co2_func = co2_func
+        self.co2_noise = co2_noise
+        self.random = random.Random(seed)
+        self.start = start
+        # the board's clock runs this much fast relative to the RTC
+        self.rtc_drift_ppm = rtc_drift_ppm
+
+    def co2(self, t):
+        return max(0, self.co2_func(t) + self.random.gauss(0, self.co2_noise))
+
+
+class Pin:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'board.' + self.name
+
+
+def make_board():
+    board = types.ModuleType('board')
+    for nm in ('D11', 'RED_LED', 'GREEN_LED', 'SCK', 'MOSI', 'MISO', 'SD_CS',
+               'TX', 'RX', 'SCL', 'SDA', 'BATTERY'):
+        setattr(board, nm, Pin(nm))
+    return board
+
+
+def make_digitalio():
+    digitalio = types.ModuleType('digitalio')
+    digitalio.Direction = types.SimpleNamespace(INPUT='INPUT', OUTPUT='OUTPUT')
+
+    class DigitalInOut:
+        def __init__(self, pin):
+            self.pin = pin
+            self.direction = digitalio.Direction.INPUT
+            self.value = False
+
+        def deinit(self):
+            pass
+    digitalio.DigitalInOut = DigitalInOut
+    return digitalio
+
+
+def make_neopixel():
+    neopixel = types.ModuleType('neopixel')
+
+    class NeoPixel(list):
+        def __init__(self, pin, n):
+            super().__init__([(0, 0, 0)]*n)
+            self.pin = pin
+
+        def fill(self, color):
+            self[:] = [tuple(color)]*len(self)
+    neopixel.NeoPixel = NeoPixel
+    return neopixel
+
+
+class SimCozir:
+    """
+    Answers the CozIR commands the firmware uses.  Samples requested before
+    the digital filter warm-up since the last ``K 2`` are counted as early.
+    """
+    WARM_UP_SECS = {1: 1.2, 2: 3, 4: 5, 8: 9, 16: 16, 32: 32}
+
+    def __init__(self, clock, env, filter=32):
+        self.clock = clock
+        self.env = env
+        self.mode = 2  # powers up streaming
+        self.filter = filter
+        self.awake_since = 0.
+        self.samples = 0
+        self.early = 0
+        self.on_sample = None
+
+    def command(self, line):
+        cmd = line.split()
+        if not cmd:
+            return b''
+        if cmd[0] == b'K' and len(cmd) == 2:
+            self.mode = int(cmd[1])
+            if self.mode:
+                self.awake_since = self.clock.now
+            return ' K {:05d}\r\n'.format(self.mode).encode()
+        if cmd[0] == b'A' and len(cmd) == 2:
+            self.filter = int(cmd[1])
+            return ' A {:05d}\r\n'.format(self.filter).encode()
+        if cmd[0] == b'Q':
+            if self.on_sample is not None:
+                self.on_sample()
+            self.samples += 1
+            if self.mode == 0 or (self.clock.now - self.awake_since <
+                                  self.WARM_UP_SECS.get(self.filter, 32)):
+                self.early += 1
+            co2 = int(round(self.env.co2(self.clock.now)))
+            return ' H {:05d} T {:05d} Z {:05d} z {:05d}\r\n'.format(
+                551, 1233, co2, co2 + 2).encode()
+        return b' ?\r\n'
+
+
+def make_busio(sim):
+    busio = types.ModuleType('busio')
+    clock = sim.clock
+
+    class UART:
+        def __init__(self, tx, rx, baudrate=9600, receiver_buffer_size=64, timeout=1):
+            self.baudrate = baudrate
+            self.receiver_buffer_size = receiver_buffer_size
+            self.timeout = timeout
+            self._rx = bytearray()
+            self._line = bytearray()
+
+        def _bytetime(self, n):
+            return n * 10 / self.baudrate
+
+        def write(self, buf):
+            clock.transfer(self._bytetime(len(buf)))
+            self._line += buf
+            while b'\n' in self._line:
+                i = self._line.index(b'\n')
+                line, self._line = bytes(self._line[:i]), self._line[i+1:]
+                self._rx += sim.cozir.command(line.strip())
+                del self._rx[:-self.receiver_buffer_size]
+            return len(buf)
+
+        def read(self, nbytes=None):
+            if nbytes is None:
+                nbytes = len(self._rx)
+            if len(self._rx) < nbytes:
+                clock.sleep(self.timeout)
+            out, self._rx = bytes(self._rx[:nbytes]), self._rx[nbytes:]
+            clock.transfer(self._bytetime(len(out)))
+            return out or None
+
+        def reset_input_buffer(self):
+            self._rx = bytearray()
+
+        def deinit(self):
+            pass
+
+    class I2C:
+        def __init__(self, scl, sda, frequency=100000):
+            self.frequency = frequency
+            self.devices = sim.i2c_devices
+            self._locked = False
+
+        def _bus(self, nbytes):
+            # address byte + data, 9 clocks each
+            clock.transfer((nbytes + 1) * 9 / self.frequency)
+
+        def _dev(self, addr):
+            if not self._locked:
+                raise RuntimeError('I2C bus not locked')
+            if addr not in self.devices:
+                raise OSError(19, 'No I2C device at address: ' + hex(addr))
+            return self.devices[addr]
+
+        def try_lock(self):
+            if self._locked:
+                return False
+            self._locked = True
+            return True
+
+        def unlock(self):
+            self._locked = False
+
+        def scan(self):
+            return sorted(self.devices)
+
+        def writeto(self, addr, buf, start=0, end=None, stop=True):
+            dev = self._dev(addr)
+            data = bytes(buf[start:end])
+            self._bus(len(data))
+            dev.write(data)
+
+        def readfrom_into(self, addr, buf, start=0, end=None):
+            dev = self._dev(addr)
+            end = len(buf) if end is None else end
+            self._bus(end - start)
+            buf[start:end] = dev.read(end - start)
+
+        def writeto_then_readfrom(self, addr, out_buf, in_buf, out_start=0,
+                                  out_end=None, in_start=0, in_end=None):
+            self.writeto(addr, out_buf, out_start, out_end)
+            self.readfrom_into(addr, in_buf, in_start, in_end)
+
+        def deinit(self):
+            pass
+
+    class SPI:
+        def __init__(self, clock, MOSI=None, MISO=None):
+            pass
+
+        def deinit(self):
+            pass
+
+    busio.UART = UART
+    busio.I2C = I2C
+    busio.SPI = SPI
+    return busio
+
+
+class RegisterDevice:
+    """
+    An I2C device with a register pointer set by the first byte written, which
+    auto-increments on reads and writes.
+    """
+    def __init__(self, clock, size=256):
+        self.clock = clock
+        self.regs = bytearray(size)
+        self.ptr = 0
+
+    def write(self, data):
+        if not data:
+            return
+        self.ptr = data[0]
+        for b in data[1:]:
+            self.write_reg(self.ptr, b)
+            self.ptr = (self.ptr + 1) % len(self.regs)
+
+    def write_reg(self, reg, value):
+        self.regs[reg] = value
+
+    def read(self, n):
+        out = bytearray(n)
+        for i in range(n):
+            out[i] = self.read_reg(self.ptr)
+            self.ptr = (self.ptr + 1) % len(self.regs)
+        return out
+
+    def read_reg(self, reg):
+        return self.regs[reg]
+
+
+class SimBME280(RegisterDevice):
+    def __init__(self, clock, raw=BME280_RAW, calib=BME280_CALIB):
+        super().__init__(clock)
+        self.raw = raw
+        self.busy_until = 0.
+        self.measurements = 0
+        self.status_polls = 0
+        t, p, h = calib['t'], calib['p'], calib['h']
+        tp = (t[0], t[1], t[2]) + p
+        for i, c in enumerate(tp):
+            self.regs[0x88 + 2*i:0x8a + 2*i] = (c & 0xffff).to_bytes(2, 'little')
+        self.regs[0xa1] = h[0]
+        self.regs[0xe1:0xe3] = (h[1] & 0xffff).to_bytes(2, 'little')
+        self.regs[0xe3] = h[2]
+        self.regs[0xe4] = (h[3] >> 4) & 0xff
+        self.regs[0xe5] = (h[3] & 0xf) | ((h[4] & 0xf) << 4)
+        self.regs[0xe6] = (h[4] >> 4) & 0xff
+        self.regs[0xe7] = h[5] & 0xff
+        self.regs[0xd0] = 0x60  # chip id
+
+    def write_reg(self, reg, value):
+        super().write_reg(reg, value)
+        if reg == 0xf4 and value & 0b11 in (0b01, 0b10):  # forced mode
+            osrs = [(value >> 5) & 0b111, (value >> 2) & 0b111, self.regs[0xf2] & 0b111]
+            osrs = [0 if o == 0 else 1 << (o - 1) for o in osrs]
+            ms = 1.25 + 2.3*osrs[0]
+            ms += (2.3*osrs[1] + .575) if osrs[1] else 0
+            ms += (2.3*osrs[2] + .575) if osrs[2] else 0
+            self.busy_until = self.clock.now + ms/1000
+            self.measurements += 1
+            traw, praw, hraw = self.raw
+            self.regs[0xf7:0xfa] = bytes([praw >> 12, (praw >> 4) & 0xff, (praw & 0xf) << 4])
+            self.regs[0xfa:0xfd] = bytes([traw >> 12, (traw >> 4) & 0xff, (traw & 0xf) << 4])
+            self.regs[0xfd:0xff] = bytes([hraw >> 8, hraw & 0xff])
+
+    def read_reg(self, reg):
+        if reg == 0xf3:
+            self.status_polls += 1
+            return 0b1000 if self.clock.now < self.busy_until else 0
+        if reg == 0xf4 and self.clock.now >= self.busy_until:
+            return self.regs[0xf4] & 0b11111100  # back to sleep mode
+        return super().read_reg(reg)
+
+
+def sgp30_crc(data):
+    crc = 0xff
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x31) & 0xff if crc & 0x80 else (crc << 1) & 0xff
+    return crc
+
+
+class SimSGP30:
+    MEASURE_SECS = .012
+
+    def __init__(self, clock, env):
+        self.clock = clock
+        self.env = env
+        self.ready_at = None
+        self.out = b''
+        self.measurements = 0
+        self.not_ready = 0
+
+    def write(self, data):
+        cmd = bytes(data[:2])
+        if cmd == b'\x20\x08':  # measure_iaq
+            self.ready_at = self.clock.now + self.MEASURE_SECS
+            self.measurements += 1
+            eco2 = min(int(self.env.co2(self.clock.now)), 60000)
+            tvoc = 0
+            words = [eco2.to_bytes(2, 'big'), tvoc.to_bytes(2, 'big')]
+            self.out = b''.join(w + bytes([sgp30_crc(w)]) for w in words)
+
+    def read(self, n):
+        if self.ready_at is None or self.clock.now < self.ready_at:
+            # a real SGP30 NACKs the read
+            self.not_ready += 1
+            raise OSError(5, 'Input/output error')
+        return self.out[:n].ljust(n, b'\0')
+
+
+class SimDS3231(RegisterDevice):
+    """
+    Keeps time from ``env.start``, running slower than the virtual clock by
+    ``env.rtc_drift_ppm``.
+    """
+    def __init__(self, clock, env):
+        super().__init__(clock, 0x13)
+        self.env = env
+        self.set_at = (env.start, 0.)
+
+    def now(self):
+        start, t0 = self.set_at
+        secs = (self.clock.now - t0) / (1 + self.env.rtc_drift_ppm*1e-6)
+        return start + datetime.timedelta(seconds=secs)
+
+    def write(self, data):
+        super().write(data)
+        if len(data) > 1 and data[0] < 7:
+            fb = lambda b: b - 6*(b >> 4)
+            r = self.regs
+            # whole second, so the sub-second phase restarts
+            self.set_at = (datetime.datetime(2000 + fb(r[6]), fb(r[5] & 0x1f), fb(r[4]),
+                                             fb(r[2] & 0x3f), fb(r[1]), fb(r[0])), self.clock.now)
+
+    def read_reg(self, reg):
+        if reg < 7:
+            d = self.now()
+            tb = lambda n: n + 6*(n // 10)
+            return (tb(d.second), tb(d.minute), tb(d.hour), d.isoweekday(),
+                    tb(d.day), tb(d.month), tb(d.year - 2000))[reg]
+        return super().read_reg(reg)
+
+
+def make_bus_device():
+    pkg = types.ModuleType('adafruit_bus_device')
+    pkg.__path__ = []
+    mod = types.ModuleType('adafruit_bus_device.i2c_device')
+
+    class I2CDevice:
+        def __init__(self, i2c, device_address, probe=True):
+            self.i2c = i2c
+            self.device_address = device_address
+            if probe:
+                with self:
+                    if device_address not in i2c.scan():
+                        raise ValueError('No I2C device at address: ' + hex(device_address))
+
+        def __enter__(self):
+            while not self.i2c.try_lock():
+                pass
+            return self
+
+        def __exit__(self, *exc):
+            self.i2c.unlock()
+            return False
+
+        def write(self, buf, start=0, end=None):
+            self.i2c.writeto(self.device_address, buf, start, end)
+
+        def readinto(self, buf, start=0, end=None):
+            self.i2c.readfrom_into(self.device_address, buf, start, end)
+
+        def write_then_readinto(self, out_buffer, in_buffer, out_start=0,
+                                out_end=None, in_start=0, in_end=None):
+            self.i2c.writeto_then_readfrom(self.device_address, out_buffer, in_buffer,
+                                           out_start, out_end, in_start, in_end)
+
+    mod.I2CDevice = I2CDevice
+    pkg.i2c_device = mod
+    return pkg, mod
+
+
+class SimSD:
+    """
+    An in-memory card.  Writes and flushes are counted, and each flush costs
+    ``flush_ms`` of virtual time (a block write).
+    """
+    def __init__(self, clock, flush_ms=5., spi_hz=4e6):
+        self.clock = clock
+        self.flush_ms = flush_ms
+        self.spi_hz = spi_hz
+        self.files = {}
+        self.mounted = None
+        self.bytes_written = 0
+        self.writes = 0
+        self.flushes = 0
+
+    def open(self, fn, mode='r'):
+        if self.mounted is None or not fn.startswith(self.mounted + '/'):
+            raise OSError(2, 'No such file/directory: ' + fn)
+        if fn not in self.files:
+            if 'r' in mode:
+                raise OSError(2, 'No such file/directory: ' + fn)
+            self.files[fn] = bytearray()
+        elif 'w' in mode:
+            self.files[fn] = bytearray()
+        return SimFile(self, fn, mode)
+
+    def stat(self, fn):
+        if fn not in self.files:
+            raise OSError(2, 'No such file/directory: ' + fn)
+        return (0o100000, 0, 0, 0, 0, 0, len(self.files[fn]), 0, 0, 0)
+
+    def rename(self, src, dst):
+        if src not in self.files:
+            raise OSError(2, 'No such file/directory: ' + src)
+        self.files[dst] = self.files.pop(src)
+
+    def os_module(self):
+        mod = types.ModuleType('os')
+        mod.stat = self.stat
+        mod.rename = self.rename
+        mod.listdir = lambda path='/': sorted(fn[len(path):].lstrip('/')
+                                              for fn in self.files if fn.startswith(path))
+        return mod
+
+
+class SimFile:
+    def __init__(self, sd, fn, mode):
+        self.sd = sd
+        self.fn = fn
+        self.binary = 'b' in mode
+        self.pos = len(sd.files[fn]) if 'a' in mode else 0
+        self.closed = False
+
+    def write(self, b):
+        if isinstance(b, str):
+            b = b.encode()
+        data = self.sd.files[self.fn]
+        data[self.pos:self.pos + len(b)] = b
+        self.pos += len(b)
+        self.sd.bytes_written += len(b)
+        self.sd.writes += 1
+        return len(b)
+
+    def read(self, n=-1):
+        data = self.sd.files[self.fn]
+        end = len(data) if n is None or n < 0 else self.pos + n
+        out = bytes(data[self.pos:end])
+        self.pos += len(out)
+        return out if self.binary else out.decode()
+
+    def readinto(self, buf):
+        data = self.sd.files[self.fn]
+        n = max(min(len(buf), len(data) - self.pos), 0)
+        buf[:n] = data[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def seek(self, pos, whence=0):
+        self.pos = pos if whence == 0 else (self.pos + pos if whence == 1
+                                            else len(self.sd.files[self.fn]) + pos)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        self.sd.flushes += 1
+        self.sd.clock.transfer(self.sd.flush_ms / 1000)
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Simulation:
+    """
+    The simulated board.  ``nvm`` persists across `boot` calls, so a second
+    boot with ``fast_boot`` uses the cache the first one saved.
+    """
+    def __init__(self, env=None, sgp30=True, bme280=True, rtc=True, sdcard=True,
+                 nvm_nbytes=256, battery_volts=3.9, idle_sec=.05, flush_ms=5.):
+        self.env = Environment() if env is None else env
+        self.has = {'sgp30': sgp30, 'bme280': bme280, 'rtc': rtc, 'sdcard': sdcard}
+        self.nvm = bytearray(nvm_nbytes)
+        self.battery_volts = battery_volts
+        self.idle_sec = idle_sec
+        self.flush_ms = flush_ms
+        self.sd = None
+        self.cozir = None
+        self.rtc_now = None
+
+    def _power_on(self):
+        self.clock = VirtualClock(self.idle_sec)
+        if self.sd is None:
+            self.sd = SimSD(self.clock, self.flush_ms)
+        else:
+            # the card keeps its files over a reboot
+            self.sd.clock = self.clock
+            self.sd.mounted = None
+        # the CozIR keeps its filter setting in EEPROM
+        self.cozir = SimCozir(self.clock, self.env,
+                              32 if self.cozir is None else self.cozir.filter)
+        self.i2c_devices = {}
+        if self.has['sgp30']:
+            self.i2c_devices[0x58] = SimSGP30(self.clock, self.env)
+        if self.has['bme280']:
+            self.i2c_devices[0x77] = SimBME280(self.clock)
+        if self.has['rtc']:
+            rtc = SimDS3231(self.clock, self.env)
+            if self.rtc_now is not None:
+                # it has a battery, so it kept going (reboots are instant here)
+                rtc.set_at = (self.rtc_now, 0.)
+            self.i2c_devices[0x68] = rtc
+
+    def _modules(self):
+        sim = self
+        mods = {'board': make_board(), 'digitalio': make_digitalio(),
+                'neopixel': make_neopixel(), 'busio': make_busio(self)}
+        mods['adafruit_bus_device'], mods['adafruit_bus_device.i2c_device'] = make_bus_device()
+
+        sdmod = types.ModuleType('adafruit_sdcard')
+        class SDCard:
+            def __init__(self, spi, cs):
+                if not sim.has['sdcard']:
+                    raise OSError(19, 'no SD card')
+        sdmod.SDCard = SDCard
+        mods['adafruit_sdcard'] = sdmod
+
+        storage = types.ModuleType('storage')
+        storage.VfsFat = lambda card: card
+        def mount(vfs, mountpoint):
+            sim.sd.mounted = mountpoint
+        storage.mount = mount
+        mods['storage'] = storage
+
+        analogio = types.ModuleType('analogio')
+        class AnalogIn:
+            reference_voltage = 3.3
+            def __init__(self, pin):
+                self.value = min(int(sim.battery_volts / 2 / 3.3 * 65535), 65535)
+            def deinit(self):
+                pass
+        analogio.AnalogIn = AnalogIn
+        mods['analogio'] = analogio
+
+        mc = types.ModuleType('microcontroller')
+        mc.nvm = self.nvm
+        mods['microcontroller'] = mc
+
+        supervisor = types.ModuleType('supervisor')
+        class Runtime:
+            @property
+            def serial_bytes_available(self):
+                while sim.serial_script and sim.serial_script[0][0] <= sim.clock.now:
+                    sim.serial_in += sim.serial_script.pop(0)[1]
+                return len(sim.serial_in)
+        supervisor.runtime = Runtime()
+        mods['supervisor'] = supervisor
+        return mods
+
+    @contextlib.contextmanager
+    def _installed(self):
+        saved = {nm: sys.modules.get(nm) for nm in FIRMWARE_MODULES + FAKE_MODULES}
+        saved_bytearray = builtins.bytearray
+        saved_open = builtins.open
+        for nm in FIRMWARE_MODULES:
+            sys.modules.pop(nm, None)
+        sys.modules.update(self._modules())
+        builtins.bytearray = CircuitPythonBytearray
+        # files on the card go to the simulated one rather than the host's /sd
+        sd = self.sd
+        def sim_open(fn, mode='r', *args, **kwargs):
+            if isinstance(fn, str) and fn.startswith('/sd/'):
+                return sd.open(fn, mode)
+            return saved_open(fn, mode, *args, **kwargs)
+        builtins.open = sim_open
+        try:
+            real_time = sys.modules['time']
+            sys.modules['time'] = self.clock.module()
+            try:
+                import cozir_mon_feather
+            finally:
+                sys.modules['time'] = real_time
+            cozir_mon_feather.os = self.sd.os_module()
+            # sys.stdin is the serial console
+            cozir_mon_feather.sys = types.SimpleNamespace(modules=sys.modules,
+                                                          stdin=_Stdin(self))
+            yield cozir_mon_feather
+        finally:
+            builtins.bytearray = saved_bytearray
+            builtins.open = saved_open
+            for nm, mod in saved.items():
+                if mod is None:
+                    sys.modules.pop(nm, None)
+                else:
+                    sys.modules[nm] = mod
+
+    def boot(self, cycles=10, verbose=False, serial_script=(), **main_loop_kwargs):
+        """
+        Powers the board on, runs ``main_loop(**main_loop_kwargs)`` for
+        ``cycles`` complete cycles, and returns a dict with the boot time, a
+        list of per-cycle stats, the firmware's memory growth per cycle and any
+        status replies.  ``serial_script`` is
+        ``(virtual time, text)`` pairs typed on the serial console.
+        """
+        self._power_on()
+        self.serial_in = ''
+        self.serial_script = sorted(serial_script)
+        records = []
+        clock, sd = self.clock, self.sd
+
+        firmware_files = []
+        fw_mem = []  # (cycle, firmware_memory())
+
+        def firmware_memory():
+            # what is still allocated from the firmware's own lines, so the
+            # simulated card's contents and this harness don't count
+            if not firmware_files:
+                firmware_files.extend(tracemalloc.Filter(True, sys.modules[nm].__file__)
+                                      for nm in FIRMWARE_MODULES if nm in sys.modules)
+            snap = tracemalloc.take_snapshot().filter_traces(firmware_files)
+            return sum(stat.size for stat in snap.statistics('filename'))
+
+        def counters():
+            current, peak = tracemalloc.get_traced_memory()
+            return {'t': clock.now, 'slept': clock.slept, 'waited': clock.waited,
+                    'bus': clock.bus, 'bytes': sd.bytes_written, 'writes': sd.writes,
+                    'flushes': sd.flushes, 'mem': current, 'peak': peak}
+
+        def on_sample():
+            c = counters()
+            if records:
+                p = records[-1]
+                period = c['t'] - p['t']
+                p['stats'] = {'period': period,
+                              'awake': period - (c['slept'] - p['slept']),
+                              'sensor_wait': c['waited'] - p['waited'],
+                              'bus': c['bus'] - p['bus'],
+                              'bytes': c['bytes'] - p['bytes'],
+                              'writes': c['writes'] - p['writes'],
+                              'flushes': c['flushes'] - p['flushes'],
+                              'alloc_peak': c['peak'] - p['mem']}
+            if len(records) in (1, cycles):
+                # a snapshot goes through every traced block, so taking one
+                # each cycle would make long runs quadratic
+                fw_mem.append((len(records), firmware_memory()))
+            if len(records) == cycles:
+                raise StopSimulation()
+            tracemalloc.reset_peak()
+            c['mem'], _ = tracemalloc.get_traced_memory()
+            records.append(c)
+        self.cozir.on_sample = on_sample
+
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        console = _Console(echo=verbose)
+        try:
+            with contextlib.redirect_stdout(console), self._installed() as fw:
+                try:
+                    fw.main_loop(**main_loop_kwargs)
+                except StopSimulation:
+                    pass
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+        devs = self.i2c_devices
+        if 0x68 in devs:
+            self.rtc_now = devs[0x68].now()
+        growth = None
+        if len(fw_mem) == 2 and fw_mem[1][0] > fw_mem[0][0]:
+            growth = (fw_mem[1][1] - fw_mem[0][1]) / (fw_mem[1][0] - fw_mem[0][0])
+        return {'boot_to_first_sample': records[0]['t'] if records else None,
+                'cycles': [r['stats'] for r in records if 'stats' in r],
+                'alloc_net_per_cycle': growth,
+                'cozir_early_samples': self.cozir.early,
+                'status_replies': console.status,
+                'bme280_status_polls': devs[0x77].status_polls if 0x77 in devs else None,
+                'sgp30_not_ready': devs[0x58].not_ready if 0x58 in devs else None}
+
+    def log(self, fn='/sd/co2.log'):
+        return bytes(self.sd.files.get(fn, b''))
+
+
+STAT_NAMES = ('period', 'awake', 'sensor_wait', 'bus', 'bytes', 'writes',
+              'flushes', 'alloc_peak')
+
+
+def summarize(result):
+    """
+    Means of the per-cycle stats, leaving out the first cycle (which has the
+    boot-time logging in it).
+    """
+    cycles = result['cycles'][1:] or result['cycles']
+    if not cycles:
+        return {}
+    return {nm: sum(c[nm] for c in cycles) / len(cycles) for nm in STAT_NAMES}
+
+
+def print_result(result, per_cycle=False, file=None):
+    print('Boot to first sample: {:.3f} s'.format(result['boot_to_first_sample']), file=file)
+    print('Early CozIR samples:', result['cozir_early_samples'],
+          ' BME280 status polls:', result['bme280_status_polls'],
+          ' SGP30 reads too soon:', result['sgp30_not_ready'], file=file)
+    header = '{:>6}' + '{:>12}'*len(STAT_NAMES)
+    row = '{:>6}{:>12.3f}{:>12.4f}{:>12.4f}{:>12.4f}' + '{:>12.0f}'*4
+    print(header.format('cycle', *STAT_NAMES), file=file)
+    if per_cycle:
+        for i, c in enumerate(result['cycles']):
+            print(row.format(i, *[c[nm] for nm in STAT_NAMES]), file=file)
+    summary = summarize(result)
+    if summary:
+        print(row.format('mean', *[summary[nm] for nm in STAT_NAMES]), file=file)
+    if result['alloc_net_per_cycle'] is not None:
+        print('Firmware memory growth: {:.0f} bytes/cycle'.format(result['alloc_net_per_cycle']), file=file)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the feather firmware on '
+                                     'simulated hardware and report per-cycle costs.')
+    parser.add_argument('--cycles', '-n', type=int, default=20)
+    parser.add_argument('--boots', type=int, default=1,
+                        help='boot this many times, keeping the SD card and NVM')
+    parser.add_argument('--loop-time', type=float, default=60)
+    parser.add_argument('--filter', type=int, default=8, help='CozIR digital filter')
+    parser.add_argument('--fast-boot', action='store_true')
+    parser.add_argument('--adaptive', type=float, nargs=2, metavar=('MIN_SEC', 'MAX_SEC'))
+    parser.add_argument('--max-log-bytes', type=int)
+    parser.add_argument('--summary', type=int, nargs=2, metavar=('NSLOTS', 'PERIOD_SEC'))
+    parser.add_argument('--status-at', type=float, nargs='+', default=[], metavar='SECS',
+                        help='send "status" on the serial console at these virtual times')
+    parser.add_argument('--no-sgp30', action='store_true')
+    parser.add_argument('--no-bme280', action='store_true')
+    parser.add_argument('--no-rtc', action='store_true')
+    parser.add_argument('--no-sd', action='store_true')
+    parser.add_argument('--flush-ms', type=float, default=5.,
+                        help='virtual time each SD flush takes')
+    parser.add_argument('--per-cycle', action='store_true')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--log', help='save the simulated co2.log here')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help="show the firmware's prints")
+    args = parser.parse_args()
+
+    sim = Simulation(sgp30=not args.no_sgp30, bme280=not args.no_bme280,
+                     rtc=not args.no_rtc, sdcard=not args.no_sd,
+                     flush_ms=args.flush_ms)
+    kwargs = dict(loop_time_sec=args.loop_time, cozir_filter=args.filter,
+                  fast_boot=args.fast_boot, max_log_bytes=args.max_log_bytes,
+                  adaptive=None if args.adaptive is None else tuple(args.adaptive),
+                  summary=None if args.summary is None else tuple(args.summary))
+    results = []
+    for i in range(args.boots):
+        results.append(sim.boot(args.cycles, verbose=args.verbose,
+                                serial_script=[(t, 'status\r\n') for t in args.status_at],
+                                **kwargs))
+        if not args.json:
+            if args.boots > 1:
+                print('Boot', i + 1)
+            print_result(results[-1], args.per_cycle)
+            for reply in results[-1]['status_replies']:
+                print('\n'.join(reply))
+    if args.json:
+        print(json.dumps([dict(r, summary=summarize(r)) for r in results], indent=1))
+    if args.log:
+        with open(args.log, 'wb') as f:
+            f.write(sim.log())
@@ -0,0 +1,225 @@
+"""
+This script is to be run on the *host* to set the RTCs of several feathers at
+once to the time the host thinks it is, and check how well that worked.  Like
+send_time.py it needs rtc_time.py on the feathers, and stops their logging
+(they are soft-rebooted back into code.py at the end).
+
+All the ports are done in parallel.  On each, the link latency and how long
+the feather takes to start running a command are measured first, so the time
+can be written when the host clock is on a whole second (the DS3231 restarts
+its count of the second when the seconds are written).  Then the tick of the
+RTC's next second is timed against the host clock to get the offset, and the
+time is set again with a corrected delay if that is over ``--tolerance``.
+
+Requires pyserial
+"""
+import sys
+import json
+import time
+import statistics
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import send_time
+
+# Runs on the feather, in the raw REPL.  The call to _ping has the same form as
+# the one to _set, so both take as long to compile.
+DEVICE_CODE = """
+import time, board, busio, rtc_time
+try:
+    _i2c
+except NameError:
+    _i2c = busio.I2C(board.SCL, board.SDA)
+def _ping(*args):
+    print('P')
+def _set(yr, mon, date, day, hr, mn, sec):
+    rtc_time.set_time(_i2c, yr, mon, date, day, hr, mn, sec)
+    print('S')
+def _edge(timeout=1.5):
+    s = rtc_time.rtc_read(_i2c, 0)[0]
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        r = rtc_time.rtc_read(_i2c, 0, 7)
+        if r[0] != s:
+            print('E', *rtc_time.time_from_registers(r))
+            return
+    print('E')
+"""
+
+
+def _wait_until(t):
+    """
+    Sleeps until ``time.time()`` is ``t``, spinning for the last few ms.
+    """
+    remaining = t - time.time()
+    if remaining > .005:
+        time.sleep(remaining - .005)
+    while time.time() < t:
+        pass
+
+
+def timed_call(ser, call, at=None):
+    """
+    Runs ``call`` in the raw REPL, sending the Ctrl-D that starts it at host
+    time ``at`` (default now).  Returns ``(Ctrl-D time, time the "OK" came
+    back, time the output came back, output)``.
+    """
+    ser.write(call.encode())
+    ser.flush()
+    if at is not None:
+        _wait_until(at)
+    t0 = time.time()
+    ser.write(send_time.CTRLD)
+    send_time.read_expected(ser, b'OK')
+    t_ok = time.time()
+    out = send_time.read_expected(ser, b'\n')
+    t_out = time.time()
+    out += send_time.read_raw_result(ser)
+    return t0, t_ok, t_out, out.decode(errors='replace').strip()
+
+
+def measure_latency(ser, npings=5):
+    """
+    Returns ``(link round trip, delay from Ctrl-D to the command running)``
+    in seconds, the minimum and median over ``npings`` calls.  The output of a
+    command is taken to come back half a link round trip after it ran.
+    """
+    rtts = []
+    delays = []
+    for _ in range(npings):
+        t0, t_ok, t_out, _ = timed_call(ser, '_ping(2000, 1, 1, 1, 0, 0, 0)')
+        rtts.append(t_ok - t0)
+        delays.append(t_out - t0 - (t_ok - t0)/2)
+    return min(rtts), statistics.median(delays)
+
+
+def measure_offset(ser, rtt, shift):
+    """
+    Times the RTC's next tick and returns how far it is ahead of the host
+    clock (plus ``shift``) in seconds.
+    """
+    ot = ser.timeout
+    try:
+        ser.timeout = max(ot, 2.)  # _edge waits up to 1.5 s for the tick
+        _, _, t_out, out = timed_call(ser, '_edge()')
+    finally:
+        ser.timeout = ot
+    fields = out.split()
+    if len(fields) != 7 or fields[0] != 'E':
+        raise IOError(f'RTC did not tick: {out!r}')
+    yr, mon, date, hr, mn, sec = (int(v) for v in fields[1:])
+    rtc = datetime(2000 + yr, mon, date, hr, mn, sec)
+    return (rtc - shift).timestamp() - (t_out - rtt/2)
+
+
+def set_rtc(ser, delay, shift, margin=.3):
+    """
+    Writes the host time plus ``shift`` to the RTC, sending the command
+    ``delay`` before it is next a whole second, at least ``margin`` from now.
+    """
+    shift_sec = shift.total_seconds()
+    # a whole second of the time being set, which may not be of the host's
+    wall = int(time.time() + shift_sec + delay + margin) + 1
+    target = wall - shift_sec
+    dt = datetime.fromtimestamp(wall)
+    call = (f'_set({dt.year}, {dt.month}, {dt.day}, {dt.weekday() + 1}, '
+            f'{dt.hour}, {dt.minute}, {dt.second})')
+    out = timed_call(ser, call, at=target - delay)[3]
+    if out != 'S':
+        raise IOError(f'Setting the time failed: {out!r}')
+
+
+def sync_port(port, baudrate=115200, waittime=.5, shift=timedelta(),
+              tolerance=.005, attempts=3, npings=5, reboot=True):
+    """
+    Sets the RTC of the feather on ``port`` and returns a dict with the
+    link 'rtt', the command 'delay', the resulting 'offset' (RTC minus host,
+    seconds), the number of 'attempts' and the total 'elapsed' time.
+    """
+    import serial
+
+    st = time.perf_counter()
+    with serial.Serial(port, baudrate, timeout=waittime) as ser:
+        send_time.get_repl(ser, waittime)
+        send_time.enter_raw_repl(ser)
+        try:
+            send_time.run_code_raw(ser, DEVICE_CODE)
+            rtt, delay = measure_latency(ser, npings)
+            for attempt in range(1, attempts + 1):
+                set_rtc(ser, delay, shift)
+                offset = measure_offset(ser, rtt, shift)
+                if abs(offset) <= tolerance:
+                    break
+                # an RTC behind the host means the write ran late
+                delay -= offset
+        finally:
+            send_time.exit_raw_repl(ser)
+            if reboot:
+                ser.write(send_time.CTRLD)
+    return {'rtt': rtt, 'delay': delay, 'offset': offset, 'attempts': attempt,
+            'elapsed': time.perf_counter() - st}
+
+
+def sync_fleet(ports, **kwargs):
+    """
+    `sync_port` on all ``ports`` in parallel.  Returns ``{port: result dict or
+    the exception}``.
+    """
+    def one(port):
+        try:
+            return sync_port(port, **kwargs)
+        except Exception as e:
+            return e
+    with ThreadPoolExecutor(max(len(ports), 1)) as ex:
+        return dict(zip(ports, ex.map(one, ports)))
+
+
+def fleet_skew(results):
+    """
+    The spread (max - min) of the offsets of the ports that were set, in
+    seconds, or None if none were.
+    """
+    offsets = [r['offset'] for r in results.values() if not isinstance(r, Exception)]
+    return max(offsets) - min(offsets) if offsets else None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Set the RTCs of several feathers at once.')
+    parser.add_argument('serialports', nargs='+')
+    parser.add_argument('--baudrate', '-b', default=115200)
+    parser.add_argument('--waittime', '-w', type=float, default=0.5)
+    parser.add_argument('--tzoffset', '-z', type=float, default=0.0)
+    parser.add_argument('--offset-secs', '-o', type=float, default=0.0)
+    parser.add_argument('--tolerance', '-t', type=float, default=5.,
+                        help='ms of offset to accept before setting again (default %(default)s)')
+    parser.add_argument('--attempts', '-n', type=int, default=3)
+    parser.add_argument('--no-reboot', action='store_true', help='stay at the REPL afterwards instead of restarting code.py')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    st = time.perf_counter()
+    results = sync_fleet(args.serialports, baudrate=args.baudrate, waittime=args.waittime,
+                         shift=timedelta(hours=args.tzoffset, seconds=args.offset_secs),
+                         tolerance=args.tolerance/1000, attempts=args.attempts,
+                         reboot=not args.no_reboot)
+    elapsed = time.perf_counter() - st
+    skew = fleet_skew(results)
+
+    if args.json:
+        out = {port: {'error': str(r)} if isinstance(r, Exception) else r
+               for port, r in results.items()}
+        print(json.dumps({'ports': out, 'skew': skew, 'elapsed': elapsed}, indent=1))
+    else:
+        for port, r in results.items():
+            if isinstance(r, Exception):
+                print(f'{port}: {r}')
+            else:
+                print(f'{port}: offset {r["offset"]*1000:+.1f} ms after {r["attempts"]} '
+                      f'attempt(s) (link {r["rtt"]*1000:.1f} ms, command delay '
+                      f'{r["delay"]*1000:.1f} ms, {r["elapsed"]:.1f} s)')
+        if skew is not None:
+            print(f'Skew across {sum(not isinstance(r, Exception) for r in results.values())} '
+                  f'device(s): {skew*1000:.1f} ms, in {elapsed:.1f} s')
+    sys.exit(any(isinstance(r, Exception) for r in results.values()))
@@ -0,0 +1,410 @@
+"""
+Zoomable plots of a log in the browser, written by ``python cozir_parser.py
+LOG plot.html``.  Rather than every point, the page starts with a coarse
+min/max summary of each series and loads finer "tiles" as it is zoomed in, so
+a year of minute-by-minute data opens at once.
+
+Each series is cut into a pyramid of tiles: level 0 is one tile of the whole
+time range, and each level below has twice as many tiles, each the min and
+max of its values in ``tile_points`` equal time bins (which draws the same
+as the points at that zoom), or the points themselves once a tile has no more
+than ``tile_points``.  The first ``embed_levels`` levels are in the html file
+and the rest are json files in a ``<name>_tiles`` directory next to it, so it
+needs to be opened through a web server (e.g. ``python -m http.server`` in
+that directory) to zoom past those.  Only needs numpy.
+"""
+import os
+import json
+import shutil
+from collections import defaultdict
+
+import numpy as np
+
+import cozir_parser
+import atmosphere_conversions
+
+__all__ = ['tile_pyramid', 'plot_series', 'write_html_plot']
+
+TILE_POINTS = 512
+# matplotlib's default color cycle, to match the static plots
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+          '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+# marks a tiles directory as written by this module, so it can be replaced
+_TILES_MARKER = '.cozir_tiles'
+
+
+def _round_sig(a, digits=6):
+    """
+    ``a`` rounded to ``digits`` significant digits of its largest value, as
+    a list (which keeps the json small).
+    """
+    scale = np.max(np.abs(a)) if len(a) else 0
+    decimals = digits - 1 - int(np.floor(np.log10(scale))) if scale > 0 else 0
+    return np.round(a, max(decimals, 0)).tolist()
+
+
+def tile_pyramid(t, v, t0, span, tile_points=TILE_POINTS):
+    """
+    Yields ``(level, index, tile)`` for the non-empty tiles of the series
+    ``(t, v)`` (``t`` sorted, ms) over ``[t0, t0 + span)``.  A tile is a
+    dict of 'x' (ms from ``t0``) and either 'lo' and 'hi' (the min and max of
+    each bin) or, with 'raw' true, 'v'.  Tiles inside a raw one are left out.
+    """
+    ok = ~np.isnan(v)
+    t, v = t[ok], v[ok]
+    done = np.zeros(1, dtype=bool)  # tiles at the level above that were raw
+    level = 0
+    while True:
+        ntiles = 2**level
+        tile_span = span / ntiles
+        bounds = np.searchsorted(t, t0 + np.arange(ntiles + 1) * tile_span)
+        counts = np.diff(bounds)
+        skip = np.repeat(done, 2)[:ntiles] if level else done
+        raw = counts <= tile_points
+        for i in np.flatnonzero((counts > 0) & ~skip):
+            ts = t[bounds[i]:bounds[i+1]]
+            vs = v[bounds[i]:bounds[i+1]]
+            start = t0 + i * tile_span
+            if raw[i]:
+                yield level, i, {'x': np.rint(ts - t0).astype(np.int64).tolist(),
+                                 'v': _round_sig(vs), 'raw': True}
+                continue
+            bin_width = tile_span / tile_points
+            bins = np.minimum(((ts - start) // bin_width).astype(np.intp), tile_points - 1)
+            firsts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+            x = start + (bins[firsts] + .5) * bin_width - t0
+            yield level, i, {'x': np.rint(x).astype(np.int64).tolist(),
+                             'lo': _round_sig(np.minimum.reduceat(vs, firsts)),
+                             'hi': _round_sig(np.maximum.reduceat(vs, firsts))}
+        done = skip | raw
+        if done.all():
+            return
+        level += 1
+
+
+def plot_series(cols, include_types=None, exclude_types=None,
+                humidity_unit='rel', temp_unit='c', join_tolerance_sec=300):
+    """
+    The series to plot from ``cols`` (as output by
+    `cozir_parser.read_log_columns`, with RTC timestamps), grouped and
+    converted like `cozir_parser.plot_cozir_data` does.  Returns a dict
+    mapping group name to ``(y axis label, [(name, ms, values), ...])``.
+    """
+    if include_types is not None and exclude_types is not None:
+        raise ValueError('at least one of include_types and exclude_types must '
+                         'be None')
+    if cols['timestamp'].dtype.kind != 'M':
+        raise ValueError('html plots need a log with RTC timestamps')
+    cols = cozir_parser.calibrate_bme280_columns(cols)
+
+    all_series = {}
+    for nm, (t, v) in cozir_parser.split_columns(cols).items():
+        if nm.startswith(('boot_', 'clock_', 'bme280_calib')) or nm == 'loop_interval':
+            continue
+        all_series[nm] = (t.astype('datetime64[ms]').astype(np.int64).astype(float),
+                          np.asarray(v, dtype=float))
+
+    groups = defaultdict(list)
+    for nm, (x, y) in sorted(all_series.items()):
+        if include_types is not None and nm not in include_types:
+            continue
+        if exclude_types is not None and nm in exclude_types:
+            continue
+        groups[cozir_parser.PLOT_TYPES.get(nm, nm)].append((x, y, nm))
+
+    if humidity_unit in ('dewpoint', 'abs'):
+        if 'humidity' in groups:
+            groups['humidity'] = cozir_parser._derive_humidities(
+                groups['humidity'], all_series, humidity_unit,
+                cozir_parser.HUMIDITY_TEMPERATURES, cozir_parser.PLOT_TYPES,
+                join_tolerance_sec * 1000.)
+    elif humidity_unit != 'rel':
+        raise ValueError(f'invalid humidity unit {humidity_unit}')
+    if temp_unit not in ('c', 'f'):
+        raise ValueError(f'invalid temperature unit {temp_unit}')
+
+    to_temp = atmosphere_conversions.c_to_f if temp_unit == 'f' else (lambda x: x)
+    transforms = {'pressure': lambda x: x/101325.,  # Pa->atm
+                  'temperature': to_temp}
+    if humidity_unit == 'dewpoint':
+        transforms['humidity'] = to_temp
+    labels = {'co2': 'CO2 concentration [ppm]',
+              'pressure': 'pressure [atm]',
+              'temperature': f'temperature [deg {temp_unit.upper()}]',
+              'humidity': {'rel': 'Relative Humidity [%]',
+                           'abs': 'Absolute Humidity [g/m^3]',
+                           'dewpoint': f'Dew Point [deg {temp_unit.upper()}]'}[humidity_unit]}
+
+    out = {}
+    for grp, series in groups.items():
+        tf = transforms.get(grp, lambda x: x)
+        out[grp] = (labels.get(grp, grp), [(nm, x, tf(y)) for x, y, nm in series])
+    return out
+
+
+def write_html_plot(cols, outfilename, tile_points=TILE_POINTS, embed_levels=2,
+                    title=None, **plot_kwargs):
+    """
+    Writes the zoomable plot of ``cols`` to ``outfilename`` and its tiles to
+    ``<outfilename without .html>_tiles``.  ``plot_kwargs`` are as for
+    `plot_series`.  Returns a dict of the number of 'series', 'tiles' and
+    'levels', and the 'bytes' written.
+    """
+    groups = plot_series(cols, **plot_kwargs)
+    times = [x for _, series in groups.values() for _, x, _ in series if len(x)]
+    if not times:
+        raise ValueError('nothing to plot')
+    t0 = min(x[0] for x in times)
+    span = max(x[-1] for x in times) - t0 + 1.
+
+    tiles_dir = os.path.splitext(outfilename)[0] + '_tiles'
+    if os.path.exists(os.path.join(tiles_dir, _TILES_MARKER)):
+        shutil.rmtree(tiles_dir)
+    os.makedirs(tiles_dir, exist_ok=True)
+    open(os.path.join(tiles_dir, _TILES_MARKER), 'w').close()
+
+    meta = {'t0': t0, 'span': span, 'tilePoints': tile_points, 'maxLevel': 0,
+            'tileDir': os.path.basename(tiles_dir), 'groups': []}
+    embedded = {}
+    ntiles = nbytes = 0
+    color = 0
+    for grp, (label, series) in groups.items():
+        entry = {'name': grp, 'label': label, 'series': [],
+                 'lines': [1000, 1500, 2000] if grp == 'co2' else []}
+        for nm, x, y in series:
+            sid = f's{sum(len(g["series"]) for g in meta["groups"]) + len(entry["series"])}'
+            entry['series'].append({'id': sid, 'name': nm, 'color': COLORS[color % len(COLORS)]})
+            color += 1
+            for level, i, tile in tile_pyramid(x, y, t0, span, tile_points):
+                meta['maxLevel'] = max(meta['maxLevel'], level)
+                key = f'{sid}/{level}/{i}'
+                text = json.dumps(tile, separators=(',', ':'))
+                ntiles += 1
+                if level < embed_levels:
+                    embedded[key] = tile
+                    continue
+                os.makedirs(os.path.join(tiles_dir, sid, str(level)), exist_ok=True)
+                with open(os.path.join(tiles_dir, key + '.json'), 'w') as f:
+                    f.write(text)
+                nbytes += len(text)
+        meta['groups'].append(entry)
+
+    title = title or 'CO2 monitor data'
+    html = (_HTML.replace('__TITLE__', title)
+                 .replace('__META__', json.dumps(meta, separators=(',', ':')))
+                 .replace('__TILES__', json.dumps(embedded, separators=(',', ':'))))
+    with open(outfilename, 'w') as f:
+        f.write(html)
+    nbytes += len(html)
+    return {'series': sum(len(g['series']) for g in meta['groups']),
+            'tiles': ntiles, 'levels': meta['maxLevel'] + 1, 'bytes': nbytes}
+
+
+_HTML = r"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<style>
+body { font-family: sans-serif; margin: 1em; }
+.group { margin-bottom: 1em; }
+.legend span { margin-right: 1.5em; font-size: 90%; }
+.legend i { display: inline-block; width: 1.5em; height: .25em; margin-right: .3em; vertical-align: middle; }
+canvas { width: 100%; height: 300px; display: block; cursor: grab; }
+#help { color: #666; font-size: 85%; }
+</style>
+</head>
+<body>
+<h3>__TITLE__</h3>
+<div id="help">Scroll to zoom, drag to pan, double-click to reset.</div>
+<div id="plots"></div>
+<script>
+const META = __META__;
+const EMBEDDED = __TILES__;
+</script>
+<script>
+"use strict";
+const cache = new Map(Object.entries(EMBEDDED));  // tile key -> tile, or null if there is none
+const failed = new Set();  // tiles that could not be fetched (e.g. from file://)
+const pending = new Set();
+const MARGIN = {left: 70, right: 15, top: 10, bottom: 40};
+let view = [0, META.span];
+let drawQueued = false;
+
+function request(key) {
+  if (pending.has(key) || failed.has(key)) return;
+  pending.add(key);
+  fetch(META.tileDir + '/' + key + '.json')
+    .then(r => r.ok ? r.json() : (r.status === 404 ? null : Promise.reject(r.status)))
+    .then(tile => cache.set(key, tile), () => failed.add(key))
+    .finally(() => { pending.delete(key); queueDraw(); });
+}
+
+// the tile to draw for (level, i): itself, a raw one above it, or meanwhile
+// the finest one above that has arrived
+function tileFor(id, level, i) {
+  for (let k = 1; k <= level; k++) {
+    const t = cache.get(id + '/' + (level - k) + '/' + (i >> k));
+    if (t === null) return null;
+    if (t && t.raw) return t;
+  }
+  const key = id + '/' + level + '/' + i;
+  if (cache.has(key)) return cache.get(key);
+  request(key);
+  for (let k = 1; k <= level; k++) {
+    const t = cache.get(id + '/' + (level - k) + '/' + (i >> k));
+    if (t) return t;
+  }
+  return null;
+}
+
+function niceStep(range, n) {
+  const raw = range / n, p = Math.pow(10, Math.floor(Math.log10(raw)));
+  for (const m of [1, 2, 2.5, 5, 10]) if (m * p >= raw) return m * p;
+  return 10 * p;
+}
+
+const TIME_STEPS = [1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200,
+                    10800, 21600, 43200, 86400, 172800, 604800, 2592000, 7776000,
+                    31536000].map(s => s * 1000);
+
+function timeLabel(ms, step) {
+  const s = new Date(ms).toISOString();  // the RTC times are stored as UTC
+  if (step >= 86400000) return s.slice(0, 10);
+  if (step >= 60000) return s.slice(5, 10) + ' ' + s.slice(11, 16);
+  return s.slice(11, 19);
+}
+
+function drawGroup(group, canvas) {
+  const dpr = window.devicePixelRatio || 1;
+  const w = canvas.clientWidth, h = canvas.clientHeight;
+  canvas.width = w * dpr; canvas.height = h * dpr;
+  const ctx = canvas.getContext('2d');
+  ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+  ctx.clearRect(0, 0, w, h);
+  const pw = w - MARGIN.left - MARGIN.right, ph = h - MARGIN.top - MARGIN.bottom;
+  const [v0, v1] = view;
+  const level = Math.max(0, Math.min(META.maxLevel,
+      Math.ceil(Math.log2(META.span * pw / (META.tilePoints * (v1 - v0))))));
+  const tileSpan = META.span / Math.pow(2, level);
+  const first = Math.max(0, Math.floor(v0 / tileSpan));
+  const last = Math.min(Math.pow(2, level) - 1, Math.floor(v1 / tileSpan));
+
+  // the points in view of each series, as [x, lo, hi]
+  const lines = [];
+  let ymin = Infinity, ymax = -Infinity;
+  for (const s of group.series) {
+    const pts = [], seen = new Set();
+    for (let i = first; i <= last; i++) {
+      const t = tileFor(s.id, level, i);
+      if (!t || seen.has(t)) continue;
+      seen.add(t);
+      const lo = t.raw ? t.v : t.lo, hi = t.raw ? t.v : t.hi;
+      for (let j = 0; j < t.x.length; j++) {
+        const x = t.x[j];
+        if (x < v0 - tileSpan || x > v1 + tileSpan) continue;
+        pts.push([x, lo[j], hi[j]]);
+        if (x >= v0 && x <= v1) { ymin = Math.min(ymin, lo[j]); ymax = Math.max(ymax, hi[j]); }
+      }
+    }
+    pts.sort((a, b) => a[0] - b[0]);
+    lines.push([s, pts]);
+  }
+  if (!isFinite(ymin)) { ymin = 0; ymax = 1; }
+  if (ymin === ymax) { ymin -= 1; ymax += 1; }
+  const pad = (ymax - ymin) * .05;
+  ymin -= pad; ymax += pad;
+  const X = x => MARGIN.left + (x - v0) / (v1 - v0) * pw;
+  const Y = y => MARGIN.top + (ymax - y) / (ymax - ymin) * ph;
+
+  ctx.strokeStyle = '#000'; ctx.fillStyle = '#000'; ctx.lineWidth = 1;
+  ctx.strokeRect(MARGIN.left, MARGIN.top, pw, ph);
+  ctx.font = '11px sans-serif';
+  ctx.textAlign = 'right'; ctx.textBaseline = 'middle';
+  const ystep = niceStep(ymax - ymin, 6);
+  for (let y = Math.ceil(ymin / ystep) * ystep; y <= ymax; y += ystep) {
+    ctx.fillText(+y.toPrecision(6), MARGIN.left - 5, Y(y));
+    ctx.beginPath(); ctx.moveTo(MARGIN.left - 3, Y(y)); ctx.lineTo(MARGIN.left, Y(y)); ctx.stroke();
+  }
+  ctx.textAlign = 'center'; ctx.textBaseline = 'top';
+  const tstep = TIME_STEPS.find(s => (v1 - v0) / s <= 8) || TIME_STEPS[TIME_STEPS.length - 1];
+  for (let t = Math.ceil((META.t0 + v0) / tstep) * tstep; t <= META.t0 + v1; t += tstep) {
+    const x = X(t - META.t0);
+    ctx.fillText(timeLabel(t, tstep), x, MARGIN.top + ph + 5);
+    ctx.beginPath(); ctx.moveTo(x, MARGIN.top + ph); ctx.lineTo(x, MARGIN.top + ph + 3); ctx.stroke();
+  }
+  ctx.save();
+  ctx.translate(14, MARGIN.top + ph / 2); ctx.rotate(-Math.PI / 2);
+  ctx.fillText(group.label, 0, 0);
+  ctx.restore();
+
+  ctx.save();
+  ctx.beginPath(); ctx.rect(MARGIN.left, MARGIN.top, pw, ph); ctx.clip();
+  const dashes = {1000: [2, 3], 1500: [6, 4], 2000: []}, lineColors = {1000: 'gold', 1500: 'orange', 2000: 'red'};
+  for (const y of group.lines) {
+    ctx.strokeStyle = lineColors[y]; ctx.setLineDash(dashes[y]);
+    ctx.beginPath(); ctx.moveTo(MARGIN.left, Y(y)); ctx.lineTo(MARGIN.left + pw, Y(y)); ctx.stroke();
+  }
+  ctx.setLineDash([]);
+  for (const [s, pts] of lines) {
+    ctx.strokeStyle = s.color; ctx.lineWidth = 1.2;
+    ctx.beginPath();
+    pts.forEach(([x, lo, hi], j) => {
+      const px = X(x);
+      if (j === 0) ctx.moveTo(px, Y(lo)); else ctx.lineTo(px, Y(lo));
+      if (hi !== lo) ctx.lineTo(px, Y(hi));
+    });
+    ctx.stroke();
+  }
+  ctx.restore();
+}
+
+const canvases = [];
+function drawAll() { drawQueued = false; META.groups.forEach((g, k) => drawGroup(g, canvases[k])); }
+function queueDraw() { if (!drawQueued) { drawQueued = true; requestAnimationFrame(drawAll); } }
+
+for (const group of META.groups) {
+  const div = document.createElement('div');
+  div.className = 'group';
+  const legend = document.createElement('div');
+  legend.className = 'legend';
+  for (const s of group.series) {
+    const span = document.createElement('span');
+    span.innerHTML = '<i style="background:' + s.color + '"></i>';
+    span.appendChild(document.createTextNode(s.name));
+    legend.appendChild(span);
+  }
+  const canvas = document.createElement('canvas');
+  div.appendChild(legend); div.appendChild(canvas);
+  document.getElementById('plots').appendChild(div);
+  canvases.push(canvas);
+
+  canvas.addEventListener('wheel', e => {
+    e.preventDefault();
+    const r = canvas.getBoundingClientRect();
+    const f = (e.clientX - r.left - MARGIN.left) / (r.width - MARGIN.left - MARGIN.right);
+    const at = view[0] + Math.min(1, Math.max(0, f)) * (view[1] - view[0]);
+    const scale = Math.pow(1.2, Math.sign(e.deltaY));
+    const width = Math.min(META.span * 1.1, Math.max(1000, (view[1] - view[0]) * scale));
+    view = [at - (at - view[0]) / (view[1] - view[0]) * width, 0];
+    view[1] = view[0] + width;
+    queueDraw();
+  }, {passive: false});
+  let dragging = null;
+  canvas.addEventListener('mousedown', e => { dragging = [e.clientX, view.slice()]; canvas.style.cursor = 'grabbing'; });
+  window.addEventListener('mouseup', () => { dragging = null; canvas.style.cursor = 'grab'; });
+  window.addEventListener('mousemove', e => {
+    if (!dragging) return;
+    const r = canvas.getBoundingClientRect();
+    const dx = (e.clientX - dragging[0]) / (r.width - MARGIN.left - MARGIN.right) * (dragging[1][1] - dragging[1][0]);
+    view = [dragging[1][0] - dx, dragging[1][1] - dx];
+    queueDraw();
+  });
+  canvas.addEventListener('dblclick', () => { view = [0, META.span]; queueDraw(); });
+}
+window.addEventListener('resize', queueDraw);
+drawAll();
+</script>
+</body>
+</html>
+"""
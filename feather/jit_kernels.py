@@ -0,0 +1,379 @@
+"""
+numba versions of the hot loops in the analysis code, each a single pass over
+its inputs with no temporary arrays.  Only imported by compute_engine.py, and
+only if numba is installed; use the engine functions there rather than these.
+
+They follow the numpy code operation for operation (the spike filter one
+on a sorted window rather than a wavelet matrix), so the BME280 calibration,
+log tokenizing and spike filters give exactly the same results.  The humidity
+conversions build the powers from products and a sqrt, and use the C library's
+exp/log10 where numpy has its own (vectorized) versions, so differ by an ulp
+or so.  float32 inputs are computed in float64, and only the results stored as
+float32.
+"""
+import math
+
+import numpy as np
+from numba import njit, prange
+
+from atmosphere_conversions import (SVP_TC, SVP_PC, SVP_COEFFS, SVP_POWERS,
+                                    DEWPOINT_A, DEWPOINT_M, DEWPOINT_TN,
+                                    ABS_HUMIDITY_C)
+
+_C0, _C1, _C2, _C3, _C4, _C5 = SVP_COEFFS
+assert SVP_POWERS == [1, 1.5, 3, 3.5, 4, 7.5], 'update _svp for the new powers'
+
+
+@njit(inline='always')
+def _svp(ts_K):
+    v = 1 - ts_K/SVP_TC
+    # the powers from one sqrt and products rather than pow, which is slow;
+    # summed in the same order as the numpy version
+    r = math.sqrt(v)
+    v3 = v*v*v
+    v4 = v3*v
+    s = _C0*v
+    s = s + _C1*(v*r)
+    s = s + _C2*v3
+    s = s + _C3*(v3*r)
+    s = s + _C4*v4
+    s = s + _C5*(v4*v3*r)
+    return SVP_PC * math.exp(SVP_TC / ts_K * s)
+
+
+@njit(parallel=True, cache=True)
+def saturation_vapor_pressure(ts_K, out):
+    for i in prange(ts_K.size):
+        out[i] = _svp(float(ts_K[i]))
+
+
+@njit(parallel=True, cache=True)
+def dewpoint(rh, ts, out):
+    for i in prange(ts.size):
+        pw = _svp(float(ts[i]) + 273.15) * float(rh[i])
+        out[i] = DEWPOINT_TN/(DEWPOINT_M/math.log10(pw/DEWPOINT_A) - 1)
+
+
+@njit(parallel=True, cache=True)
+def abs_humidity(rh, ts, out):
+    for i in prange(ts.size):
+        ts_K = float(ts[i]) + 273.15
+        out[i] = ABS_HUMIDITY_C * _svp(ts_K) * float(rh[i]) / ts_K
+
+
+@njit(parallel=True, cache=True)
+def bme280_temp(traw, t_calib, t_fine, out):
+    a = t_calib[0]/1024.0
+    b = t_calib[0]/8192.0
+    for i in prange(traw.size):
+        x = float(traw[i])
+        var1 = (x/16384.0 - a) * t_calib[1]
+        d = x/131072.0 - b
+        tf = var1 + (d * d) * t_calib[2]
+        t_fine[i] = tf
+        t = tf / 5120.0
+        out[i] = -273.15 if t < -273.15 else t
+
+
+@njit(parallel=True, cache=True)
+def bme280_pressure(praw, t_fine, p_calib, out):
+    for i in prange(praw.size):
+        var1 = t_fine[i]/2.0 - 64000.0
+        var2 = var1 * var1 * p_calib[5] / 32768.0
+        var2 = var2 + var1 * p_calib[4] * 2.0
+        var2 = (var2/4.0)+(p_calib[3] * 65536.0)
+        var1 = (p_calib[2] * var1 * var1 / 524288.0 + p_calib[1] * var1) / 524288.0
+        var1 = (1.0 + var1 / 32768.0)*p_calib[0]
+
+        p = 1048576.0 - float(praw[i])
+        p = (p - (var2 / 4096.0)) * 6250.0 / var1
+        var1 = p_calib[8] * p * p / 2147483648.0
+        var2 = p * p_calib[7] / 32768.0
+        p = p + (var1 + var2 + p_calib[6]) / 16.0
+        out[i] = 0. if p < 0 else p
+
+
+@njit(parallel=True, cache=True)
+def bme280_humidity(hraw, t_fine, h_calib, out):
+    a = h_calib[3] * 64.0
+    b = h_calib[4] / 16384.0
+    c = h_calib[1] / 65536.0
+    d = h_calib[5] / 67108864.0
+    e = h_calib[2] / 67108864.0
+    for i in prange(hraw.size):
+        var_H = t_fine[i] - 76800.0
+        var_H = (float(hraw[i]) - (a + b * var_H)) * (c * (1.0 + d * var_H * (1.0 + e * var_H)))
+        var_H = var_H * (1.0 - h_calib[0] * var_H / 524288.0)
+        out[i] = 0. if var_H < 0 else (100. if var_H > 100 else var_H)
+
+
+MAX_TYPES = 2048
+_MONTH_DAYS = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+@njit(inline='always')
+def _is_space(c):
+    return c == 32 or 9 <= c <= 13
+
+
+@njit(inline='always')
+def _days_from_civil(y, m, d):
+    # days since 1970-01-01 of a proleptic Gregorian date
+    y -= m <= 2
+    era = (y if y >= 0 else y - 399) // 400
+    yoe = y - era * 400
+    doy = (153 * (m + (-3 if m > 2 else 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+@njit(inline='always')
+def _digits(buf, i, end):
+    # (value, index after) of the run of decimal digits at i, (-1, i) if none
+    v = 0
+    j = i
+    while j < end and 48 <= buf[j] <= 57 and j - i < 12:
+        v = v * 10 + (buf[j] - 48)
+        j += 1
+    if j == i or (j < end and 48 <= buf[j] <= 57):
+        return -1, i
+    return v, j
+
+
+@njit(inline='always')
+def _is_leap(y):
+    return (y % 4 == 0 and y % 100 != 0) or y % 400 == 0
+
+
+@njit
+def _timestamp_ms(buf, i, end):
+    """
+    ms since 1970 of a ``YYYY-MM-DDTh:m:s[.fff]`` timestamp, or -2**62 if it
+    is anything the kernel does not handle.
+    """
+    bad = -2**62
+    if end - i < 16 or buf[i+4] != 45 or buf[i+7] != 45 or buf[i+10] != 84:
+        return bad
+    y, j = _digits(buf, i, i+4)
+    mo, j2 = _digits(buf, i+5, i+7)
+    d, j3 = _digits(buf, i+8, i+10)
+    if j != i+4 or j2 != i+7 or j3 != i+10 or not 1 <= mo <= 12 or d < 1:
+        return bad
+    mdays = 29 if mo == 2 and _is_leap(y) else _MONTH_DAYS[mo-1]
+    if d > mdays:
+        return bad
+    hr, j = _digits(buf, i+11, end)
+    if hr < 0 or j >= end or buf[j] != 58:
+        return bad
+    mn, j = _digits(buf, j+1, end)
+    if mn < 0 or j >= end or buf[j] != 58:
+        return bad
+    sec, j = _digits(buf, j+1, end)
+    if sec < 0 or sec >= 10**6:
+        return bad
+    ms = sec * 1000
+    if j < end:
+        if buf[j] != 46:
+            return bad
+        # up to 3 decimals, where the integer ms is what rounding float(sec)*1000 gives
+        scale = 100
+        j += 1
+        while j < end:
+            c = buf[j]
+            if not 48 <= c <= 57 or scale == 0:
+                return bad
+            ms += (c - 48) * scale
+            scale //= 10
+            j += 1
+    return (_days_from_civil(y, mo, d) * 86400000 + (hr*60 + mn)*60000 + ms)
+
+
+@njit
+def _value(buf, i, end):
+    """
+    ``(ok, value)`` for a plain decimal number, which is then exactly what
+    ``float`` gives: an integer mantissa < 2**53 divided by a power of ten
+    that is exact in float64 gives the correctly rounded result.
+    """
+    neg = False
+    if buf[i] == 45 or buf[i] == 43:
+        neg = buf[i] == 45
+        i += 1
+    m = 0
+    ndigits = 0
+    nfrac = 0
+    seen_point = False
+    while i < end:
+        c = buf[i]
+        if c == 46 and not seen_point:
+            seen_point = True
+        elif 48 <= c <= 57:
+            if m >= 900719925474099:  # 2**53 // 10
+                return False, 0.
+            m = m * 10 + (c - 48)
+            ndigits += 1
+            nfrac += seen_point
+        else:
+            return False, 0.
+        i += 1
+    if ndigits == 0 or nfrac > 22:
+        return False, 0.
+    v = m / 10.0**nfrac
+    return True, -v if neg else v
+
+
+@njit(cache=True)
+def tokenize_log(buf):
+    """
+    Tokenizes a whole feather log (uint8 array of its bytes) like
+    cozir_parser.read_log_columns: lines without 3 fields are skipped, type
+    names get codes in order of first appearance.  Returns ``(nrows,
+    ms since 1970, codes, values, name starts, name lengths, ntypes)``, with
+    ``nrows == -1`` if the log has anything this does not handle (times
+    since boot, exponents, non-ASCII...) so the caller should use the Python
+    tokenizer instead.
+    """
+    nlines = 1
+    for c in buf:
+        nlines += c == 10 or c == 13
+    ms = np.empty(nlines, np.int64)
+    codes = np.empty(nlines, np.int32)
+    values = np.empty(nlines, np.float64)
+    name_start = np.empty(MAX_TYPES, np.int64)
+    name_len = np.empty(MAX_TYPES, np.int64)
+    table = np.zeros(2 * MAX_TYPES, np.int64)  # code + 1 by hash slot
+    ntypes = 0
+    nrows = 0
+    starts = np.empty(4, np.int64)
+    ends = np.empty(4, np.int64)
+    # rows in a cycle share timestamps, so only parse when it changes
+    prev_start = 0
+    prev_len = -1
+    t = 0
+
+    n = buf.size
+    i = 0
+    while i < n:
+        # split a line (up to \n or \r, as universal newlines do) on whitespace
+        nfields = 0
+        in_field = False
+        while i < n and buf[i] != 10 and buf[i] != 13:
+            c = buf[i]
+            if c >= 128 or 28 <= c <= 31:  # str.split whitespace we do not handle
+                return -1, ms, codes, values, name_start, name_len, ntypes
+            if _is_space(c):
+                if in_field:
+                    ends[nfields-1] = i
+                    in_field = False
+            elif not in_field:
+                if nfields < 4:
+                    starts[nfields] = i
+                nfields += 1
+                in_field = True
+            i += 1
+        if in_field and nfields <= 4:
+            ends[nfields-1] = i
+        i += 1
+        if nfields != 3:
+            continue
+
+        s, ln = starts[0], ends[0] - starts[0]
+        same = ln == prev_len
+        if same:
+            for j in range(ln):
+                if buf[prev_start + j] != buf[s + j]:
+                    same = False
+                    break
+        if not same:
+            t = _timestamp_ms(buf, s, ends[0])
+            prev_start, prev_len = s, ln
+        ok, v = _value(buf, starts[2], ends[2])
+        if t == -2**62 or not ok:
+            return -1, ms, codes, values, name_start, name_len, ntypes
+
+        s, ln = starts[1], ends[1] - starts[1]
+        h = np.uint64(14695981039346656037)
+        for j in range(s, s + ln):
+            h = (h ^ np.uint64(buf[j])) * np.uint64(1099511628211)
+        slot = np.int64(h % np.uint64(table.size))
+        while True:
+            code = table[slot] - 1
+            if code < 0:
+                if ntypes == MAX_TYPES:
+                    return -1, ms, codes, values, name_start, name_len, ntypes
+                code = ntypes
+                ntypes += 1
+                table[slot] = code + 1
+                name_start[code] = s
+                name_len[code] = ln
+                break
+            if name_len[code] == ln:
+                same = True
+                for j in range(ln):
+                    if buf[name_start[code] + j] != buf[s + j]:
+                        same = False
+                        break
+                if same:
+                    break
+            slot = (slot + 1) % table.size
+
+        ms[nrows] = t
+        codes[nrows] = code
+        values[nrows] = v
+        nrows += 1
+    return nrows, ms, codes, values, name_start, name_len, ntypes
+
+
+@njit(cache=True)
+def window_stats(v, lo, hi, wmax, med, mad):
+    """
+    The median (and, if ``mad`` is not empty, the median absolute deviation)
+    of each window ``v[lo[i]:hi[i]]``, keeping the window sorted as it slides
+    rather than using spike_filter's wavelet matrix.  Each insertion and
+    removal is a binary search plus an O(window) shift.
+    """
+    s = np.empty(wmax)
+    c = 0
+    cur_lo = 0
+    cur_hi = 0
+    with_mad = mad.size > 0
+    for i in range(v.size):
+        # out with the old first, so the window never exceeds wmax
+        while cur_lo < lo[i]:
+            x = v[cur_lo]
+            p = np.searchsorted(s[:c], x)
+            for j in range(p, c - 1):
+                s[j] = s[j + 1]
+            c -= 1
+            cur_lo += 1
+        while cur_hi < hi[i]:
+            x = v[cur_hi]
+            p = np.searchsorted(s[:c], x)
+            for j in range(c, p, -1):
+                s[j] = s[j - 1]
+            s[p] = x
+            c += 1
+            cur_hi += 1
+
+        m = (s[(c - 1)//2] + s[c//2])/2
+        med[i] = m
+        if not with_mad:
+            continue
+        k = (c - 1)//2
+        a = 0
+        b = c - k - 1
+        while a < b:
+            mid = (a + b)//2
+            if m - s[mid] > s[mid + k + 1] - m:
+                a = mid + 1
+            else:
+                b = mid
+        dk = max(m - s[a], s[a + k] - m)
+        if c % 2 == 0:
+            nxt = np.inf
+            if a > 0:
+                nxt = m - s[a - 1]
+            if a + k + 1 < c:
+                nxt = min(nxt, s[a + k + 1] - m)
+            dk = (dk + nxt)/2
+        mad[i] = dk
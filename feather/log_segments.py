@@ -0,0 +1,83 @@
+"""
+Helpers for reading rotated and/or compressed logs.
+
+The monitors can rotate their logs into segments named like
+``co2.<tag>.log`` (optionally with ``.gz`` or ``.zst`` after them once closed),
+next to the active ``co2.log``.  These functions find the segments of a log,
+open them transparently whatever the compression, and work out which segments
+can be skipped for a time range by looking only at their first timestamp.
+"""
+
+import os
+import io
+import glob
+import gzip
+
+__all__ = ['open_log', 'find_segments', 'select_segments']
+
+COMPRESSED_EXTENSIONS = ('.gz', '.zst')
+
+
+def open_log(fn):
+    """
+    Opens ``fn`` for reading as text, decompressing as it streams if it ends in
+    .gz or .zst (the latter requires the zstandard package).
+    """
+    if fn.endswith('.gz'):
+        return gzip.open(fn, 'rt')
+    elif fn.endswith('.zst'):
+        import zstandard
+
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(fn, 'rb'), closefd=True))
+    else:
+        return open(fn, 'r')
+
+
+def _strip_compression(fn):
+    for ext in COMPRESSED_EXTENSIONS:
+        if fn.endswith(ext):
+            return fn[:-len(ext)]
+    return fn
+
+
+def find_segments(path):
+    """
+    Returns the files making up the log ``path``: for ``co2.log`` that is
+    ``co2.log`` itself (if present) plus any ``co2.*.log[.gz|.zst]`` segments.
+    ``path`` can also be a directory (all logs in it) or a glob pattern.
+    """
+    if os.path.isdir(path):
+        fns = glob.glob(os.path.join(path, '*.log*'))
+    elif glob.has_magic(path):
+        fns = glob.glob(path)
+    else:
+        stem, ext = os.path.splitext(_strip_compression(path))
+        fns = [fn for fn in glob.glob(glob.escape(stem) + '.*' + ext + '*')
+               if _strip_compression(fn).endswith(ext)]
+        if os.path.exists(path) and path not in fns:
+            fns.append(path)
+    return sorted(set(fns))
+
+
+def select_segments(segments, first_time, start_time=None, end_time=None):
+    """
+    Orders ``segments`` by their first timestamp (from ``first_time(fn)``, which
+    should return None for an empty segment) and drops any that cannot have data
+    between ``start_time`` and ``end_time``.  Each segment is taken to end where
+    the next one starts.
+    """
+    timed = []
+    for fn in segments:
+        t = first_time(fn)
+        if t is not None:
+            timed.append((t, fn))
+    timed.sort()
+
+    selected = []
+    for i, (t, fn) in enumerate(timed):
+        if end_time is not None and t > end_time:
+            continue
+        if start_time is not None and i + 1 < len(timed) and timed[i+1][0] < start_time:
+            continue
+        selected.append(fn)
+    return selected
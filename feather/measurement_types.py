@@ -0,0 +1,52 @@
+"""
+Dictionary encoding of the measurement type column: each type is a small
+integer code into a list of type names, so grouping and filtering are integer
+operations instead of repeated string comparisons and sorts.
+"""
+
+import numpy as np
+
+__all__ = ['code_dtype', 'encode_types', 'type_lookup', 'partition_by_type']
+
+
+def code_dtype(ntypes):
+    """
+    The smallest unsigned dtype that can hold ``ntypes`` codes.  Keeping codes at
+    16 bits or less lets numpy use radix sort for stable argsorts.
+    """
+    return np.min_scalar_type(max(ntypes - 1, 0))
+
+
+def encode_types(types):
+    """
+    Returns ``(codes, type_names)`` for an array of type name strings.
+    """
+    type_names, codes = np.unique(np.asarray(types), return_inverse=True)
+    return codes.astype(code_dtype(len(type_names))), [str(nm) for nm in type_names]
+
+
+def type_lookup(type_names, predicate):
+    """
+    Returns a boolean lookup table over the codes, so ``type_lookup(...)[codes]``
+    evaluates ``predicate(name)`` once per type rather than once per row.
+    """
+    return np.array([bool(predicate(nm)) for nm in type_names], dtype=bool)
+
+
+def partition_by_type(codes, type_names, *arrays):
+    """
+    Counting-sort partition of ``arrays`` by type code.  Returns a dictionary
+    mapping each type name present to a tuple of contiguous slices of the
+    (permuted) ``arrays``, with the original order preserved within each type.
+    """
+    codes = np.asarray(codes)
+    counts = np.bincount(codes, minlength=len(type_names))
+    bounds = np.zeros(len(counts) + 1, dtype=np.intp)
+    np.cumsum(counts, out=bounds[1:])
+
+    # stable argsort of small integers is a radix sort, i.e. O(n)
+    order = np.argsort(codes, kind='stable')
+    permuted = [arr[order] for arr in arrays]
+
+    return {type_names[i]: tuple(arr[bounds[i]:bounds[i+1]] for arr in permuted)
+            for i in range(len(type_names)) if counts[i]}
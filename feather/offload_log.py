@@ -0,0 +1,246 @@
+"""
+This script is to be run on the *host* to copy the log(s) off a feather over
+USB serial, instead of pulling the SD card.  It uses the raw REPL (see
+send_time.py) to run a small loop on the feather that streams the file in
+checksummed chunks.  A transfer that is interrupted or hits a bad chunk picks
+up from the last good byte, and re-running it later only fetches what was
+logged since.  Before resuming, the checksum of the start of the file on the
+feather is compared with the local copy, and if they differ (e.g. the log
+was rotated and this is a new one) the copy is started again from scratch.
+
+Logging stops while this runs (the feather is at the REPL), and the feather is
+soft-rebooted back into code.py at the end.
+
+Requires pyserial
+"""
+import os
+import sys
+import ast
+import time
+import zlib
+
+import send_time
+
+# Runs on the feather.  Chunks are "\x1e<offset> <nbytes> <checksum>\n" then the
+# data.  The log is ASCII text, so it is written as a str, and any "\r" the REPL
+# adds to line endings is dropped on the host.  Bytes that would not survive
+# that (non-ASCII or "\r", e.g. from a power loss mid-write) are sent as "?".
+DEVICE_CODE = """
+import os, sys
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None
+def _clean(buf, n):
+    mv = memoryview(buf)
+    try:
+        s = str(bytes(mv[:n]), 'ascii')
+        if '\\r' not in s:
+            return s
+    except UnicodeError:
+        pass
+    for i in range(n):
+        if buf[i] > 127 or buf[i] == 13:
+            buf[i] = 63
+    return str(bytes(mv[:n]), 'ascii')
+def _offload(fn, offset, chunk_size):
+    buf = bytearray(chunk_size)
+    mv = memoryview(buf)
+    print('SIZE', os.stat(fn)[6], 'crc32' if crc32 else 'sum')
+    with open(fn, 'rb') as f:
+        f.seek(offset)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            s = _clean(buf, n)
+            data = mv[:n]
+            print('\\x1e%d %d %d' % (offset, n, crc32(data) if crc32 else sum(data)))
+            sys.stdout.write(s)
+            offset += n
+    print('\\x1eEND', offset)
+def _prefix(fn, nbytes, chunk_size):
+    buf = bytearray(chunk_size)
+    mv = memoryview(buf)
+    size = os.stat(fn)[6]
+    check = 0
+    if size >= nbytes:
+        with open(fn, 'rb') as f:
+            while nbytes:
+                n = f.readinto(mv[:min(nbytes, chunk_size)])
+                if not n:
+                    break
+                _clean(buf, n)
+                check = crc32(mv[:n], check) if crc32 else check + sum(mv[:n])
+                nbytes -= n
+    print('PREFIX', size, check, 'crc32' if crc32 else 'sum')
+"""
+
+
+def _checksum(data, method, start=0):
+    if method == 'crc32':
+        return zlib.crc32(data, start)
+    return start + sum(data)
+
+
+def remote_prefix_matches(ser, remote_fn, local_fn, nbytes, chunk_size=2048):
+    """
+    Whether the first ``nbytes`` of ``remote_fn`` on the feather are those of
+    ``local_fn`` (as sent by `offload`), by checksum.  Must be in the raw REPL
+    with `DEVICE_CODE` already run.
+    """
+    out = send_time.run_code_raw(ser, f'_prefix({remote_fn!r}, {nbytes}, {chunk_size})')
+    fields = out.decode().split()
+    if fields[0] != 'PREFIX':
+        raise IOError(f'unexpected response {fields}')
+    remote_size, remote_check, method = int(fields[1]), int(fields[2]), fields[3]
+    if remote_size < nbytes:
+        return False
+    check = 0
+    with open(local_fn, 'rb') as f:
+        for data in iter(lambda: f.read(2**16), b''):
+            check = _checksum(data, method, check)
+    return check == remote_check
+
+
+def _read_chunk_data(ser, nbytes):
+    data = b''
+    while len(data) < nbytes:
+        # the REPL only ever adds bytes, so this never reads past the chunk
+        got = ser.read(nbytes - len(data))
+        if not got:
+            raise IOError(f'timed out with {len(data)} of {nbytes} bytes')
+        data += got.replace(b'\r', b'')
+    return data
+
+
+def list_remote_logs(ser, directory='/sd'):
+    """
+    Must be in the raw REPL.  Returns the log files (``*.log``) in
+    ``directory`` on the feather.
+    """
+    out = send_time.run_code_raw(ser, f'import os\nprint(os.listdir({directory!r}))')
+    return sorted(directory + '/' + fn for fn in ast.literal_eval(out.decode().strip())
+                  if fn.endswith('.log'))
+
+
+def _stream(ser, remote_fn, f, offset, chunk_size, stats):
+    send_time.send_raw_code(ser, f'_offload({remote_fn!r}, {offset}, {chunk_size})')
+    header = send_time.read_expected(ser, b'\n').decode().split()
+    if header[0] != 'SIZE':
+        raise IOError(f'unexpected response {header}')
+    remote_size, method = int(header[1]), header[2]
+    stats['remote_size'] = remote_size
+    if remote_size < offset:
+        send_time.interrupt_raw(ser, DEVICE_CODE)
+        raise ValueError(f'{remote_fn} on the feather ({remote_size} bytes) is '
+                         f'smaller than the local copy ({offset} bytes): use '
+                         '--restart if it is a new log')
+
+    while True:
+        send_time.read_expected(ser, b'\x1e')
+        fields = send_time.read_expected(ser, b'\n').decode().split()
+        if fields[0] == 'END':
+            send_time.read_raw_result(ser)
+            return True
+        choffset, nbytes, check = (int(x) for x in fields)
+        data = _read_chunk_data(ser, nbytes)
+        if choffset != offset or _checksum(data, method) != check:
+            return False
+        f.write(data)
+        f.flush()
+        offset += nbytes
+        stats['bytes'] += nbytes
+        stats['chunks'] += 1
+
+
+def offload(ser, remote_fn, local_fn, chunk_size=2048, resume=True,
+            max_retries=3):
+    """
+    Copies ``remote_fn`` on the feather to ``local_fn``, appending to
+    ``local_fn`` if it exists, ``resume`` is True and it is the start of
+    ``remote_fn`` (see `remote_prefix_matches`).  Must be in the raw REPL
+    with `DEVICE_CODE` already run.  Returns a dictionary with the bytes and
+    chunks transferred, the number of retries, whether it had to 'restart'
+    from scratch, elapsed seconds and throughput.
+    """
+    st = time.perf_counter()
+    offset = os.path.getsize(local_fn) if resume and os.path.exists(local_fn) else 0
+    restart = bool(offset) and not remote_prefix_matches(ser, remote_fn, local_fn,
+                                                         offset, chunk_size)
+    if restart:
+        offset = 0
+    stats = {'bytes': 0, 'chunks': 0, 'retries': 0, 'start_offset': offset,
+             'restart': restart}
+
+    # only verified chunks are written, so the local file is always good to
+    # resume from
+    with open(local_fn, 'ab' if offset else 'wb') as f:
+        while True:
+            pos = offset + stats['bytes']
+            try:
+                if _stream(ser, remote_fn, f, pos, chunk_size, stats):
+                    break
+                problem = 'bad chunk'
+            except IOError as e:  # e.g. a timeout
+                problem = e
+            stats['retries'] += 1
+            if stats['retries'] > max_retries:
+                raise IOError(f'giving up on {remote_fn} at byte {pos} after '
+                              f'{max_retries} retries: {problem}')
+            send_time.interrupt_raw(ser, DEVICE_CODE)
+    stats['elapsed'] = time.perf_counter() - st
+    stats['bytes_per_sec'] = stats['bytes'] / stats['elapsed'] if stats['elapsed'] > 0 else 0
+    return stats
+
+
+if __name__ == '__main__':
+    import serial
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('serialport')
+    parser.add_argument('local_dir', nargs='?', default='.', help='where to put the logs')
+    parser.add_argument('--baudrate', '-b', default=115200)
+    parser.add_argument('--waittime', '-w', type=float, default=0.5)
+    parser.add_argument('--remote', '-r', default=None, help='a single file to copy (default: every .log in /sd)')
+    parser.add_argument('--chunk-size', '-c', type=int, default=2048)
+    parser.add_argument('--restart', action='store_true', help='copy from the start instead of resuming')
+    parser.add_argument('--no-reboot', action='store_true', help='stay at the REPL afterwards instead of restarting code.py')
+
+    args = parser.parse_args()
+
+    failed = []
+    with serial.Serial(args.serialport, args.baudrate,
+                       timeout=args.waittime) as ser:
+        send_time.get_repl(ser, args.waittime)
+        send_time.enter_raw_repl(ser)
+        try:
+            send_time.run_code_raw(ser, DEVICE_CODE)
+            remote_fns = [args.remote] if args.remote else list_remote_logs(ser)
+            total = 0
+            st = time.perf_counter()
+            for remote_fn in remote_fns:
+                local_fn = os.path.join(args.local_dir, os.path.basename(remote_fn))
+                try:
+                    res = offload(ser, remote_fn, local_fn, args.chunk_size,
+                                  resume=not args.restart)
+                except Exception as e:
+                    # carry on with the other files
+                    print(f'{remote_fn} -> {local_fn}: failed: {e}')
+                    failed.append(remote_fn)
+                    send_time.interrupt_raw(ser, DEVICE_CODE)
+                    continue
+                total += res['bytes']
+                print('{} -> {}: {} new bytes from offset {}{} in {:.1f}s ({:.1f} kB/s, {} retries)'.format(
+                      remote_fn, local_fn, res['bytes'], res['start_offset'],
+                      ' (the local copy did not match, so copied afresh)' if res['restart'] else '',
+                      res['elapsed'], res['bytes_per_sec']/1000, res['retries']))
+            elapsed = time.perf_counter() - st
+            print('Total: {} bytes in {:.1f}s ({:.1f} kB/s)'.format(total, elapsed, total/elapsed/1000))
+        finally:
+            send_time.exit_raw_repl(ser)
+            if not args.no_reboot:
+                ser.write(send_time.CTRLD)
+    if failed:
+        sys.exit(f'Failed: {", ".join(failed)}')
@@ -0,0 +1,162 @@
+"""
+A cache of rendered `cozir_parser.plot_cozir_data` images on disk, keyed on a
+hash of the data being plotted and all the plot options, so asking again for
+the same plot (the same time range of an unchanged log, the same units and
+types...) returns the stored image without drawing it, and only plots whose
+data has changed (e.g. today's) are drawn again.  The cache is kept under
+``max_bytes`` by deleting the least recently used images.
+
+Several processes can share a cache directory: images are written to a
+temporary file and renamed into place.
+"""
+import os
+import shutil
+import hashlib
+import inspect
+import tempfile
+
+import numpy as np
+
+__all__ = ['RenderCache']
+
+# change this when plot_cozir_data changes what it draws, to not reuse old images
+RENDER_VERSION = 1
+
+# plot_cozir_data arguments that do not change the image
+_IGNORED_ARGS = ('tab', 'outfilename', 'fig')
+
+
+def _plot_options(plot_kwargs):
+    """
+    All of the plot_cozir_data options, with defaults filled in so leaving
+    one out and passing its default give the same key.
+    """
+    import cozir_parser
+
+    bound = inspect.signature(cozir_parser.plot_cozir_data).bind_partial(**plot_kwargs)
+    bound.apply_defaults()
+    options = {}
+    for nm, v in bound.arguments.items():
+        if nm in _IGNORED_ARGS:
+            continue
+        if nm in ('include_types', 'exclude_types') and v is not None:
+            v = sorted(v)
+        options[nm] = v
+    return options
+
+
+class RenderCache:
+    def __init__(self, directory, max_bytes=256 * 2**20, format='png'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.format = format
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, cols, **plot_kwargs):
+        """
+        The hex digest identifying the plot of ``cols`` (as output by
+        `cozir_parser.read_log_columns`) with ``plot_kwargs``.
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(repr((RENDER_VERSION, self.format,
+                       sorted(_plot_options(plot_kwargs).items()))).encode())
+        # only the type names used by these rows matter
+        used = np.unique(cols['type_code'])
+        h.update(repr([cols['type_names'][i] for i in used]).encode())
+        for nm in ('timestamp', 'type_code', 'value'):
+            arr = np.ascontiguousarray(cols[nm])
+            h.update(arr.dtype.str.encode())
+            h.update(arr.view(np.uint8) if arr.dtype.kind == 'M' else arr)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.{self.format}')
+
+    def lookup(self, cols, **plot_kwargs):
+        """
+        Returns ``(key, path of the cached image or None)``.
+        """
+        key = self.key(cols, **plot_kwargs)
+        path = self.path(key)
+        try:
+            os.utime(path)  # the modification time is the last use, for eviction
+        except FileNotFoundError:
+            self.misses += 1
+            return key, None
+        self.hits += 1
+        return key, path
+
+    def store(self, key, filename):
+        """
+        Copies the rendered image ``filename`` into the cache as ``key``, then
+        evicts old images if the cache is over ``max_bytes``.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f, open(filename, 'rb') as src:
+                shutil.copyfileobj(src, f)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def plot(self, cols, outfilename=None, **plot_kwargs):
+        """
+        `cozir_parser.plot_cozir_data` through the cache: returns the path of
+        the cached image, drawing it first if it is not there, and copies it
+        to ``outfilename`` if given.
+        """
+        import cozir_parser
+
+        key, path = self.lookup(cols, **plot_kwargs)
+        if path is None:
+            from matplotlib import pyplot as plt
+
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.' + self.format)
+            os.close(fd)
+            try:
+                fig = cozir_parser.plot_cozir_data(cols, tmp, **plot_kwargs)
+                plt.close(fig)
+                os.replace(tmp, self.path(key))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            path = self.path(key)
+            self.evict()
+        if outfilename is not None:
+            shutil.copyfile(path, outfilename)
+        return path
+
+    def evict(self):
+        """
+        Deletes the least recently used images until the cache is within
+        ``max_bytes``.
+        """
+        entries = []
+        total = 0
+        suffix = '.' + self.format
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                # skipping temporary files, which are still being written
+                if len(entry.name) != 40 + len(suffix) or not entry.name.endswith(suffix):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
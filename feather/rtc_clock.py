@@ -0,0 +1,161 @@
+import time
+import rtc_time
+
+SECS_PER_DAY = 86400
+
+
+def days_from_date(yr, mon, day):
+    """
+    Days since 2000-01-01 for a date in 2000-2099 (the DS3231's range).
+    """
+    # counting years from March makes the leap day the last day of the year
+    if mon <= 2:
+        yr -= 1
+    mp = (mon + 9) % 12
+    # days since 2000-03-01, and 2000-01-01 is 60 days before that
+    return 365*yr + yr//4 + (153*mp + 2)//5 + day - 1 + 60
+
+
+def date_from_days(days):
+    """
+    The inverse of `days_from_date`, as (yr, mon, day) with a 2-digit year.
+    """
+    # days since 2000-03-01 splits into 4-year cycles that end with the leap day
+    days -= 60
+    quad, doq = divmod(days, 1461)
+    yoq = min(doq // 365, 3)
+    doy = doq - 365*yoq
+    mp = (5*doy + 2) // 153
+    day = doy - (153*mp + 2)//5 + 1
+    mon = mp + 3 if mp < 10 else mp - 9
+    yr = 4*quad + yoq + (1 if mon <= 2 else 0)
+    return yr, mon, day
+
+
+class RTCClock:
+    """
+    Makes log timestamps from ``time.monotonic()`` offsets from the last time
+    the DS3231 was read, so a cycle needs no I2C traffic for its timestamps and
+    they have sub-second resolution.  `sync` waits for the RTC's seconds to tick
+    over so the monotonic time of a whole RTC second is known, and repeated
+    syncs give the rate of the monotonic clock relative to the RTC (``drift``,
+    a fraction), which is corrected for between syncs.
+
+    With ``i2c=None`` (no RTC) the timestamps are just ``time.monotonic()``,
+    as before.  Timestamps are only as fine as ``time.monotonic()``, which
+    coarsens with uptime on boards with single precision floats.
+    """
+    def __init__(self, i2c=None, resync_sec=3600, min_drift_sec=600):
+        self.i2c = i2c
+        self.resync_sec = resync_sec
+        self.min_drift_sec = min_drift_sec
+        self.drift = 0.
+
+        self.synced = None  # monotonic time of the last sync's RTC second
+        self.aligned = False
+        self._align_failed = False
+        self._day = 0
+        self._sec = 0
+        self._anchor = None  # (rtc seconds since 2000, monotonic) of the first aligned sync
+        self._date_day = None
+        self._date = None
+
+    def _read_rtc(self, align):
+        regs = rtc_time.rtc_read(self.i2c, 0, 7)
+        if align:
+            sec = regs[0]
+            end = time.monotonic() + 1.1
+            while regs[0] == sec and time.monotonic() < end:
+                time.sleep(.005)
+                regs = rtc_time.rtc_read(self.i2c, 0, 7)
+            if regs[0] == sec:
+                align = False
+        return rtc_time.time_from_registers(regs), time.monotonic(), align
+
+    def sync(self, align=True):
+        """
+        Reads the RTC, and returns how far off (seconds, RTC minus ours) the
+        timestamps had drifted, or None if they could not be checked (first
+        sync, no RTC, or either this or the previous sync were not aligned).
+        Without ``align`` this does not wait for the next RTC second, but the
+        timestamps can be up to a second behind until the next aligned sync.
+        """
+        if self.i2c is None:
+            return None
+        (yr, mon, day, hr, mn, sec), mono, aligned = self._read_rtc(align)
+        day = days_from_date(yr, mon, day)
+        sec = (hr*60 + mn)*60 + sec
+        rtc_secs = day*SECS_PER_DAY + sec
+
+        offset = None
+        if aligned and self.aligned:
+            pday, psec, pfrac = self._split(mono)
+            offset = ((day - pday)*SECS_PER_DAY + sec - psec) - pfrac
+        if aligned:
+            if self._anchor is None:
+                self._anchor = (rtc_secs, mono)
+            elif mono - self._anchor[1] >= self.min_drift_sec:
+                self.drift = (rtc_secs - self._anchor[0]) / (mono - self._anchor[1]) - 1
+
+        self._day = day
+        self._sec = sec
+        self.synced = mono
+        self.aligned = aligned
+        self._align_failed = align and not aligned
+        return offset
+
+    def due(self, t=None):
+        """
+        True if it is ``resync_sec`` since the last sync, or the last sync was
+        not aligned (unless that was because the RTC's seconds did not tick).
+        """
+        if self.i2c is None:
+            return False
+        if t is None:
+            t = time.monotonic()
+        if self.synced is None or (not self.aligned and not self._align_failed):
+            return True
+        return t - self.synced >= self.resync_sec
+
+    def _split(self, t):
+        """
+        (days since 2000, second of the day, fraction of a second) at
+        monotonic time ``t``.
+        """
+        elapsed = (t - self.synced) * (1 + self.drift)
+        whole = int(elapsed)
+        sec = self._sec + whole
+        day = self._day
+        if sec >= SECS_PER_DAY:
+            day += sec // SECS_PER_DAY
+            sec %= SECS_PER_DAY
+        return day, sec, elapsed - whole
+
+    def seconds(self, t=None):
+        """
+        Whole seconds since 2000 at monotonic time ``t`` (default now), or
+        since boot if there is no RTC.  An int, since a single precision float
+        would round it to minutes.
+        """
+        if t is None:
+            t = time.monotonic()
+        if self.i2c is None or self.synced is None:
+            return int(t)
+        day, sec, frac = self._split(t)
+        return day*SECS_PER_DAY + sec
+
+    def timestamp(self, t=None):
+        """
+        The log timestamp bytearray for monotonic time ``t`` (default now).
+        """
+        if t is None:
+            t = time.monotonic()
+        if self.i2c is None or self.synced is None:
+            return bytearray(repr(t))
+        day, sec, frac = self._split(t)
+        if day != self._date_day:
+            self._date = '20{:02}-{:02}-{:02}T'.format(*date_from_days(day))
+            self._date_day = day
+        mn, sec = divmod(sec, 60)
+        hr, mn = divmod(mn, 60)
+        return bytearray('{}{}:{}:{}.{:02}'.format(self._date, hr, mn, sec, min(int(frac*100), 99)))
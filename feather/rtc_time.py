@@ -73,11 +73,22 @@ def get_time(i2c):
     """
     returns yr, mon, day, hr, min, sec
     """
+    return time_from_registers(rtc_read(i2c, 0, 7))
+
+
+def time_from_registers(regs):
+    """
+    ``regs`` are the 7 time registers starting at 0
+    """
     # assumes 24 hour time is set
-    sec, min, hr, day, date, mon, yr = rtc_read(i2c, 0, 7)
+    sec, min, hr, day, date, mon, yr = regs
     return from_bcd(yr), from_bcd(mon&0b11111), from_bcd(date), from_bcd(hr&0b111111), from_bcd(min), from_bcd(sec)
 
 
-def get_time_bytearray(i2c):
-    vals = dict(zip('yr,mon,day,hr,min,sec'.split(','), get_time(i2c)))
+def format_time_bytearray(time_tuple):
+    vals = dict(zip('yr,mon,day,hr,min,sec'.split(','), time_tuple))
     return bytearray('20{yr:02}-{mon:02}-{day:02}T{hr}:{min}:{sec}.0'.format(**vals))
+
+
+def get_time_bytearray(i2c):
+    return format_time_bytearray(get_time(i2c))
@@ -1,7 +1,8 @@
 """
 This script is to be run on the *host* to send the time the host thinks it is
 to the RTC on the feather. Note that rtc_time.py must be present on the feather
-for this to work.
+for this to work.  To set several at once, and more precisely, use
+fleet_time.py.
 
 Requires pyserial
 """
@@ -9,8 +10,11 @@ import time
 import serial
 from datetime import datetime, timedelta
 
+CTRLA = chr(1).encode()
+CTRLB = chr(2).encode()
 CTRLC = chr(3).encode()
 CTRLD = chr(4).encode()
+RAW_REPL_BANNER = b'raw REPL; CTRL-B to exit\r\n>'
 
 def get_repl(ser, wait_for_reset_sec=.5):
     ot = ser.timeout
@@ -52,15 +56,84 @@ def run_code(ser, codestr):
         outs.append(out[:-4])
     return outs
 
-def set_time_from_datetime(ser, dt):
-    set_time_dct = {'yr':dt.year, 'mon':dt.month, 'date':dt.day,
-                    'day': dt.weekday()+1,
-                    'hr':dt.hour, 'min':dt.minute, 'sec':dt.second}
+def read_expected(ser, expected):
+    out = ser.read_until(expected)
+    if not out.endswith(expected):
+        raise IOError(f'Expected "{expected}" but got "{out}"')
+    return out
+
+# The raw REPL does not echo and takes a whole block of code at a time (ended
+# by ctrl-D), replying "OK", the output, ctrl-D, any traceback, ctrl-D, ">".
+# That avoids the per-line echo and prompt round trips of `run_code`.
+
+def enter_raw_repl(ser):
+    """
+    Must already be at the normal REPL (see `get_repl`).
+    """
+    ser.reset_input_buffer()
+    ser.write(CTRLA)
+    read_expected(ser, RAW_REPL_BANNER)
+
+def exit_raw_repl(ser):
+    ser.write(CTRLB)
+    read_expected(ser, b'>>> ')
+
+def send_raw_code(ser, codestr, blocksize=256, block_delay=.01):
+    """
+    Starts ``codestr`` running in the raw REPL, leaving its output to be read
+    (with `read_raw_result` or otherwise).  The code goes in small blocks so
+    the board's input buffer does not overflow.
+    """
+    code = codestr.encode()
+    for i in range(0, len(code), blocksize):
+        ser.write(code[i:i+blocksize])
+        time.sleep(block_delay)
+    ser.write(CTRLD)
+    read_expected(ser, b'OK')
+
+def read_raw_result(ser):
+    out = read_expected(ser, CTRLD)[:-1]
+    err = read_expected(ser, CTRLD)[:-1]
+    read_expected(ser, b'>')
+    if err:
+        raise ValueError(f'Got traceback!:\n{err.decode(errors="replace")}')
+    return out
+
+def run_code_raw(ser, codestr):
+    send_raw_code(ser, codestr)
+    return read_raw_result(ser)
+
+def interrupt_raw(ser, setup_code=None, wait_sec=.5):
+    """
+    Stops code running in the raw REPL and discards its output, leaving the
+    raw REPL ready for the next block.  ``setup_code`` (e.g. the functions the
+    later blocks call) is then run again, in case the board lost it.
+    """
+    ser.write(CTRLC)
+    time.sleep(wait_sec)
+    ser.reset_input_buffer()
+    # ctrl-A restarts the raw REPL (or enters it, if the board dropped out of
+    # it).  Not an empty ctrl-D block: that soft-resets the board.
+    ser.write(CTRLA)
+    read_expected(ser, RAW_REPL_BANNER)
+    if setup_code is not None:
+        run_code_raw(ser, setup_code)
 
+def set_time_from_datetime(ser, dt):
+    """
+    ``dt`` can also be a function returning the datetime, which is called
+    after the (slow) setup, right before the time is written.
+    """
     run_code(ser, 'import rtc_time, board, busio\n'
                   'i2c=busio.I2C(board.SCL, board.SDA)\n'
                   #'i2c.try_lock()\n'
                   'rtc_time.setup_rtc(i2c)\n')
+    if callable(dt):
+        dt = dt()
+    set_time_dct = {'yr':dt.year, 'mon':dt.month, 'date':dt.day,
+                    'day': dt.weekday()+1,
+                    'hr':dt.hour, 'min':dt.minute, 'sec':dt.second}
+
     set_time_args = ','.join([nm+'='+str(v) for nm, v in set_time_dct.items()])
     run_code(ser, f'rtc_time.set_time(i2c, {set_time_args})\n')
     time.sleep(1)
@@ -86,5 +159,5 @@ if __name__ == '__main__':
 
         get_repl(ser, args.waittime)
         dt = timedelta(seconds=args.offset_secs, hours=args.tzoffset)
-        res = set_time_from_datetime(ser, datetime.now() + dt)
+        res = set_time_from_datetime(ser, lambda: datetime.now() + dt)
         print("Result from setting time:", res)
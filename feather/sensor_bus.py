@@ -0,0 +1,102 @@
+import time
+
+BME280_ADDR = 0x77
+SGP30_ADDR = 0x58
+
+# the oversampling (x1 for everything) that cozir_mon_feather.setup_bme280 sets
+BME280_OSRS = (1, 1, 1)  # temperature, pressure, humidity
+BME280_CTRL_MEAS = 0b00100100
+# max time for an SGP30 measure_iaq, from the datasheet
+SGP30_MEASURE_SECS = .012
+
+
+def bme280_measure_time(osrs_t=1, osrs_p=1, osrs_h=1):
+    """
+    The maximum time (seconds) a forced-mode measurement takes, from section 9.1
+    of the BME280 datasheet: 9.3 ms with x1 oversampling of everything.  An
+    oversampling of 0 means that measurement is skipped.
+    """
+    ms = 1.25 + 2.3*osrs_t
+    if osrs_p:
+        ms += 2.3*osrs_p + .575
+    if osrs_h:
+        ms += 2.3*osrs_h + .575
+    return ms / 1000
+
+
+class SensorBus:
+    """
+    Does a cycle's I2C sensor reads while holding the bus once (use as a context
+    manager; timestamps come from `rtc_clock.RTCClock` without touching it),
+    with buffers allocated up front rather than every cycle.  The BME280 and
+    SGP30 are both started, and then read after a single sleep for the longer
+    of their datasheet measurement times.  If the BME280 is still busy then,
+    its status is polled at most ``max_polls`` times.
+    """
+    def __init__(self, i2c, bme280=False, sgp30=False, max_polls=10):
+        self.i2c = i2c
+        self.bme280 = bme280
+        self.sgp30 = sgp30
+        self.max_polls = max_polls
+        self.bme280_wait = bme280_measure_time(*BME280_OSRS)
+
+        self._cmd = bytearray(2)
+        self._reg = bytearray(1)
+        self._status = bytearray(1)
+        self._tph = bytearray(8)
+        self._sgp = bytearray(6)
+
+    def __enter__(self):
+        while not self.i2c.try_lock():
+            pass
+        return self
+
+    def __exit__(self, *exc):
+        self.i2c.unlock()
+
+    def start(self):
+        """
+        Starts the measurements and returns how long to wait for them.
+        """
+        wait = 0
+        if self.bme280:
+            self._cmd[0] = 0xf4
+            self._cmd[1] = BME280_CTRL_MEAS | 0b01  # forced mode
+            self.i2c.writeto(BME280_ADDR, self._cmd)
+            wait = self.bme280_wait
+        if self.sgp30:
+            self._cmd[0] = 0x20
+            self._cmd[1] = 0x08  # measure_iaq
+            self.i2c.writeto(SGP30_ADDR, self._cmd)
+            wait = max(wait, SGP30_MEASURE_SECS)
+        return wait
+
+    def read_bme280(self):
+        """
+        Returns the raw (temperature, pressure, humidity), or None if the
+        measurement never finished.
+        """
+        self._reg[0] = 0xf3
+        for _ in range(self.max_polls):
+            self.i2c.writeto_then_readfrom(BME280_ADDR, self._reg, self._status)
+            if not self._status[0] & 0b1001:
+                break
+            time.sleep(.001)
+        else:
+            return None
+
+        self._reg[0] = 0xf7
+        b = self._tph
+        self.i2c.writeto_then_readfrom(BME280_ADDR, self._reg, b)
+        praw = (b[2] >> 4) | (b[1] << 4) | (b[0] << 12)
+        traw = (b[5] >> 4) | (b[4] << 4) | (b[3] << 12)
+        hraw = b[7] | (b[6] << 8)
+        return traw, praw, hraw
+
+    def read_sgp30(self):
+        """
+        Returns (eCO2, TVOC).  No CRC check.
+        """
+        b = self._sgp
+        self.i2c.readfrom_into(SGP30_ADDR, b)
+        return (b[0] << 8) | b[1], (b[3] << 8) | b[4]
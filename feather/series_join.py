@@ -0,0 +1,110 @@
+"""
+As-of joins for lining up measurement series that were sampled at different
+times (e.g. the CozirA and BME280 rows of a cycle), so derived quantities like
+dewpoint are computed from correctly-paired samples.
+
+All of the matching is done with ``np.searchsorted``, so joining millions of
+rows is a handful of vectorized passes.
+"""
+
+import numpy as np
+
+import value_dtype
+
+__all__ = ['asof_indices', 'asof_join', 'align_series']
+
+
+def _as_numeric(timestamps):
+    """
+    datetime64 -> float seconds since the epoch, anything else -> float
+    """
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind == 'M':
+        return timestamps.astype('datetime64[ms]').astype(np.int64) / 1000.
+    return timestamps.astype(float)
+
+
+def asof_indices(target, source, tolerance=None, direction='nearest'):
+    """
+    For each of the ``target`` times, find the index of the matching ``source``
+    time, or -1 if there is none within ``tolerance``.  ``direction`` is
+    'backward' (latest source at or before the target), 'forward' (earliest
+    source at or after) or 'nearest'.  ``source`` must be sorted.  Times can be
+    datetime64 (tolerance in seconds) or plain numbers (tolerance in the same
+    units).
+    """
+    target = _as_numeric(target)
+    source = _as_numeric(source)
+    n = len(source)
+    if n == 0:
+        return np.full(len(target), -1, dtype=np.intp)
+
+    # index of the first source strictly after each target
+    after = np.searchsorted(source, target, side='right')
+    back = after - 1
+    # and the first at-or-after
+    fwd = np.searchsorted(source, target, side='left')
+
+    back_ok = back >= 0
+    fwd_ok = fwd < n
+    back_dist = np.where(back_ok, target - source[np.clip(back, 0, n-1)], np.inf)
+    fwd_dist = np.where(fwd_ok, source[np.clip(fwd, 0, n-1)] - target, np.inf)
+
+    if direction == 'backward':
+        idx, dist = back, back_dist
+    elif direction == 'forward':
+        idx, dist = fwd, fwd_dist
+    elif direction == 'nearest':
+        use_fwd = fwd_dist < back_dist
+        idx = np.where(use_fwd, fwd, back)
+        dist = np.where(use_fwd, fwd_dist, back_dist)
+    else:
+        raise ValueError(f'invalid direction {direction}')
+
+    bad = ~np.isfinite(dist)
+    if tolerance is not None:
+        bad |= dist > tolerance
+    return np.where(bad, -1, idx)
+
+
+def asof_join(target, source, source_values, tolerance=None,
+              direction='nearest'):
+    """
+    Returns ``source_values`` resampled onto the ``target`` times, with NaN
+    where there is no source sample within ``tolerance``.  ``source`` need not
+    be sorted.  The result has the dtype of ``source_values`` if they are
+    float32/float64 (see `value_dtype`).
+    """
+    source = np.asarray(source)
+    source_values = value_dtype.as_values(source_values)
+    if len(source) > 1 and np.any(source[1:] < source[:-1]):
+        order = np.argsort(source, kind='stable')
+        source = source[order]
+        source_values = source_values[order]
+
+    idx = asof_indices(target, source, tolerance, direction)
+    out = np.full(len(idx), np.nan, dtype=source_values.dtype)
+    matched = idx >= 0
+    out[matched] = source_values[idx[matched]]
+    return out
+
+
+def align_series(series, on=None, tolerance=None, direction='nearest'):
+    """
+    Aligns several series onto a common time axis.  ``series`` maps names to
+    ``(times, values)``.  If ``on`` is a name, its times are the common axis,
+    otherwise the sorted union of all the times is used.  Returns
+    ``(times, {name: aligned_values})`` with NaN for unmatched samples.
+    """
+    if on is None:
+        times = np.unique(np.concatenate([np.asarray(ts) for ts, _ in series.values()]))
+    else:
+        times = np.asarray(series[on][0])
+
+    aligned = {}
+    for name, (ts, vals) in series.items():
+        if name == on:
+            aligned[name] = value_dtype.as_values(vals)
+        else:
+            aligned[name] = asof_join(times, ts, vals, tolerance, direction)
+    return times, aligned
@@ -0,0 +1,354 @@
+"""
+Removal of spikes (single bad readings) from a series, e.g. the CozIR's raw
+CO2 (``cozirA_raw``, its ``z`` field) or the SGP30's eCO2.
+
+Both filters look at a centered window of ``window`` seconds around each
+sample, so work on irregularly spaced samples and across gaps:
+`rolling_median` replaces each value with the median of the window, and
+`hampel` only replaces the values further than ``n_sigmas`` robust standard
+deviations (1.4826 times the median absolute deviation of the window) from the
+median, leaving the rest of the series untouched.  NaNs are left in place and
+ignored by the windows.
+
+The numpy versions find the order statistics of all the windows at once with
+a wavelet matrix of the value ranks, in O(log(distinct values)) array passes
+per statistic; the numba engine (see compute_engine.py) slides a sorted window
+along the series.  Each sample going in or out of a window of w is found by
+binary search, but the values after it then have to be shifted, so a sample
+costs O(w), not O(log w); with the usual windows of tens to hundreds of
+samples that shift is a short memmove.  `SpikeFilter` does the same one sample
+at a time, for a followed log: each filtered sample comes out once a sample
+more than half a window later has gone in.  All three give exactly the same
+results.
+
+`filter_columns` applies filters to chosen measurement types of a set of
+columns, and is what the ``filters`` of `cozir_parser.read_log_columns` and
+``--filter`` of the command line tools use.
+"""
+from bisect import bisect_left, insort
+from collections import deque
+
+import numpy as np
+
+__all__ = ['rolling_median', 'hampel', 'filter_series', 'filter_columns',
+           'parse_filters', 'SpikeFilter']
+
+KINDS = ('median', 'hampel')
+# scales a median absolute deviation to the standard deviation of a normal
+MAD_SCALE = 1.4826
+DEFAULT_FILTERS = {'cozirA_raw': dict(kind='hampel', window=600., n_sigmas=3.),
+                   'sgp30_eco2': dict(kind='hampel', window=600., n_sigmas=3.)}
+# rows of a series whose windows are computed together (bounds the memory)
+_CHUNK_ROWS = 2**20
+
+
+def _to_seconds(timestamps):
+    """
+    Float seconds (since the epoch for datetimes) of an array of timestamps.
+    """
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind == 'M':
+        return timestamps.astype('datetime64[ms]').astype(np.int64) / 1000.
+    return timestamps.astype(float)
+
+
+class _WaveletMatrix:
+    """
+    For the k-th smallest of ``x[l:r]`` (``x`` integers < 2**nbits) for many
+    ``(l, r, k)`` at once.  Each level is the stable partition of the one
+    above by a bit, most significant first, with the running count of zero
+    bits needed to follow a range down to the next level.
+    """
+    def __init__(self, x, nbits):
+        self.levels = []
+        for b in range(nbits - 1, -1, -1):
+            bit = (x >> b) & 1
+            zeros = np.zeros(len(x) + 1, dtype=np.int32)
+            np.cumsum(bit == 0, out=zeros[1:])
+            self.levels.append((b, zeros, zeros[-1]))
+            x = np.concatenate([x[bit == 0], x[bit == 1]])
+
+    def kth(self, l, r, k):
+        l = l.astype(np.int32)
+        r = r.astype(np.int32)
+        k = k.astype(np.int32)
+        res = np.zeros(len(l), dtype=np.int32)
+        for b, zeros, nzeros in self.levels:
+            zl = zeros[l]
+            zr = zeros[r]
+            nz = zr - zl
+            one = k >= nz
+            k -= nz*one
+            # l = where(one, nzeros + l - zl, zl), in place
+            l -= 2*zl
+            l += nzeros
+            l *= one
+            l += zl
+            r -= 2*zr
+            r += nzeros
+            r *= one
+            r += zr
+            res |= one.astype(np.int32) << b
+        return res
+
+
+def _window_stats_numpy(v, lo, hi, with_mad):
+    """
+    The medians (and median absolute deviations from them) of the windows
+    ``v[lo[i]:hi[i]]``, ``v`` without NaNs.
+    """
+    n = len(v)
+    med = np.empty(n)
+    mad = np.empty(n) if with_mad else None
+    for st in range(0, n, _CHUNK_ROWS):
+        end = min(st + _CHUNK_ROWS, n)
+        base = lo[st]
+        uniq, ranks = np.unique(v[base:hi[end - 1]], return_inverse=True)
+        wm = _WaveletMatrix(ranks.reshape(-1), max(1, int(len(uniq) - 1).bit_length()))
+        l = lo[st:end] - base
+        r = hi[st:end] - base
+        c = r - l
+        even = np.flatnonzero(c % 2 == 0)
+
+        def s(q, rows=slice(None)):  # the q-th smallest of each window
+            return uniq[wm.kth(l[rows], r[rows], q)]
+
+        k = (c - 1)//2
+        m = s(k)
+        m[even] = (m[even] + s(k[even] + 1, even))/2
+        med[st:end] = m
+        if not with_mad:
+            continue
+
+        # the k+1 values closest to the median are a run s(a)..s(a+k) of the
+        # sorted window; find a by bisection, like for a sorted array
+        a = np.zeros_like(c)
+        b = c - k - 1
+        while True:
+            act = np.flatnonzero(a < b)
+            if not len(act):
+                break
+            mid = (a[act] + b[act])//2
+            further = m[act] - s(mid, act) > s(mid + k[act] + 1, act) - m[act]
+            a[act] = np.where(further, mid + 1, a[act])
+            b[act] = np.where(further, b[act], mid)
+        dk = np.maximum(m - s(a), s(a + k) - m)
+        # for even windows, the next closest is just outside the run
+        ae, ke, me = a[even], k[even], m[even]
+        nxt = np.full(len(even), np.inf)
+        has = np.flatnonzero(ae > 0)
+        nxt[has] = me[has] - s(ae[has] - 1, even[has])
+        has = np.flatnonzero(ae + ke + 1 < c[even])
+        nxt[has] = np.minimum(nxt[has], s(ae[has] + ke[has] + 1, even[has]) - me[has])
+        dk[even] = (dk[even] + nxt)/2
+        mad[st:end] = dk
+    return med, mad
+
+
+def _window_stats(secs, values, window, with_mad, engine):
+    """
+    ``(medians, MADs or None)`` of the windows of each sample, NaN for NaN
+    samples, with ``secs`` in any order.
+    """
+    import compute_engine
+
+    values = np.asarray(values, dtype=float)
+    order = None
+    if np.any(secs[1:] < secs[:-1]):
+        order = np.argsort(secs, kind='stable')
+        secs, values = secs[order], values[order]
+    ok = ~np.isnan(values)
+    t, v = secs[ok], values[ok]
+    lo = np.searchsorted(t, t - window/2, 'left')
+    hi = np.searchsorted(t, t + window/2, 'right')
+
+    if len(v) and compute_engine.resolve_engine(engine) == 'numba':
+        med = np.empty(len(v))
+        mad = np.empty(len(v) if with_mad else 0)
+        compute_engine.jit_kernels().window_stats(v, lo, hi, int(np.max(hi - lo)), med, mad)
+        if not with_mad:
+            mad = None
+    else:
+        med, mad = _window_stats_numpy(v, lo, hi, with_mad)
+
+    out = []
+    for stat in (med, mad):
+        if stat is None:
+            out.append(None)
+            continue
+        full = np.full(len(values), np.nan)
+        full[ok] = stat
+        if order is not None:
+            full[order] = full.copy()
+        out.append(full)
+    return tuple(out)
+
+
+def rolling_median(timestamps, values, window, engine=None):
+    """
+    The median of the samples within ``window``/2 seconds of each sample.
+    """
+    return _window_stats(_to_seconds(timestamps), values, window, False, engine)[0]
+
+
+def hampel(timestamps, values, window, n_sigmas=3., engine=None):
+    """
+    Returns ``(filtered values, mask of the spikes)``, where the spikes are the
+    values more than ``n_sigmas`` times 1.4826 times the median absolute
+    deviation of the samples within ``window``/2 seconds from their median,
+    and are replaced by that median.
+    """
+    values = np.asarray(values, dtype=float)
+    med, mad = _window_stats(_to_seconds(timestamps), values, window, True, engine)
+    with np.errstate(invalid='ignore'):
+        spikes = np.abs(values - med) > n_sigmas * MAD_SCALE * mad
+    return np.where(spikes, med, values), spikes
+
+
+def filter_series(timestamps, values, kind='hampel', window=600., n_sigmas=3.,
+                  engine=None):
+    """
+    One series through `rolling_median` or `hampel` (by ``kind``), returning
+    just the filtered values.
+    """
+    if kind == 'median':
+        return rolling_median(timestamps, values, window, engine)
+    elif kind == 'hampel':
+        return hampel(timestamps, values, window, n_sigmas, engine)[0]
+    raise ValueError(f'invalid filter kind {kind!r}, should be one of {KINDS}')
+
+
+def filter_columns(cols, filters=None, engine=None):
+    """
+    Filters the measurement types in ``cols`` (as output by
+    `cozir_parser.read_log_columns`) that are keys of ``filters``, whose values
+    are dicts of `filter_series` arguments (default `DEFAULT_FILTERS`).
+    Returns new columns; the other types are unchanged.
+    """
+    if filters is None:
+        filters = DEFAULT_FILTERS
+    codes = {nm: i for i, nm in enumerate(cols['type_names'])}
+    values = None
+    for mtype, params in filters.items():
+        if mtype not in codes:
+            continue
+        rows = np.flatnonzero(cols['type_code'] == codes[mtype])
+        if values is None:
+            values = cols['value'].copy()
+        values[rows] = filter_series(cols['timestamp'][rows], cols['value'][rows],
+                                     engine=engine, **params)
+    if values is None:
+        return cols
+    return dict(cols, value=values)
+
+
+def parse_filters(spec):
+    """
+    ``filters`` for `filter_columns` from a string like
+    ``"cozirA_raw=hampel:600:3,sgp30_eco2=median:300"`` (type=kind:window
+    seconds[:n_sigmas]), or "default" for `DEFAULT_FILTERS`.
+    """
+    if spec == 'default':
+        return dict(DEFAULT_FILTERS)
+    filters = {}
+    for item in spec.split(','):
+        mtype, _, params = item.partition('=')
+        fields = params.split(':')
+        if not mtype or fields[0] not in KINDS or not 2 <= len(fields) <= 3:
+            raise ValueError(f'invalid filter {item!r}, should be '
+                             'type=median:window or type=hampel:window[:n_sigmas]')
+        filters[mtype] = dict(kind=fields[0], window=float(fields[1]))
+        if len(fields) == 3:
+            filters[mtype]['n_sigmas'] = float(fields[2])
+    return filters
+
+
+def _sorted_stats(s, with_mad):
+    """
+    The median (and median absolute deviation) of the sorted list ``s``,
+    computed like `_window_stats_numpy` does.
+    """
+    c = len(s)
+    m = (s[(c - 1)//2] + s[c//2])/2
+    if not with_mad:
+        return m, None
+    k = (c - 1)//2
+    a, b = 0, c - k - 1
+    while a < b:
+        mid = (a + b)//2
+        if m - s[mid] > s[mid + k + 1] - m:
+            a = mid + 1
+        else:
+            b = mid
+    dk = max(m - s[a], s[a + k] - m)
+    if c % 2 == 0:
+        below = m - s[a - 1] if a > 0 else np.inf
+        above = s[a + k + 1] - m if a + k + 1 < c else np.inf
+        dk = (dk + min(below, above))/2
+    return m, dk
+
+
+class SpikeFilter:
+    """
+    Streaming `filter_series` for a single series.  `update` takes each sample,
+    in time order, and returns the list of ``(timestamp, filtered value)`` of
+    the samples whose windows are now complete; `flush` returns the rest at
+    the end of the data.
+    """
+    def __init__(self, kind='hampel', window=600., n_sigmas=3.):
+        if kind not in KINDS:
+            raise ValueError(f'invalid filter kind {kind!r}, should be one of {KINDS}')
+        self.kind = kind
+        self.window = window
+        self.n_sigmas = n_sigmas
+        # (seconds, timestamp, value) from the start of the window of the
+        # next sample to come out, to the latest
+        self._samples = deque()
+        self._next = 0  # index in _samples of the next sample to come out
+        self._end = 0  # index in _samples of the end of its window
+        self._sorted = []  # the non-NaN values of its window
+
+    def update(self, timestamp, value):
+        if isinstance(timestamp, (int, float, np.floating, np.integer)):
+            tsec = float(timestamp)
+        else:  # as _to_seconds does
+            tsec = np.datetime64(timestamp, 'ms').astype(np.int64) / 1000.
+        self._samples.append((tsec, timestamp, float(value)))
+        out = []
+        while (self._next < len(self._samples) - 1
+               and tsec > self._samples[self._next][0] + self.window/2):
+            out.append(self._emit())
+        return out
+
+    def flush(self):
+        out = []
+        while self._next < len(self._samples):
+            out.append(self._emit())
+        self._samples.clear()
+        self._sorted = []
+        self._next = self._end = 0
+        return out
+
+    def _emit(self):
+        samples = self._samples
+        tsec, t, value = samples[self._next]
+        # the same window as the searchsorted in _window_stats
+        while self._end < len(samples) and samples[self._end][0] <= tsec + self.window/2:
+            v = samples[self._end][2]
+            if v == v:
+                insort(self._sorted, v)
+            self._end += 1
+        while samples[0][0] < tsec - self.window/2:
+            v = samples.popleft()[2]
+            if v == v:
+                del self._sorted[bisect_left(self._sorted, v)]
+            self._next -= 1
+            self._end -= 1
+        self._next += 1
+
+        if value != value:
+            return t, value
+        m, mad = _sorted_stats(self._sorted, self.kind == 'hampel')
+        if self.kind == 'median':
+            return t, m
+        return t, (m if abs(value - m) > self.n_sigmas * MAD_SCALE * mad else value)
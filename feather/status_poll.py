@@ -0,0 +1,137 @@
+"""
+This script is to be run on the *host* to ask one or more feathers for their
+recent summary (see summary_ring.py) over USB serial, without stopping them
+logging or reading their logs.  The feathers must be running main_loop with
+``summary`` set.  All the ports are polled at once.
+
+Requires pyserial
+"""
+import sys
+import time
+import json
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+RTC_EPOCH = datetime(2000, 1, 1)
+# periods starting before this many seconds are from a board without an RTC,
+# so are counted from its boot
+MIN_RTC_SECONDS = 10 * 365 * 86400
+
+
+def parse_status(lines):
+    """
+    Parses the lines from ``STATUS`` to ``END`` into a dict with 'period_sec',
+    'info' (the key=value pairs on the STATUS line) and 'periods', a list of
+    dicts with 'start', 'ncycles', 'in_progress' and min/mean/max of each
+    channel (None where nothing was measured).
+    """
+    head = lines[0].split()
+    period_sec = int(head[1])
+    channels = [ch.split('*') for ch in head[2].split(',')]
+    info = dict(kv.split('=', 1) for kv in head[3:] if '=' in kv)
+
+    periods = []
+    for line in lines[1:]:
+        fields = line.split()
+        if not fields or fields[0] not in ('S', 'P'):
+            continue
+        period, ncycles = int(fields[1]), int(fields[2])
+        start = period * period_sec
+        if start >= MIN_RTC_SECONDS:
+            start = RTC_EPOCH + timedelta(seconds=start)
+        row = {'start': start, 'ncycles': ncycles, 'in_progress': fields[0] == 'P'}
+        vals = [int(v) for v in fields[3:]]
+        for i, (nm, scale) in enumerate(channels):
+            for j, stat in enumerate(('min', 'mean', 'max')):
+                v = vals[3*i + j]
+                row[nm + '_' + stat] = None if v == -32768 else v / int(scale)
+        periods.append(row)
+    return {'period_sec': period_sec, 'info': info, 'periods': periods}
+
+
+def query_status(port, baudrate=115200, timeout=3.):
+    """
+    Sends ``status`` to the feather on ``port`` and returns the parsed reply.
+    """
+    import serial
+
+    with serial.Serial(port, baudrate, timeout=.1) as ser:
+        ser.reset_input_buffer()
+        ser.write(b'status\r\n')
+        lines = None
+        partial = b''
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            partial += ser.read(ser.in_waiting or 1)
+            *complete, partial = partial.split(b'\n')
+            for line in complete:
+                line = line.decode(errors='replace').strip()
+                if line.startswith('STATUS'):
+                    lines = []
+                if lines is not None:
+                    lines.append(line)
+                    if line == 'END':
+                        return parse_status(lines)
+    raise IOError(f'No status reply from {port} within {timeout} s.  Is it '
+                  'running main_loop with summary set?')
+
+
+def poll(ports, baudrate=115200, timeout=3.):
+    """
+    Returns ``{port: status dict or the exception}`` for all ``ports``, queried
+    in parallel.
+    """
+    def one(port):
+        try:
+            return query_status(port, baudrate, timeout)
+        except Exception as e:
+            return e
+    with ThreadPoolExecutor(max(len(ports), 1)) as ex:
+        return dict(zip(ports, ex.map(one, ports)))
+
+
+def _fmt(v, spec='.0f'):
+    return '-' if v is None else format(v, spec)
+
+
+def print_status(port, status, nperiods=None, file=None):
+    if isinstance(status, Exception):
+        print(f'{port}: {status}', file=file)
+        return
+    info = ' '.join(f'{k}={v}' for k, v in status['info'].items())
+    print(f'{port}: {info}', file=file)
+    periods = status['periods'][-nperiods:] if nperiods else status['periods']
+    for row in periods:
+        start = row['start']
+        if isinstance(start, datetime):
+            start = f'{start:%Y-%m-%d %H:%M}'
+        else:
+            start = f'boot+{start/3600:.1f}h'
+        print(f'  {start:>16}{"*" if row["in_progress"] else " "} n={row["ncycles"]:<4}'
+              f' CO2 {_fmt(row["co2_min"])}/{_fmt(row["co2_mean"])}/{_fmt(row["co2_max"])} ppm'
+              f'  T {_fmt(row["temperature_mean"], ".1f")} C'
+              f'  RH {_fmt(row["humidity_mean"], ".1f")} %'
+              f'  batt {_fmt(row["battery_min"], ".2f")} V', file=file)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ask feathers for their summary over USB serial.')
+    parser.add_argument('serialports', nargs='+')
+    parser.add_argument('--baudrate', '-b', default=115200)
+    parser.add_argument('--timeout', '-t', type=float, default=3.)
+    parser.add_argument('--periods', '-n', type=int, default=None,
+                        help='only show the last this many periods')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = poll(args.serialports, args.baudrate, args.timeout)
+    if args.json:
+        out = {port: {'error': str(st)} if isinstance(st, Exception) else st
+               for port, st in results.items()}
+        print(json.dumps(out, indent=1, default=str))
+    else:
+        for port, st in results.items():
+            print_status(port, st, args.periods)
+    sys.exit(any(isinstance(st, Exception) for st in results.values()))
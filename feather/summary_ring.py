@@ -0,0 +1,156 @@
+"""
+A fixed-size ring of per-period (hourly by default) summaries of what the
+feather measured, so its recent state can be asked for over serial (see
+status_poll.py) rather than read out of the whole log.  The ring is one
+preallocated bytearray, and each finished period is also written in place into
+a small file next to the log so it survives a reboot.
+"""
+import struct
+
+# (name, scale): values are stored as int16 of value*scale
+CHANNELS = (('co2', 1), ('temperature', 100), ('humidity', 100), ('battery', 1000))
+# period number, number of cycles, then min, mean, max of each channel
+SLOT_FMT = '<iH' + 'hhh' * len(CHANNELS)
+SLOT_NBYTES = struct.calcsize(SLOT_FMT)
+# magic, nslots, period_sec, index of the next slot to write, slots used
+HEADER_FMT = '<4sHIHH'
+HEADER_NBYTES = struct.calcsize(HEADER_FMT)
+MAGIC = b'SUM1'
+MISSING = -32768
+
+
+class SummaryRing:
+    """
+    ``t`` passed to `add` picks the period (``t // period_sec``).  It should
+    be the same kind of time across reboots (seconds from the RTC) for the
+    saved ring at ``path`` to be reloaded; with ``path=None`` it is only kept
+    in RAM.  The period in progress is only saved once it is finished, so a
+    reboot loses it.
+    """
+    def __init__(self, nslots=24, period_sec=3600, path=None):
+        self.nslots = nslots
+        self.period_sec = period_sec
+        self.path = path
+        self.buf = bytearray(nslots * SLOT_NBYTES)
+        self.head = 0
+        self.used = 0
+
+        nch = len(CHANNELS)
+        self.period = None
+        self.ncycles = 0
+        self._n = [0] * nch
+        self._sum = [0.] * nch
+        self._min = [0.] * nch
+        self._max = [0.] * nch
+
+        if path is not None and not self.load():
+            self._write(0, bytearray(HEADER_NBYTES + len(self.buf)))
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.read(HEADER_NBYTES)
+                if len(header) != HEADER_NBYTES:
+                    return False
+                magic, nslots, period_sec, head, used = struct.unpack(HEADER_FMT, header)
+                if (magic, nslots, period_sec) != (MAGIC, self.nslots, self.period_sec):
+                    return False
+                if f.readinto(self.buf) != len(self.buf):
+                    return False
+        except OSError:
+            return False
+        self.head = head
+        self.used = used
+        return True
+
+    def _write(self, offset, data):
+        try:
+            f = open(self.path, 'r+b')
+        except OSError:
+            f = open(self.path, 'wb')
+        with f:
+            if offset:
+                f.seek(offset)
+            f.write(data)
+            f.seek(0)
+            f.write(struct.pack(HEADER_FMT, MAGIC, self.nslots, self.period_sec,
+                                self.head, self.used))
+
+    def add(self, t, values):
+        """
+        ``values`` has one value (or None) per channel in `CHANNELS`.
+        """
+        period = int(t // self.period_sec)
+        if period != self.period:
+            self.close()
+            self.period = period
+        self.ncycles += 1
+        for i, v in enumerate(values):
+            if v is None:
+                continue
+            if self._n[i] == 0:
+                self._min[i] = self._max[i] = v
+            elif v < self._min[i]:
+                self._min[i] = v
+            elif v > self._max[i]:
+                self._max[i] = v
+            self._n[i] += 1
+            self._sum[i] += v
+
+    def _current_values(self):
+        vals = []
+        for i, (nm, scale) in enumerate(CHANNELS):
+            n = self._n[i]
+            if n:
+                vals.extend((int(round(self._min[i] * scale)),
+                             int(round(self._sum[i] / n * scale)),
+                             int(round(self._max[i] * scale))))
+            else:
+                vals.extend((MISSING, MISSING, MISSING))
+        return vals
+
+    def close(self):
+        """
+        Moves the period being accumulated into the ring (and the file).
+        """
+        if self.period is None or not self.ncycles:
+            return
+        offset = self.head * SLOT_NBYTES
+        struct.pack_into(SLOT_FMT, self.buf, offset, self.period,
+                         min(self.ncycles, 65535), *self._current_values())
+        self.head = (self.head + 1) % self.nslots
+        self.used = min(self.used + 1, self.nslots)
+        if self.path is not None:
+            try:
+                self._write(HEADER_NBYTES + offset,
+                            memoryview(self.buf)[offset:offset + SLOT_NBYTES])
+            except OSError as e:
+                print('Could not save summary:', e)
+
+        self.period = None
+        self.ncycles = 0
+        for i in range(len(CHANNELS)):
+            self._n[i] = 0
+            self._sum[i] = 0.
+
+    def rows(self):
+        """
+        The finished periods, oldest first, as ``(period, ncycles, v0, v1,
+        ...)`` tuples of the stored (scaled) ints.
+        """
+        for j in range(self.used):
+            i = (self.head - self.used + j) % self.nslots
+            yield struct.unpack_from(SLOT_FMT, self.buf, i * SLOT_NBYTES)
+
+    def print_status(self, extra=''):
+        """
+        Prints the ring in the form status_poll.py reads: a ``STATUS`` line,
+        an ``S`` line per finished period, a ``P`` line for the one in
+        progress, then ``END``.
+        """
+        print('STATUS', self.period_sec, ','.join(nm + '*' + str(scale) for nm, scale in CHANNELS), extra)
+        for row in self.rows():
+            print('S', *row)
+        if self.ncycles:
+            print('P', self.period, self.ncycles, *self._current_values())
+        print('END')
@@ -0,0 +1,45 @@
+"""
+Tests for the time bounds of `cozir_parser.parse_cozir_file` and
+`cozir_parser.read_log_segments`.  Run with ``python -m pytest feather`` from
+the repository root (from this directory, feather's code.py hides the standard
+library module pytest needs).
+"""
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import cozir_parser
+
+
+@pytest.fixture
+def rotated_log(tmp_path):
+    """
+    A log of one sample a minute for three hours, rotated into one segment per
+    hour, with the active log holding the last hour.
+    """
+    for hour, fn in enumerate(['co2.0.log', 'co2.1.log', 'co2.log']):
+        with open(tmp_path / fn, 'w') as f:
+            for minute in range(60):
+                f.write(f'2024-01-01T{hour}:{minute}:0.00 cozirA_filtered {400 + hour*60 + minute}\n')
+    return str(tmp_path / 'co2.log')
+
+
+def test_segments_with_time_bounds(rotated_log):
+    from astropy.time import Time
+
+    expected = np.arange(450, 520)
+    for start, end in [(Time('2024-01-01T00:50:00'), Time('2024-01-01T01:59:00')),
+                       (datetime(2024, 1, 1, 0, 50), datetime(2024, 1, 1, 1, 59)),
+                       ('2024-01-01T00:50', '2024-01-01T01:59'),
+                       (np.datetime64('2024-01-01T00:50'), np.datetime64('2024-01-01T01:59'))]:
+        cols = cozir_parser.read_log_segments(rotated_log, start, end, processes=1)
+        np.testing.assert_array_equal(cols['value'], expected)
+
+
+def test_parse_cozir_file_with_time_bounds(rotated_log):
+    from astropy.time import Time
+
+    t = cozir_parser.parse_cozir_file(rotated_log, Time('2024-01-01T00:50:00'),
+                                      Time('2024-01-01T01:59:00'))
+    np.testing.assert_array_equal(t['value'], np.arange(450, 520))
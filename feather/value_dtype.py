@@ -0,0 +1,78 @@
+"""
+The float dtype the analysis code stores measurement values in, and computes
+the conversions (dewpoint, absolute humidity, joins) in.  float64 by default;
+float32 halves the memory and bandwidth, and the sensors give at most 4-5
+significant digits anyway.  The BME280 calibration is still computed in
+float64, since its pressure formula loses about 8x float32 rounding to
+cancellation, and only its results are stored in the chosen dtype.  Sums that
+accumulate over many samples (means, event detection, exposure integrals) also
+stay in float64.
+
+Select it with `set_value_dtype`, the `using_value_dtype` context manager, or
+the ``COZIR_VALUE_DTYPE`` environment variable.  ``benchmarks.py dtype``
+checks float32 results against float64 within `TOLERANCES`.
+"""
+import os
+import contextlib
+
+import numpy as np
+
+__all__ = ['get_value_dtype', 'set_value_dtype', 'using_value_dtype',
+           'as_values', 'TOLERANCES']
+
+ALLOWED_DTYPES = (np.dtype(np.float32), np.dtype(np.float64))
+
+# largest absolute difference of float32 from float64 results, by quantity
+TOLERANCES = {'co2': 0.,  # ppm, integers
+              'temperature': 1e-4,  # C
+              'pressure': 1e-2,  # Pa
+              'humidity': 1e-4,  # %RH
+              'dewpoint': 1e-3,  # C
+              'absolute_humidity': 1e-4}  # g/m^3
+
+_value_dtype = None
+
+
+def _check(dtype):
+    dtype = np.dtype(dtype)
+    if dtype not in ALLOWED_DTYPES:
+        raise ValueError(f'value dtype must be float32 or float64, not {dtype}')
+    return dtype
+
+
+def get_value_dtype():
+    global _value_dtype
+    if _value_dtype is None:
+        _value_dtype = _check(os.environ.get('COZIR_VALUE_DTYPE', 'float64'))
+    return _value_dtype
+
+
+def set_value_dtype(dtype):
+    """
+    Sets the dtype for values from now on, and returns the previous one.
+    """
+    global _value_dtype
+    old = get_value_dtype()
+    _value_dtype = _check(dtype)
+    return old
+
+
+@contextlib.contextmanager
+def using_value_dtype(dtype):
+    old = set_value_dtype(dtype)
+    try:
+        yield
+    finally:
+        set_value_dtype(old)
+
+
+def as_values(values):
+    """
+    ``values`` as a float array.  float32/float64 arrays are kept as they are
+    (so float32 data stays float32 through a computation), anything else is
+    converted to the current value dtype.
+    """
+    values = np.asarray(values)
+    if values.dtype in ALLOWED_DTYPES:
+        return values
+    return values.astype(get_value_dtype())
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+"""
+A pseudo-terminal Cozir-A emulator, for exercising the monitor scripts without
+a sensor.  Implements the K (mode), A (digital filter) and Q (query) commands
+and streaming mode (K 1), with optional simulated baud rate, response latency
+and error injection.
+
+Also includes a small harness that drives ``cozir_mon_pi`` against the
+emulator and reports the achieved sample rate and query latency.  Linux-only
+(uses ``os.openpty``).
+"""
+
+import os
+import re
+import time
+import tty
+import random
+import select
+import threading
+
+__all__ = ['CozirEmulator', 'run_load_test']
+
+Q_LINE_RE = re.compile(rb' H (\d{5}) T (\d{5}) Z (\d{5}) z (\d{5})\r\n')
+STREAMING_PERIOD_SECS = .5  # the Cozir streams at 2 Hz
+
+
+class CozirEmulator:
+    """
+    ``baudrate`` sets how long responses take on the "wire" (10 bits per byte),
+    ``latency`` is added before each response, and ``error_rate`` is the
+    probability that a response is dropped or has a corrupted character.
+    """
+    def __init__(self, baudrate=9600, latency=0., error_rate=0., seed=None):
+        self.baudrate = baudrate
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+        self.mode = 0
+        self.digital_filter = 32
+        self.co2 = 600.
+        self.humidity = 54.0
+        self.temperature = 24.0
+
+        self.ncommands = 0
+        self.nerrors = 0
+
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def _measurement_line(self):
+        # a random walk, filtered like the sensor's digital filter would
+        raw = max(self.co2 + self.rng.gauss(0, 15), 0)
+        self.co2 = max(self.co2 + self.rng.gauss(0, 5), 350)
+        self.humidity = min(max(self.humidity + self.rng.gauss(0, .1), 0), 100)
+        self.temperature += self.rng.gauss(0, .05)
+        return ' H {:05d} T {:05d} Z {:05d} z {:05d}\r\n'.format(
+            int(self.humidity*10), int(self.temperature*10 + 1000),
+            int(self.co2), int(raw)).encode()
+
+    def _respond(self, cmd):
+        if cmd.startswith(b'K'):
+            self.mode = int(cmd[1:] or 0)
+            return ' K {:05d}\r\n'.format(self.mode).encode()
+        elif cmd.startswith(b'A'):
+            self.digital_filter = int(cmd[1:] or 0)
+            return ' A {:05d}\r\n'.format(self.digital_filter).encode()
+        elif cmd == b'Q':
+            return self._measurement_line()
+        else:
+            return b' ?\r\n'
+
+    def _send(self, resp):
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.nerrors += 1
+            if self.rng.random() < .5:
+                return  # dropped response
+            i = self.rng.randrange(len(resp) - 2)
+            resp = resp[:i] + b'?' + resp[i+1:]
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self.baudrate:
+            time.sleep(len(resp) * 10 / self.baudrate)
+        os.write(self.master_fd, resp)
+
+    def _serve(self):
+        buf = b''
+        next_stream = time.monotonic()
+        while not self._stop.is_set():
+            timeout = .05
+            if self.mode == 1:
+                timeout = min(timeout, max(next_stream - time.monotonic(), 0))
+            readable, _, _ = select.select([self.master_fd], [], [], timeout)
+            if readable:
+                try:
+                    buf += os.read(self.master_fd, 1024)
+                except OSError:  # the other side closed
+                    continue
+                while b'\n' in buf:
+                    line, buf = buf.split(b'\n', 1)
+                    cmd = line.strip()
+                    if cmd:
+                        self.ncommands += 1
+                        self._send(self._respond(cmd))
+
+            if self.mode == 1 and time.monotonic() >= next_stream:
+                self._send(self._measurement_line())
+                next_stream += STREAMING_PERIOD_SECS
+
+
+def run_load_test(emulator, n_queries=20, n_samples=1):
+    """
+    Uses ``cozir_mon_pi`` to run ``n_queries`` measurements of ``n_samples`` Q
+    commands each against a running ``emulator``.  Returns a dictionary with the
+    per-query latencies, achieved samples/sec and the number of good/bad lines.
+    """
+    import cozir_mon_pi
+
+    ser = cozir_mon_pi.setup_connection(emulator.port)
+    try:
+        latencies = []
+        ngood = nbad = 0
+        st = time.perf_counter()
+        for _ in range(n_queries):
+            qst = time.perf_counter()
+            meas = cozir_mon_pi.get_single_measurement(ser, n_samples)
+            latencies.append(time.perf_counter() - qst)
+            good = len(Q_LINE_RE.findall(meas))
+            ngood += good
+            nbad += n_samples - good
+        elapsed = time.perf_counter() - st
+    finally:
+        ser.close()
+
+    latencies.sort()
+    return {'latencies': latencies,
+            'median_latency': latencies[len(latencies)//2],
+            'max_latency': latencies[-1],
+            'samples_per_sec': ngood / elapsed,
+            'good_lines': ngood, 'bad_lines': nbad}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--baudrate', '-b', type=int, default=9600)
+    parser.add_argument('--latency', '-l', type=float, default=0., help='seconds of delay before each response')
+    parser.add_argument('--error-rate', '-e', type=float, default=0., help='fraction of responses to drop or corrupt')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--bench', type=int, default=None, metavar='NQUERIES', help='run the load test harness with this many queries instead of serving forever')
+    parser.add_argument('--number-samples', '-n', type=int, default=1, help='Q commands per query in the load test')
+
+    args = parser.parse_args()
+
+    with CozirEmulator(args.baudrate, args.latency, args.error_rate, args.seed) as emu:
+        if args.bench is None:
+            print('Emulating a Cozir on', emu.port, '(Ctrl-C to stop)')
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        else:
+            res = run_load_test(emu, args.bench, args.number_samples)
+            print('samples/sec: {:.2f}'.format(res['samples_per_sec']))
+            print('query latency median: {:.3f}s max: {:.3f}s'.format(res['median_latency'], res['max_latency']))
+            print('good lines:', res['good_lines'], 'bad lines:', res['bad_lines'])
+            print('emulator saw', emu.ncommands, 'commands and injected', emu.nerrors, 'errors')
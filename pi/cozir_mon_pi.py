@@ -4,10 +4,17 @@
 A simple monitor script for Cozir-A on raspberry pi.
 """
 
+import os
+import re
+import gzip
+import shutil
+import threading
 from time import sleep
 import serial
 from datetime import datetime
 
+Q_LINE_RE = re.compile(r' H (\d+) T (\d+) Z (\d+) z (\d+)')
+
 def setup_connection(port):
     ser = serial.Serial(port, timeout=1)
     ser.write(b'K 2\r\n')
@@ -26,24 +33,142 @@ def get_single_measurement(ser, n_samples=1):
     return b''.join(lines)
 
 
-def do_measurement_loop(ser, fn, delay, n_samples, verbose=False, append=False):
-    with open(fn, 'a' if append else 'w') as f:
+def measurement_rows(meas, startdt, enddt, device):
+    """
+    Decodes the Q responses in ``meas`` into (device, measurement_type,
+    timestamp, value) rows, spreading the timestamps evenly between ``startdt``
+    and ``enddt`` like `cozir_parser_pi.parse_cozir_file` does.
+    """
+    matches = Q_LINE_RE.findall(meas.decode(errors='replace'))
+    rows = []
+    if not matches:
+        return rows
+    dt = (enddt - startdt)/len(matches)
+    currdt = startdt + dt/2
+    for h, t, Z, z in matches:
+        rows.append((device, 'cozirA_humidity', currdt, int(h)/10))
+        rows.append((device, 'cozirA_temperature', currdt, (int(t)-1000)/10))
+        rows.append((device, 'cozirA_filtered', currdt, float(Z)))
+        rows.append((device, 'cozirA_raw', currdt, float(z)))
+        currdt = currdt + dt
+    return rows
+
+
+def compress_segment(fn, method='gzip'):
+    """
+    Compresses ``fn`` to ``fn.gz`` (or ``fn.zst``, which needs the zstandard
+    package) and removes it.  The compressed file only appears under its final
+    name once complete.
+    """
+    ext = {'gzip': '.gz', 'zstd': '.zst'}[method]
+    tmpfn = fn + ext + '.tmp'
+    with open(fn, 'rb') as fr:
+        if method == 'gzip':
+            with gzip.open(tmpfn, 'wb') as fw:
+                shutil.copyfileobj(fr, fw)
+        else:
+            import zstandard
+            with open(tmpfn, 'wb') as fw:
+                zstandard.ZstdCompressor().copy_stream(fr, fw)
+    os.replace(tmpfn, fn + ext)
+    os.remove(fn)
+
+
+class RotatingLog:
+    """
+    A text log that, when `flush` is called after a complete measurement, moves
+    itself to a ``<stem>.<start time><ext>`` segment once it exceeds
+    ``max_bytes`` or the day changes (if ``daily``), then starts a new file.
+    Closed segments are compressed in the background if ``compress`` is 'gzip'
+    or 'zstd'.
+    """
+    def __init__(self, fn, max_bytes=None, daily=False, compress=None,
+                 append=False):
+        self.fn = fn
+        self.max_bytes = max_bytes
+        self.daily = daily
+        self.compress = compress
+        if append and os.path.exists(fn):
+            self.opened = datetime.fromtimestamp(os.path.getmtime(fn))
+        else:
+            self.opened = datetime.now()
+        self.f = open(fn, 'a' if append else 'w')
+
+    def write(self, s):
+        return self.f.write(s)
+
+    def flush(self):
+        self.f.flush()
+        now = datetime.now()
+        if ((self.max_bytes is not None and self.f.tell() >= self.max_bytes) or
+            (self.daily and now.date() != self.opened.date())):
+            self.rotate(now)
+
+    def rotate(self, now=None):
+        self.f.close()
+        stem, ext = os.path.splitext(self.fn)
+        segfn = '{}.{:%Y%m%dT%H%M%S}{}'.format(stem, self.opened, ext)
+        i = 1
+        while os.path.exists(segfn) or os.path.exists(segfn + '.gz') or os.path.exists(segfn + '.zst'):
+            segfn = '{}.{:%Y%m%dT%H%M%S}-{}{}'.format(stem, self.opened, i, ext)
+            i += 1
+        os.replace(self.fn, segfn)
+        if self.compress is not None:
+            threading.Thread(target=compress_segment, args=(segfn, self.compress)).start()
+
+        self.opened = datetime.now() if now is None else now
+        self.f = open(self.fn, 'w')
+
+    def close(self):
+        self.f.close()
+
+
+def do_measurement_loop(ser, fn, delay, n_samples, verbose=False, append=False,
+                        store=None, device='pi', rotate_bytes=None,
+                        rotate_daily=False, compress=None, detector=None):
+    """
+    Writes to the text log ``fn`` and/or ``store`` (a
+    `sqlite_store.SQLiteWriter`), either of which can be None.  See
+    `RotatingLog` for the rotation options.  If ``detector`` is given (a
+    ``co2_events.EventDetector``), the filtered CO2 is fed to it and the events
+    it finds are printed.
+    """
+    f = None
+    if fn is not None:
+        f = RotatingLog(fn, rotate_bytes, rotate_daily, compress, append)
+    try:
         while True:
             if verbose:
                 print('Measuring...')
-            f.write('dt:' + str(datetime.now()) + '\n')
+            startdt = datetime.now()
             meas = get_single_measurement(ser, n_samples)
-            f.write(meas.decode())
-            f.write('dt:' + str(datetime.now()) + '\n')
-
-            f.flush()
+            enddt = datetime.now()
+            if f is not None:
+                f.write('dt:' + str(startdt) + '\n')
+                f.write(meas.decode())
+                f.write('dt:' + str(enddt) + '\n')
+
+                f.flush()
+            if store is not None or detector is not None:
+                rows = measurement_rows(meas, startdt, enddt, device)
+            if store is not None:
+                store.write_many(rows)
+            if detector is not None:
+                for _, mtype, t, value in rows:
+                    if mtype == 'cozirA_filtered':
+                        for event in detector.update(t, value):
+                            print('Event:', event, flush=True)
 
             if verbose:
                 print('Done Measuring')
 
             sleep(delay)
+    finally:
+        if f is not None:
+            f.close()
 
 if __name__ == '__main__':
+    import sys
     import argparse
 
     parser = argparse.ArgumentParser()
@@ -53,6 +178,12 @@ if __name__ == '__main__':
     parser.add_argument('--number-samples', '-n', default=5)
     parser.add_argument('--verbose', '-v', action='store_true')
     parser.add_argument('--append-file', '-a', action='store_true')
+    parser.add_argument('--sqlite-db', '-s', default=None, help='Also store samples in this SQLite database')
+    parser.add_argument('--device', default='pi', help='Device name to use in the SQLite database')
+    parser.add_argument('--rotate-mb', type=float, default=None, help='Start a new log segment when the output file reaches this many MB')
+    parser.add_argument('--rotate-daily', action='store_true', help='Start a new log segment each day')
+    parser.add_argument('--compress', choices=['gzip', 'zstd'], default=None, help='Compress closed log segments')
+    parser.add_argument('--events', '-e', action='store_true', help='Print CO2 rise/decay events as they are detected')
 
     args = parser.parse_args()
 
@@ -62,9 +193,25 @@ if __name__ == '__main__':
         if args.verbose:
             print("First measurement")
         print(get_single_measurement(ser))
-        if args.output_file is not None:
+        detector = None
+        if args.events:
+            sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'feather'))
+            import co2_events
+            detector = co2_events.EventDetector()
+        store = None
+        if args.sqlite_db is not None:
+            import sqlite_store
+            store = sqlite_store.SQLiteWriter(args.sqlite_db)
+        if args.output_file is not None or store is not None or detector is not None:
             if args.verbose:
                 print("Looping")
-            do_measurement_loop(ser, args.output_file, args.delay, args.number_samples, append=args.append_file, verbose=args.verbose)
+            try:
+                do_measurement_loop(ser, args.output_file, float(args.delay), int(args.number_samples), append=args.append_file, verbose=args.verbose, store=store, device=args.device,
+                                    rotate_bytes=None if args.rotate_mb is None else int(args.rotate_mb*2**20),
+                                    rotate_daily=args.rotate_daily, compress=args.compress,
+                                    detector=detector)
+            finally:
+                if store is not None:
+                    store.close()
     finally:
         ser.close()
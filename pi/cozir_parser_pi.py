@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 
+import os
 import re
+import io
+import glob
+import gzip
+import itertools
 from datetime import datetime
 
 import numpy as np
 
-__all__ = ['parse_cozir_file', 'plot_cozir_data']
+__all__ = ['parse_cozir_file', 'parse_cozir_db', 'plot_cozir_data', 'to_columns',
+           'ParseResult']
 
 
 def _parse_lines(datalines, startdt, enddt):
@@ -44,13 +50,66 @@ def _parse_lines(datalines, startdt, enddt):
     return dts, hs, ts, Zs, zs, sgpdts, eco2s, tvocs, batvs
 
 
-def parse_cozir_file(forfn):
+def parse_cozir_file(forfn, start_time=None, end_time=None):
+    """
+    If ``forfn`` is a file name, any rotated segments of it written by
+    ``cozir_mon_pi.py`` (``<stem>.<start time><ext>``, possibly compressed) are
+    read too, skipping segments that end before ``start_time`` or start after
+    ``end_time``.  (The time range is only used to pick segments.)
+    """
     if hasattr(forfn, 'read'):
         # file-like
         return _do_parsing(forfn)
     else:
-        with open(forfn, 'r') as f:
-            return _do_parsing(f)
+        files = [_open_log(fn) for fn in find_log_segments(forfn, start_time, end_time)]
+        try:
+            return _do_parsing(itertools.chain(*files))
+        finally:
+            for f in files:
+                f.close()
+
+
+def _open_log(fn):
+    if fn.endswith('.gz'):
+        return gzip.open(fn, 'rt')
+    elif fn.endswith('.zst'):
+        import zstandard
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(fn, 'rb'), closefd=True))
+    else:
+        return open(fn, 'r')
+
+
+def _first_time(fn):
+    with _open_log(fn) as f:
+        for line in f:
+            if line.startswith('d'):
+                return parse_time_line(line)
+    return None
+
+
+def find_log_segments(fn, start_time=None, end_time=None):
+    """
+    Returns ``fn`` and its rotated segments in time order, dropping any that
+    cannot overlap ``start_time`` to ``end_time``.
+    """
+    stem, ext = os.path.splitext(fn)
+    fns = [segfn for segfn in glob.glob(glob.escape(stem) + '.*' + ext + '*')
+           if re.sub(r'\.(gz|zst)$', '', segfn).endswith(ext)]
+    if os.path.exists(fn):
+        fns.append(fn)
+
+    timed = sorted((t, segfn) for t, segfn in ((_first_time(segfn), segfn) for segfn in set(fns))
+                   if t is not None)
+    selected = []
+    for i, (t, segfn) in enumerate(timed):
+        if end_time is not None and t > end_time:
+            continue
+        if start_time is not None and i + 1 < len(timed) and timed[i+1][0] < start_time:
+            continue
+        selected.append(segfn)
+    if not selected:
+        raise IOError(f'no log segments found for {fn}')
+    return selected
 
 
 def parse_time_line(line):
@@ -104,14 +163,108 @@ def _do_parsing(f):
     zs = np.concatenate(zs)
     eco2s = np.concatenate(eco2s)
     tvocs = np.concatenate(tvocs)
-    dps = hum_rel_to_dewpoint(hs/100, ts)
 
-    return {'datetime': dts,
-            'temperature_c': ts, 'temperature_f': ts * 9/5 + 32,
-            'dewpoint_c': dps, 'dewpoint_f': dps * 9/5 + 32,
-            'humidity_rel': hs, 'humidity_abs': hum_rel_to_abs(hs, ts),
-            'co2_ppm_filtered': Zs, 'co2_ppm_raw': zs, 'battery_voltage':batvs,
-            'datetime_single': sgpdts, 'eCO2': eco2s, 'TVOC': tvocs}
+    return _make_result(dts, hs, ts, Zs, zs, batvs, sgpdts, eco2s, tvocs)
+
+
+def parse_cozir_db(dbfn, start_time=None, end_time=None, device=None):
+    """
+    Like `parse_cozir_file` but reads from a database written by
+    ``cozir_mon_pi.py --sqlite-db``, using its index to load only the samples
+    between ``start_time`` and ``end_time``.
+    """
+    import sqlite_store
+
+    empty = (np.zeros(0, dtype='datetime64[us]'), np.zeros(0))
+    series = sqlite_store.query_samples(dbfn, start_time, end_time,
+                                        list(COLUMN_MEASUREMENT_TYPES.values()),
+                                        device)
+    dts, hs = series.get('cozirA_humidity', empty)
+    ts = series.get('cozirA_temperature', empty)[1]
+    Zs = series.get('cozirA_filtered', empty)[1]
+    zs = series.get('cozirA_raw', empty)[1]
+    sgpdts, eco2s = series.get('sgp30_eco2', empty)
+    tvocs = series.get('sgp30_tvoc', empty)[1]
+
+    return _make_result(dts, hs, ts, Zs, zs, [], sgpdts, eco2s, tvocs)
+
+
+def _make_result(dts, hs, ts, Zs, zs, batvs, sgpdts, eco2s, tvocs):
+    return ParseResult({'datetime': dts, 'temperature_c': ts, 'humidity_rel': hs,
+                        'co2_ppm_filtered': Zs, 'co2_ppm_raw': zs,
+                        'battery_voltage': batvs, 'datetime_single': sgpdts,
+                        'eCO2': eco2s, 'TVOC': tvocs})
+
+
+class ParseResult(dict):
+    """
+    The dictionary returned by `parse_cozir_file` and `parse_cozir_db`.  The
+    columns derived from the measured ones (see `DERIVED_COLUMNS`) are only
+    computed when first looked up, and then kept, so a caller that only wants
+    the CO2 does not pay for the humidity conversions.  Until then they are
+    not among its keys, but ``in`` and `get` know about them.
+    """
+    def __missing__(self, key):
+        derive = DERIVED_COLUMNS.get(key)
+        if derive is None:
+            raise KeyError(key)
+        value = self[key] = derive(self)
+        return value
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in DERIVED_COLUMNS
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def copy(self):
+        # keeps the columns computed so far, and computes the rest lazily
+        return ParseResult(self)
+
+
+# the derived columns of a ParseResult and how to compute them
+DERIVED_COLUMNS = {
+    'temperature_f': lambda d: d['temperature_c'] * 9/5 + 32,
+    'dewpoint_c': lambda d: hum_rel_to_dewpoint(d['humidity_rel']/100, d['temperature_c']),
+    'dewpoint_f': lambda d: d['dewpoint_c'] * 9/5 + 32,
+    'humidity_abs': lambda d: hum_rel_to_abs(d['humidity_rel'], d['temperature_c']),
+}
+
+
+# names these quantities have in the feather logs
+COLUMN_MEASUREMENT_TYPES = {'humidity_rel': 'cozirA_humidity',
+                            'temperature_c': 'cozirA_temperature',
+                            'co2_ppm_filtered': 'cozirA_filtered',
+                            'co2_ppm_raw': 'cozirA_raw',
+                            'eCO2': 'sgp30_eco2',
+                            'TVOC': 'sgp30_tvoc'}
+
+
+def to_columns(datadct):
+    """
+    Converts the output of `parse_cozir_file` to the long "one row per
+    measurement" form used by the feather tools: a dictionary of 'timestamp',
+    'type_code' and 'value' arrays plus the 'type_names' the codes index into.
+    """
+    timestamps = []
+    codes = []
+    values = []
+    type_names = []
+    for key, mtype in COLUMN_MEASUREMENT_TYPES.items():
+        vals = np.asarray(datadct[key], dtype=float)
+        if len(vals) == 0:
+            continue
+        ts = datadct['datetime_single' if key in ('eCO2', 'TVOC') else 'datetime']
+        timestamps.append(ts)
+        codes.append(np.full(len(vals), len(type_names), dtype=np.uint8))
+        values.append(vals)
+        type_names.append(mtype)
+
+    timestamps = np.concatenate(timestamps)
+    if timestamps.dtype.kind == 'M':
+        timestamps = timestamps.astype('datetime64[ms]')
+    return {'timestamp': timestamps, 'type_code': np.concatenate(codes),
+            'value': np.concatenate(values), 'type_names': type_names}
 
 
 def hum_rel_to_dewpoint(rh, ts):
@@ -253,13 +406,29 @@ if __name__ == '__main__':
     parser.add_argument('--absolute-humidity', '-a', help='absolute humidity instead of relative', action='store_true')
     parser.add_argument('--minutes', '-m', help='delta-t in minutes instead of seconds', action='store_true')
     parser.add_argument('--battery', '-b', help='plot battery voltage instead of env conditions', action='store_true')
+    parser.add_argument('--start-time', default=None, help='earliest time to load from a SQLite database input (or log segment to read)')
+    parser.add_argument('--end-time', default=None, help='latest time to load from a SQLite database input (or log segment to read)')
+    parser.add_argument('--last-hours', type=float, default=None, help='load only this many hours before now from a SQLite database input (or skip older log segments)')
+    parser.add_argument('--device', default=None, help='device to load from a SQLite database input')
 
     args = parser.parse_args()
 
-    if args.input_file == '-':
+    from datetime import timedelta
+    start_time = args.start_time
+    if start_time is not None:
+        start_time = datetime.fromisoformat(start_time)
+    elif args.last_hours is not None:
+        start_time = datetime.now() - timedelta(hours=args.last_hours)
+    end_time = args.end_time
+    if end_time is not None:
+        end_time = datetime.fromisoformat(end_time)
+
+    if args.input_file.endswith(('.db', '.sqlite')):
+        datadct = parse_cozir_db(args.input_file, start_time, end_time, args.device)
+    elif args.input_file == '-':
         datadct = parse_cozir_file(sys.stdin)
     else:
-        datadct = parse_cozir_file(args.input_file)
+        datadct = parse_cozir_file(args.input_file, start_time, end_time)
 
     plot_cozir_data(datadct, outfile=args.output_name, degf=args.deg_f,
                     dewpoint=args.dewpoint, abshum=args.absolute_humidity,
@@ -0,0 +1,189 @@
+"""
+A SQLite time-series store for the pi monitor.  Samples are written by a
+background thread in batched transactions to a WAL-mode database indexed on
+(device, measurement_type, timestamp) and on (measurement_type, timestamp),
+so recent-window queries, of one device or all of them, are index lookups
+rather than re-parsing a whole log.
+"""
+
+import os
+import queue
+import pathlib
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+__all__ = ['SQLiteWriter', 'connect', 'query_samples']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    device TEXT NOT NULL,
+    measurement_type TEXT NOT NULL,
+    timestamp REAL NOT NULL,  -- unix seconds
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_device_type_time
+    ON samples (device, measurement_type, timestamp);
+-- for queries of all devices
+CREATE INDEX IF NOT EXISTS samples_type_time
+    ON samples (measurement_type, timestamp);
+"""
+
+
+def connect(dbfn):
+    """
+    Opens (creating if needed) the database in WAL mode, so readers (e.g. the
+    plotting code) do not block the writer.
+    """
+    conn = sqlite3.connect(dbfn)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _connect_readonly(dbfn):
+    """
+    Opens an existing database for queries only, so a wrong file name is an
+    error rather than a new empty database.
+    """
+    if not os.path.isfile(dbfn):
+        raise IOError(f'no SQLite database at {dbfn}')
+    uri = pathlib.Path(dbfn).resolve().as_uri() + '?mode=ro'
+    return sqlite3.connect(uri, uri=True)
+
+
+def _utc_to_local(unixts):
+    """
+    Unix seconds -> local naive datetime64[us], like datetime.now() gives, with
+    the UTC offset in force at each time (so across DST changes too).
+    """
+    unixts = np.asarray(unixts, dtype=float)
+    # offsets only change on the quarter hour, so look each one up once
+    quarters, inverse = np.unique(np.floor(unixts / 900), return_inverse=True)
+    offsets = np.array([datetime.fromtimestamp(q * 900).astimezone().utcoffset().total_seconds()
+                        for q in quarters])
+    return ((unixts + offsets[inverse]) * 1e6).astype('datetime64[us]')
+
+
+def _to_unix(ts):
+    if isinstance(ts, datetime):
+        return ts.timestamp()
+    return float(ts)
+
+
+class SQLiteWriter:
+    """
+    Collects samples from any thread with `write` and inserts them from a
+    background thread, batching up to ``batch_size`` rows or ``flush_interval``
+    seconds per transaction.  Use as a context manager or call `close`.
+    """
+    def __init__(self, dbfn, batch_size=500, flush_interval=5.):
+        self.dbfn = dbfn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._error = None
+        # create the schema up front so errors show up in the caller's thread
+        connect(dbfn).close()
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, device, measurement_type, timestamp, value):
+        """
+        ``timestamp`` is a datetime or unix seconds
+        """
+        self.write_many([(device, measurement_type, timestamp, value)])
+
+    def write_many(self, rows):
+        if self._error is not None:
+            raise IOError('SQLite writer thread failed') from self._error
+        self._queue.put([(d, m, _to_unix(t), float(v)) for d, m, t, v in rows])
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise IOError('SQLite writer thread failed') from self._error
+
+    def _run(self):
+        conn = connect(self.dbfn)
+        try:
+            done = False
+            while not done:
+                rows = self._queue.get()
+                if rows is None:
+                    break
+                deadline = time.monotonic() + self.flush_interval
+                while len(rows) < self.batch_size:
+                    try:
+                        more = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if more is None:
+                        done = True
+                        break
+                    rows.extend(more)
+                with conn:
+                    conn.executemany('INSERT INTO samples VALUES (?, ?, ?, ?)', rows)
+        except Exception as e:
+            self._error = e
+        finally:
+            conn.close()
+
+
+def query_samples(dbfn, start_time=None, end_time=None, types=None,
+                  device=None):
+    """
+    Returns a dictionary mapping measurement type to ``(timestamps, values)``
+    arrays, with timestamps as (local-time) datetime64[us].  ``start_time`` and
+    ``end_time`` can be datetimes or unix seconds.  The database must already
+    exist, and is opened read-only.
+    """
+    where = []
+    params = []
+    if device is not None:
+        where.append('device = ?')
+        params.append(device)
+    if types is not None:
+        where.append('measurement_type IN ({})'.format(','.join('?'*len(types))))
+        params.extend(types)
+    if start_time is not None:
+        where.append('timestamp >= ?')
+        params.append(_to_unix(start_time))
+    if end_time is not None:
+        where.append('timestamp <= ?')
+        params.append(_to_unix(end_time))
+
+    sql = 'SELECT measurement_type, timestamp, value FROM samples'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY measurement_type, timestamp'
+
+    conn = _connect_readonly(dbfn)
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+    result = {}
+    if not rows:
+        return result
+    mtypes, unixts, values = zip(*rows)
+    mtypes = np.array(mtypes)
+    timestamps = _utc_to_local(unixts)
+    values = np.array(values)
+    starts = np.flatnonzero(np.r_[True, mtypes[1:] != mtypes[:-1]])
+    ends = np.r_[starts[1:], len(mtypes)]
+    for st, end in zip(starts, ends):
+        result[str(mtypes[st])] = (timestamps[st:end], values[st:end])
+    return result